@@ -1,4 +1,5 @@
 import copy
+import os
 import re
 import time
 from concurrent.futures import ThreadPoolExecutor
@@ -9,6 +10,7 @@ import pandas as pd
 import sqlalchemy
 from sqlalchemy.pool import NullPool
 
+from snowshu.configs import DEFAULT_INSERT_CHUNK_SIZE
 from snowshu.core.models import Relation
 from snowshu.core.models.credentials import (DATABASE, HOST, PASSWORD, USER,
                                              Credentials)
@@ -119,6 +121,34 @@ class BaseSQLAdapter:
                 conn.dispose()
         return frame
 
+    def _spill_query(self, query_sql: str, directory: str, chunksize: int = DEFAULT_INSERT_CHUNK_SIZE) -> List[str]:
+        """runs the query and streams the results to Parquet files, one per chunk of rows.
+
+        Only one chunk is held in memory at a time, for results too large for the in-memory path.
+
+        Args:
+            query_sql: the query to execute.
+            directory: where to write the chunk files.
+            chunksize: the number of rows per chunk file.
+        Returns:
+            the paths of the chunk files, in result order.
+        """
+        logger.debug('Beginning spilled query execution...')
+        start = time.time()
+        conn = None
+        paths = list()
+        try:
+            conn = self.get_connection()
+            for index, frame in enumerate(pd.read_sql_query(query_sql, conn, chunksize=chunksize)):
+                path = os.path.join(directory, f"{index:06d}.parquet")
+                frame.to_parquet(path, index=False)
+                paths.append(path)
+            logger.debug(f'Spilled {len(paths)} chunks in {time.time() - start} seconds.')
+        finally:
+            if conn:
+                conn.dispose()
+        return paths
+
     def _build_conn_string(self, overrides: dict = None) -> str:
         """This is the most basic implementation of a connection string
         possible and is intended to be extended.
@@ -1,6 +1,7 @@
 import logging
+import numbers
 import time
-from typing import TYPE_CHECKING, List, Optional, Union
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple, Union
 from urllib.parse import quote
 
 import pandas as pd
@@ -13,14 +14,20 @@ from tenacity.wait import wait_exponential
 
 import snowshu.core.models.data_types as dtypes
 import snowshu.core.models.materializations as mz
+import snowshu.core.models.predicate_strategies as ps
 from snowshu.adapters.source_adapters import BaseSourceAdapter
 from snowshu.core.models.attribute import Attribute
 from snowshu.core.models.credentials import (ACCOUNT, DATABASE, PASSWORD, ROLE,
                                              SCHEMA, USER, WAREHOUSE)
+from snowshu.core.models.predicate_strategies import PredicateStrategy
 from snowshu.core.models.relation import Relation
 from snowshu.exceptions import TooManyRecords
 from snowshu.logger import Logger
-from snowshu.samplings.sample_methods import BernoulliSampleMethod
+from snowshu.samplings.sample_methods import (BernoulliSampleMethod,
+                                              HashSampleMethod,
+                                              StratifiedSampleMethod,
+                                              SystemSampleMethod,
+                                              TimeWindowSampleMethod)
 
 if TYPE_CHECKING:
     from snowshu.core.samplings.bases.base_sample_method import BaseSampleMethod
@@ -39,7 +46,11 @@ class SnowflakeAdapter(BaseSourceAdapter):
     name = 'snowflake'
     SUPPORTS_CROSS_DATABASE = True
     SUPPORTED_FUNCTIONS = set(['ANY_VALUE', 'RLIKE', 'UUID_STRING'])
-    SUPPORTED_SAMPLE_METHODS = (BernoulliSampleMethod,)
+    SUPPORTED_SAMPLE_METHODS = (BernoulliSampleMethod,
+                                HashSampleMethod,
+                                StratifiedSampleMethod,
+                                SystemSampleMethod,
+                                TimeWindowSampleMethod,)
     REQUIRED_CREDENTIALS = (USER, PASSWORD, ACCOUNT, DATABASE,)
     ALLOWED_CREDENTIALS = (SCHEMA, WAREHOUSE, ROLE,)
     # snowflake in-db is UPPER, but connector is actually lower :(
@@ -164,13 +175,20 @@ class SnowflakeAdapter(BaseSourceAdapter):
             logger.error(error_message)
             raise
 
-    def create_table(self, query: str, name: str, schema: str, database: str = 'SNOWSHU'):
+    def create_table_statement(self, query: str, name: str, schema: str, database: str = 'SNOWSHU') -> str:
+        """builds the CTAS statement used to materialize a query as a transient table."""
         corrected_name, corrected_schema, corrected_database = (
             self._correct_case(x) for x in (name, schema, database)
         )
-        full_query = f'''CREATE TRANSIENT TABLE IF NOT EXISTS
+        return f'''CREATE TRANSIENT TABLE IF NOT EXISTS
             {corrected_database}.{corrected_schema}.{corrected_name}
             AS {query}'''
+
+    def create_table(self, query: str, name: str, schema: str, database: str = 'SNOWSHU'):
+        corrected_name, corrected_schema, corrected_database = (
+            self._correct_case(x) for x in (name, schema, database)
+        )
+        full_query = self.create_table_statement(query, name, schema, database)
         try:
             logger.debug(
                 "Creating table %s in %s.%s...",
@@ -226,6 +244,64 @@ class SnowflakeAdapter(BaseSourceAdapter):
         adapter = SnowflakeAdapter()
         return f"SELECT COUNT(*) FROM {adapter.quoted_dot_notation(relation)}"
 
+    @staticmethod
+    def sample_count_statement(relation: Relation, sample_type: 'BaseSampleMethod') -> str:
+        """creates the count statement for a sample of the relation
+
+        Args:
+            relation: the :class:`Relation <snowshu.core.models.relation.Relation>` to create the statement for.
+            sample_type: the sample method to count the rows of.
+        Returns:
+            a query that results in a single row, single column, integer value of the sample size
+        """
+        adapter = SnowflakeAdapter()
+        return (f"SELECT COUNT(*) FROM {adapter.quoted_dot_notation(relation)} "
+                f"{adapter._sample_type_to_query_sql(sample_type)}")
+
+    @staticmethod
+    def max_value_statement(relation: Relation, column: str) -> str:
+        """creates the statement for the largest value of a column of the relation
+
+        Args:
+            relation: the :class:`Relation <snowshu.core.models.relation.Relation>` to create the statement for.
+            column: the column to find the largest value of.
+        Returns:
+            a query that results in a single row, single column value
+        """
+        adapter = SnowflakeAdapter()
+        return f"SELECT MAX({column}) FROM {adapter.quoted_dot_notation(relation)}"
+
+    @staticmethod
+    def histogram_statement(relation: Relation, column: str, limit: Optional[int] = None) -> str:
+        """creates the statement for the number of rows per value of a column of the relation
+
+        Args:
+            relation: the :class:`Relation <snowshu.core.models.relation.Relation>` to create the statement for.
+            column: the column to group by.
+            limit: the maximum number of values to return. Default ``None`` returns all of them.
+        Returns:
+            a query that results in one (stratum, stratum_size) row per value of the column
+        """
+        adapter = SnowflakeAdapter()
+        limit_sql = f" LIMIT {limit}" if limit is not None else ''
+        return (f"SELECT {column} AS stratum, COUNT(*) AS stratum_size "
+                f"FROM {adapter.quoted_dot_notation(relation)} GROUP BY 1{limit_sql}")
+
+    @staticmethod
+    def relation_bytes_statement(relation: Relation) -> str:
+        """creates the statement for the storage size of a relation
+
+        Args:
+            relation: the :class:`Relation <snowshu.core.models.relation.Relation>` to create the statement for.
+        Returns:
+            a query that results in a single row, single column, integer value of the relation size in bytes
+        """
+        adapter = SnowflakeAdapter()
+        database, schema, name = (adapter._correct_case(value)  # noqa pylint: disable=protected-access
+                                  for value in (relation.database, relation.schema, relation.name))
+        return (f"SELECT BYTES FROM {adapter.quoted(database)}.INFORMATION_SCHEMA.TABLES "
+                f"WHERE TABLE_SCHEMA = '{schema}' AND TABLE_NAME = '{name}'")
+
     @staticmethod
     def view_creation_statement(relation: Relation) -> str:
         adapter = SnowflakeAdapter()
@@ -251,6 +327,16 @@ FROM
                                      sample_type: Optional['BaseSampleMethod']) -> str:
         if sample_type is None:
             return sql
+        if sample_type.name == 'SYSTEM' and sample_type.rows:
+            # block sampling only applies to tables, the constrained CTE is sampled by rows instead
+            sample_type = BernoulliSampleMethod(sample_type.rows, units='rows')
+        if sample_type.name == 'HASH' and sample_type.rows:
+            # the hash share is of the population, the constrained CTE is already a subset of it,
+            # so the rows with the lowest hashes are selected instead to stay repeatable
+            sample_sql = (f"QUALIFY ROW_NUMBER() OVER (ORDER BY {self._hash_expression(sample_type)}) "
+                          f"<= {sample_type.rows}")
+        else:
+            sample_sql = self._sample_type_to_query_sql(sample_type)
 
         return f"""
 WITH
@@ -262,7 +348,7 @@ SELECT
     *
 FROM
 {relation.scoped_cte('SNOWSHU_FINAL_SAMPLE')}
-{self._sample_type_to_query_sql(sample_type)}
+{sample_sql}
 )
 SELECT
     *
@@ -273,13 +359,20 @@ FROM
     @staticmethod
     def analyze_wrap_statement(sql: str, relation: Relation) -> str:
         adapter = SnowflakeAdapter()
+        population_size = getattr(relation, 'population_size', None)
+        if isinstance(population_size, numbers.Integral):
+            # already counted for the relation, so the population is not counted again
+            population = f"""SELECT
+    {population_size} AS population_size"""
+        else:
+            population = f"""SELECT
+    COUNT(*) AS population_size
+FROM
+    {adapter.quoted_dot_notation(relation)}"""
         return f"""
 WITH
     {relation.scoped_cte('SNOWSHU_COUNT_POPULATION')} AS (
-SELECT
-    COUNT(*) AS population_size
-FROM
-    {adapter.quoted_dot_notation(relation)}
+{population}
 )
 ,{relation.scoped_cte('SNOWSHU_CORE_SAMPLE')} AS (
 {sql}
@@ -313,6 +406,16 @@ FROM
 """
         if sample_type is not None:
             query += f"{self._sample_type_to_query_sql(sample_type)}"
+        if sample_type is not None and sample_type.name == 'SYSTEM' and sample_type.top_up_rows:
+            # the blocks came up short, so the missing rows are drawn from the whole relation
+            query += f"""
+UNION
+SELECT
+    *
+FROM
+    {self.quoted_dot_notation(relation)}
+SAMPLE BERNOULLI ({sample_type.top_up_rows} ROWS)
+"""
         return query
 
     @staticmethod
@@ -321,29 +424,92 @@ FROM
                                    subject_key: str,
                                    constraint_key: str,
                                    max_number_of_outliers: int) -> str:
-        """ Union statements to select outliers. This does not pull in NULL values. """
+        """ Union statement to select outliers for a single edge. This does not pull in NULL values. """
+        return SnowflakeAdapter.outliers_union_statement(subject,
+                                                         [(constraint, subject_key, constraint_key,)],
+                                                         max_number_of_outliers)
+
+    @staticmethod
+    def outliers_union_statement(subject: Relation,
+                                 constraints: List[Tuple[Relation, str, str]],
+                                 max_number_of_outliers: int) -> str:
+        """ Union statement to select outliers across all edges of the subject in one anti-join.
+
+            A subject row is an outlier of an edge when its key is not NULL and has no match in the
+            full constraint relation. Each edge keeps its own limit of max_number_of_outliers rows.
+            A single edge is a NOT EXISTS anti-join, which unlike NOT IN is not silently emptied by
+            NULL keys on the constraint side. Several edges scan the subject once, left joined to the
+            distinct keys of each constraint, and the limit is applied per edge with QUALIFY.
+
+            Args:
+                subject: the relation to pull outliers from
+                constraints: (constraint relation, subject key, constraint key) for each edge
+                max_number_of_outliers: the maximum number of outlier rows for each edge
+
+            Returns:
+                the parenthesized outliers query to be unioned onto the sample
+        """
         adapter = SnowflakeAdapter()
-        return f"""
+        if len(constraints) == 1:
+            constraint, subject_key, constraint_key = constraints[0]
+            return f"""
 (SELECT
     *
 FROM
-{adapter.quoted_dot_notation(subject)}
+{adapter.quoted_dot_notation(subject)} AS SNOWSHU_OUTLIER_SUBJECT
 WHERE
-    {subject_key}
-NOT IN
-(SELECT
-    {constraint_key}
+    ( SNOWSHU_OUTLIER_SUBJECT.{subject_key} IS NOT NULL
+AND NOT EXISTS (SELECT
+    1
 FROM
-{adapter.quoted_dot_notation(constraint)})
+{adapter.quoted_dot_notation(constraint)} AS SNOWSHU_OUTLIER_CONSTRAINT
+WHERE
+    SNOWSHU_OUTLIER_CONSTRAINT.{constraint_key} = SNOWSHU_OUTLIER_SUBJECT.{subject_key}) )
 LIMIT {max_number_of_outliers})
+"""
+        edges = [f"SNOWSHU_OUTLIER_EDGE_{index}" for index in range(len(constraints))]
+        flags = "\n".join(f"""    ,(SNOWSHU_OUTLIER_SUBJECT.{subject_key} IS NOT NULL
+    AND SNOWSHU_OUTLIER_CONSTRAINT_{index}.SNOWSHU_OUTLIER_KEY IS NULL) AS {edges[index]}"""
+                           for index, (_, subject_key, _) in enumerate(constraints))
+        joins = "\n".join(f"""LEFT JOIN (SELECT DISTINCT
+    {constraint_key} AS SNOWSHU_OUTLIER_KEY
+FROM
+{adapter.quoted_dot_notation(constraint)}) AS SNOWSHU_OUTLIER_CONSTRAINT_{index}
+ON
+    SNOWSHU_OUTLIER_CONSTRAINT_{index}.SNOWSHU_OUTLIER_KEY = SNOWSHU_OUTLIER_SUBJECT.{subject_key}"""
+                           for index, (constraint, subject_key, constraint_key) in enumerate(constraints))
+        limits = "\nOR ".join(f"({edge} AND ROW_NUMBER() OVER (PARTITION BY {edge} ORDER BY {edge}) "
+                              f"<= {max_number_of_outliers})" for edge in edges)
+        return f"""
+(SELECT
+    * EXCLUDE ({', '.join(edges)})
+FROM (
+SELECT
+    SNOWSHU_OUTLIER_SUBJECT.*
+{flags}
+FROM
+{adapter.quoted_dot_notation(subject)} AS SNOWSHU_OUTLIER_SUBJECT
+{joins}
+)
+WHERE
+    {' OR '.join(edges)}
+QUALIFY
+    {limits})
 """
 
     @staticmethod
     def upstream_constraint_statement(relation: Relation,
                                       local_key: str,
-                                      remote_key: str) -> str:
+                                      remote_key: str,
+                                      strategy: Optional[PredicateStrategy] = None,
+                                      local_relation: Optional[Relation] = None) -> str:
         """ builds upstream where constraints against downstream full population"""
         adapter = SnowflakeAdapter()
+        if strategy == ps.EXISTS:
+            return adapter._exists_statement(local_relation,  # noqa pylint: disable=protected-access
+                                             local_key,
+                                             adapter.quoted_dot_notation(relation),
+                                             remote_key)
         return f" {local_key} in (SELECT {remote_key} FROM \
                 {adapter.quoted_dot_notation(relation)})"
 
@@ -390,23 +556,284 @@ LIMIT {max_number_of_outliers})
             return f"{remote_key}::VARCHAR"
         return remote_key
 
-    def predicate_constraint_statement(
-        self, relation: Relation, analyze: bool, local_key: str, remote_key: str
+    def _key_table_query(self, relation: Relation, remote_key: str) -> str:
+        """selects the sorted, distinct values of a key from the relation sample."""
+        formatted_remote_key = self.format_remote_key(relation, remote_key)
+        return (
+            f"SELECT DISTINCT {formatted_remote_key} AS {remote_key} "
+            f"FROM {relation.temp_dot_notation} "
+            f"ORDER BY 1"
+        )
+
+    def create_key_table_statement(self, relation: Relation, remote_key: str) -> str:
+        """builds the CTAS statement for the key table of a relation sample."""
+        return self.create_table_statement(self._key_table_query(relation, remote_key),
+                                           relation.key_table_name(remote_key),
+                                           relation.temp_schema,
+                                           relation.temp_database)
+
+    def create_key_table(self, relation: Relation, remote_key: str) -> None:
+        """Materializes the distinct values of a key from the relation sample.
+
+        The key table is a single, sorted column so that downstream predicates
+        (and their validation) do not have to scan the full width of the sample.
+
+            Args:
+                relation: The relation whose temp sample table has already been created.
+                remote_key: The attribute downstream relations are constrained on.
+        """
+        self.create_table(
+            query=self._key_table_query(relation, remote_key),
+            name=relation.key_table_name(remote_key),
+            schema=relation.temp_schema,
+            database=relation.temp_database,
+        )
+
+    def population_counts(self, relations: List[Relation]) -> List[int]:
+        """Counts the population of every relation in a single round trip.
+
+        An unfiltered COUNT(*) over a table is answered by Snowflake from micro-partition
+        metadata, so this does not scan the relations.
+
+            Args:
+                relations: The relations to count.
+            Returns:
+                the population sizes, in the same order as the relations.
+        """
+        query = "\nUNION ALL\n".join(
+            f"SELECT {index} AS relation_index, ({self.population_count_statement(relation)}) AS population_size"
+            for index, relation in enumerate(relations))
+        counts = self._safe_query(query)
+        counts.columns = [column.lower() for column in counts.columns]
+        counts = counts.set_index('relation_index')['population_size']
+        return [int(counts[index]) for index in range(len(relations))]
+
+    def relation_bytes(self, relations: List[Relation]) -> List[int]:
+        """Looks up the catalog storage size of every relation in a single round trip.
+
+            Args:
+                relations: The relations to look up.
+            Returns:
+                the sizes in bytes, 0 where unknown, in the same order as the relations.
+        """
+        query = "\nUNION ALL\n".join(
+            f"SELECT {index} AS relation_index, ({self.relation_bytes_statement(relation)}) AS bytes"
+            for index, relation in enumerate(relations))
+        sizes = self._safe_query(query)
+        sizes.columns = [column.lower() for column in sizes.columns]
+        sizes = sizes.set_index('relation_index')['bytes']
+        return [0 if pd.isna(sizes[index]) else int(sizes[index]) for index in range(len(relations))]
+
+    @staticmethod
+    def component_analyze_statement(relations: List[Relation]) -> str:
+        """Unions the compiled analyze queries of the relations into a single statement.
+
+            Args:
+                relations: The relations with analyze queries compiled.
+            Returns:
+                a query with one (relation_index, dot_notation, sample_size, population_size) row per relation.
+        """
+        return "\nUNION ALL\n".join(
+            f"SELECT {index} AS relation_index, "
+            f"{SnowflakeAdapter._key_literal(relation.dot_notation)} AS dot_notation, "
+            f"sample_size, population_size FROM ({relation.compiled_query})"
+            for index, relation in enumerate(relations))
+
+    def analyze_relations(self, relations: List[Relation]) -> pd.DataFrame:
+        """Runs the analyze queries of the relations in a single round trip.
+
+            Args:
+                relations: The relations with analyze queries compiled.
+            Returns:
+                the sample_size and population_size of each relation, in the same order as the relations.
+        """
+        result = self._safe_query(self.component_analyze_statement(relations))
+        result.columns = [column.lower() for column in result.columns]
+        return result.set_index('relation_index').loc[list(range(len(relations)))]
+
+    @staticmethod
+    def last_altered_statement(relations: List[Relation]) -> str:
+        """creates the statement for the last-altered time of every relation.
+
+            Args:
+                relations: The relations to look up.
+            Returns:
+                a query with one (relation_index, last_altered) row per relation, from metadata only.
+        """
+        adapter = SnowflakeAdapter()
+        statements = list()
+        for index, relation in enumerate(relations):
+            database, schema, name = (adapter._correct_case(value)  # noqa pylint: disable=protected-access
+                                      for value in (relation.database, relation.schema, relation.name))
+            statements.append(f"SELECT {index} AS relation_index, "
+                              f"(SELECT MAX(LAST_ALTERED) FROM {adapter.quoted(database)}.INFORMATION_SCHEMA.TABLES "
+                              f"WHERE TABLE_SCHEMA = '{schema}' AND TABLE_NAME = '{name}') AS last_altered")
+        return "\nUNION ALL\n".join(statements)
+
+    def last_altered(self, relations: List[Relation]) -> List[str]:
+        """Looks up when every relation was last altered in a single round trip.
+
+            Args:
+                relations: The relations to look up.
+            Returns:
+                the last-altered times as strings, in the same order as the relations.
+        """
+        result = self._safe_query(self.last_altered_statement(relations))
+        result.columns = [column.lower() for column in result.columns]
+        result = result.set_index('relation_index')['last_altered']
+        return [str(result[index]) for index in range(len(relations))]
+
+    @staticmethod
+    def component_script_statement(statements: List[str], relations: List[Relation]) -> str:
+        """Wraps the statements of a whole component into one Snowflake Scripting block.
+
+        The block runs every statement server-side, in order, and returns a manifest
+        with the row count of each relation's temp sample table. It is sent as a
+        ``$$`` literal unless a statement contains ``$$`` itself, in which case it is
+        sent as an escaped single-quoted string instead.
+
+            Args:
+                statements: The statements to run, in execution order.
+                relations: The relations whose temp sample tables are counted in the manifest.
+            Returns:
+                an ``EXECUTE IMMEDIATE`` statement.
+        """
+        body = "\n".join(f"{statement};" for statement in statements)
+        manifest = "\nUNION ALL\n".join(
+            f"SELECT {index} AS relation_index, COUNT(*) AS sample_size FROM {relation.temp_dot_notation}"
+            for index, relation in enumerate(relations))
+        block = f"""
+BEGIN
+{body}
+LET manifest RESULTSET := (
+{manifest}
+);
+RETURN TABLE(manifest);
+END;
+"""
+        if '$$' in block:
+            # a $$ in any statement would close the literal early
+            escaped = block.replace('\\', '\\\\').replace("'", "''")
+            return f"\nEXECUTE IMMEDIATE '{escaped}'\n"
+        return f"\nEXECUTE IMMEDIATE $${block}$$\n"
+
+    def execute_component_script(self, statements: List[str], relations: List[Relation]) -> List[int]:
+        """Runs the statements of a whole component in a single request.
+
+            Args:
+                statements: The statements to run, in execution order.
+                relations: The relations whose temp sample tables are counted in the manifest.
+            Returns:
+                the sample sizes, in the same order as the relations.
+        """
+        logger.debug("Executing component script for %s relations...", len(relations))
+        manifest = self._safe_query(self.component_script_statement(statements, relations))
+        manifest.columns = [column.lower() for column in manifest.columns]
+        counts = manifest.set_index('relation_index')['sample_size']
+        return [int(counts[index]) for index in range(len(relations))]
+
+    def _key_set_source(self,
+                        relation: Relation,
+                        remote_key: str,
+                        use_key_table: bool) -> Tuple[str, str]:
+        """Returns the key column and the table the key set of a relation sample is read from."""
+        if use_key_table:
+            return remote_key, relation.temp_key_table_dot_notation(remote_key)
+        return self.format_remote_key(relation, remote_key), relation.temp_dot_notation
+
+    def key_set_cardinality(self,
+                            relation: Relation,
+                            remote_key: str,
+                            use_key_table: bool = False) -> int:
+        """Counts the distinct keys a relation sample offers to downstream relations.
+
+        Doubles as the validation of the key set, so an empty set raises the same
+        IndexError as :meth:`_validate_key_index_error`.
+
+            Args:
+                relation: The relation whose temp sample table has already been created.
+                remote_key: The attribute downstream relations are constrained on.
+                use_key_table: Whether to count from the compact key table.
+            Returns:
+                the number of distinct keys.
+        """
+        key_column, key_table = self._key_set_source(relation, remote_key, use_key_table)
+        cardinality = int(self._safe_query(
+            f"SELECT COUNT(DISTINCT {key_column}) AS cardinality FROM {key_table}").iloc[0]['cardinality'])
+        if cardinality < 1:
+            logger.critical(
+                "Failed to build predicates for %s: the constraint set "
+                "is empty, please validate the relation.",
+                relation.dot_notation,
+            )
+            raise IndexError("Failed to build predicates, the constraint set is empty.")
+        return cardinality
+
+    @staticmethod
+    def _key_literal(value: Any) -> str:
+        """Renders a key value as an escaped string literal."""
+        escaped = str(value).replace('\\', '\\\\').replace("'", "''")
+        return f"'{escaped}'"
+
+    def _exists_statement(self,
+                          local_relation: Relation,
+                          local_key: str,
+                          key_table: str,
+                          key_column: str) -> str:
+        """Builds a correlated EXISTS predicate of the local relation against a key table."""
+        qualifier = self.quoted(self._correct_case(local_relation.name))
+        return (
+            f"EXISTS ( SELECT 1 FROM {key_table} AS SNOWSHU_CONSTRAINT_KEYS "
+            f"WHERE SNOWSHU_CONSTRAINT_KEYS.{key_column} = {qualifier}.{local_key} )"
+        )
+
+    def predicate_constraint_statement(  # noqa pylint: disable=too-many-arguments
+        self,
+        relation: Relation,
+        analyze: bool,
+        local_key: str,
+        remote_key: str,
+        use_key_table: bool = False,
+        strategy: Optional[PredicateStrategy] = None,
+        local_relation: Optional[Relation] = None,
     ) -> str:
-        """Builds 'where' strings."""
+        """Builds 'where' strings.
+
+        If use_key_table is set the constraint reads from the compact key table
+        created by :meth:`create_key_table` instead of the full temp sample.
+
+        By default the constraint is an ``IN`` subquery that is validated with an
+        EXISTS query. When a :class:`PredicateStrategy
+        <snowshu.core.models.predicate_strategies.PredicateStrategy>` is chosen by the
+        compiler the key set has already been validated by :meth:`key_set_cardinality`, and
+
+        - ``INLINE`` fetches the keys and emits them as a literal list
+        - ``SEMI_JOIN`` emits the ``IN`` subquery against the key set
+        - ``EXISTS`` emits a correlated ``EXISTS`` against ``local_relation``
+        """
         try:
-            formatted_remote_key = self.format_remote_key(relation, remote_key)
             if analyze:
+                formatted_remote_key = self.format_remote_key(relation, remote_key)
                 return (
                     f"{local_key} IN ( SELECT {formatted_remote_key} AS {local_key} "
                     f"FROM ({relation.core_query}))"
                 )
 
+            key_column, key_table = self._key_set_source(relation, remote_key, use_key_table)
+            if strategy == ps.INLINE:
+                keys = self._safe_query(
+                    f"SELECT DISTINCT {key_column} AS snowshu_key FROM {key_table} "
+                    f"WHERE {key_column} IS NOT NULL")['snowshu_key']
+                return f"{local_key} IN ({', '.join(self._key_literal(key) for key in keys)})"
+            if strategy == ps.EXISTS:
+                return self._exists_statement(local_relation, local_key, key_table, key_column)
+
             constraint_query = (
-                f"    SELECT DISTINCT {formatted_remote_key} "
-                f"    FROM {relation.temp_dot_notation} "
+                f"    SELECT {'' if use_key_table else 'DISTINCT '}{key_column} "
+                f"    FROM {key_table} "
             )
-            self._validate_key_index_error(relation, constraint_query, remote_key)
+            if strategy in (None, ps.SUBQUERY,):
+                self._validate_key_index_error(relation, constraint_query, remote_key)
             return f"{local_key} IN ({constraint_query})"
         except Exception as err:
             logger.critical(
@@ -417,20 +844,68 @@ LIMIT {max_number_of_outliers})
             raise
 
     # pylint: disable=too-many-arguments
-    def polymorphic_constraint_statement(self,
+    def polymorphic_constraint_statement(self,  # noqa pylint: disable=too-many-arguments
                                          relation: Relation,
                                          analyze: bool,
                                          local_key: str,
                                          remote_key: str,
                                          local_type: str,
-                                         local_type_match_val: str = None) -> str:
-        predicate = self.predicate_constraint_statement(relation, analyze, local_key, remote_key)
-        if local_type_match_val:
-            type_match_val = local_type_match_val
-        else:
-            type_match_val = relation.name[:-1] if relation.name[-1].lower() == 's' else relation.name
+                                         local_type_match_val: str = None,
+                                         use_key_table: bool = False,
+                                         strategy: Optional[PredicateStrategy] = None,
+                                         local_relation: Optional[Relation] = None,
+                                         exact_type_match: bool = False) -> str:
+        """ builds the constraint against a polymorphic parent, restricted to the rows of its type.
+
+            The type column is compared case insensitively. With exact_type_match a type value given
+            by local_type_overrides is compared to the column as is, which lets Snowflake prune on it.
+        """
+        predicate = self.predicate_constraint_statement(relation,
+                                                        analyze,
+                                                        local_key,
+                                                        remote_key,
+                                                        use_key_table,
+                                                        strategy,
+                                                        local_relation)
+        type_match_val = self.polymorphic_type_match_value(relation, local_type_match_val)
+        if exact_type_match and local_type_match_val:
+            return f" ({predicate} AND {local_type} = '{type_match_val}' ) "
+        # a type derived from the parent name can be stored in any case
         return f" ({predicate} AND LOWER({local_type}) = LOWER('{type_match_val}') ) "
 
+    @staticmethod
+    def polymorphic_type_match_value(relation: Relation, local_type_match_val: str = None) -> str:
+        """ the type column value that selects rows belonging to the given polymorphic parent """
+        if local_type_match_val:
+            return local_type_match_val
+        return relation.name[:-1] if relation.name[-1].lower() == 's' else relation.name
+
+    @staticmethod
+    def _stratum_quota_expression(sample_type: 'BaseSampleMethod') -> str:
+        """Renders the number of rows to select from the stratum of each row.
+
+        The quotas from the histogram are used as they are, strata that did not exist
+        when the histogram was collected get the minimum.
+        """
+        column = sample_type.column
+        if not sample_type.quotas:
+            return (f"GREATEST(CEIL(COUNT(*) OVER (PARTITION BY {column}) * {sample_type.probability}), "
+                    f"{sample_type.min_rows_per_stratum})")
+        cases = []
+        for stratum, quota in sample_type.quotas.items():
+            if pd.isna(stratum):
+                cases.append(f"WHEN {column} IS NULL THEN {quota}")
+            elif isinstance(stratum, numbers.Number) and not isinstance(stratum, bool):
+                cases.append(f"WHEN {column} = {stratum} THEN {quota}")
+            else:
+                cases.append(f"WHEN {column} = {SnowflakeAdapter._key_literal(stratum)} THEN {quota}")
+        return f"CASE {' '.join(cases)} ELSE {sample_type.min_rows_per_stratum} END"
+
+    @staticmethod
+    def _hash_expression(sample_type: 'BaseSampleMethod') -> str:
+        hashed = ', '.join(sample_type.key_columns) if sample_type.key_columns else '*'
+        return f"HASH({sample_type.seed}, HASH({hashed}))"
+
     @staticmethod
     def _sample_type_to_query_sql(sample_type: 'BaseSampleMethod') -> str:
         if sample_type.name == 'BERNOULLI':
@@ -438,7 +913,20 @@ LIMIT {max_number_of_outliers})
                 else str(sample_type.rows) + ' ROWS'
             return f"SAMPLE BERNOULLI ({qualifier})"
         if sample_type.name == 'SYSTEM':
-            return f"SAMPLE SYSTEM ({sample_type.probability})"
+            seed = f" SEED ({sample_type.seed})" if getattr(sample_type, 'seed', None) is not None else ''
+            return f"SAMPLE SYSTEM ({sample_type.probability}){seed}"
+        if sample_type.name == 'TIME_WINDOW':
+            window = (f"WHERE {sample_type.column} BETWEEN {SnowflakeAdapter._key_literal(sample_type.lower_bound)} "
+                      f"AND {SnowflakeAdapter._key_literal(sample_type.upper_bound)}")
+            if sample_type.probability is None:
+                return window
+            return f"{window} AND UNIFORM(0::FLOAT, 1::FLOAT, RANDOM()) < {sample_type.probability}"
+        if sample_type.name == 'STRATIFIED':
+            return (f"QUALIFY ROW_NUMBER() OVER (PARTITION BY {sample_type.column} ORDER BY RANDOM()) "
+                    f"<= {SnowflakeAdapter._stratum_quota_expression(sample_type)}")
+        if sample_type.name == 'HASH':
+            return (f"WHERE ABS(MOD({SnowflakeAdapter._hash_expression(sample_type)}, {sample_type.buckets})) "
+                    f"< {sample_type.threshold}")
 
         message = f"{sample_type.name} is not supported for SnowflakeAdapter"
         logger.error(message)
@@ -542,10 +1030,47 @@ LIMIT {max_number_of_outliers})
                               max_count: int,
                               unsampled: bool) -> pd.DataFrame:
         """checks the count, if count passes returns results as a dataframe."""
-        try:
-            logger.debug('Checking count for query...')
-            start_time = time.time()
+        logger.debug('Checking count for query...')
+        start_time = time.time()
+        count = self._count_query(query)
+        self._check_count(query, count, max_count, unsampled)
+        logger.debug(
+            f'Query count safe at {count} rows in {time.time()-start_time} seconds.')
+        response = self._safe_query(query)
+        return response
+
+    @tenacity.retry(wait=wait_exponential(),
+                    stop=stop_after_attempt(4),
+                    before_sleep=Logger().log_retries,
+                    reraise=True)
+    def check_known_count_and_query(self, query: str,
+                                    count: int,
+                                    max_count: int,
+                                    unsampled: bool) -> pd.DataFrame:
+        """same as check_count_and_query for a query whose count is already known."""
+        self._check_count(query, count, max_count, unsampled)
+        return self._safe_query(query)
+
+    @tenacity.retry(wait=wait_exponential(),
+                    stop=stop_after_attempt(4),
+                    before_sleep=Logger().log_retries,
+                    reraise=True)
+    def check_count_and_spill(self, query: str,  # noqa pylint: disable=too-many-arguments
+                              max_count: int,
+                              unsampled: bool,
+                              directory: str,
+                              count: Optional[int] = None) -> Tuple[int, List[str]]:
+        """same as check_count_and_query, but streams the results to Parquet files in
+        directory instead of returning them as a single dataframe."""
+        if count is None:
             count = self._count_query(query)
+        self._check_count(query, count, max_count, unsampled)
+        return count, self._spill_query(query, directory)
+
+    @staticmethod
+    def _check_count(query: str, count: int, max_count: int, unsampled: bool) -> None:
+        """raises TooManyRecords if a sampled query would return more than max_count rows."""
+        try:
             if unsampled and count > max_count:
                 warn_msg = (f'Unsampled relation has {count} rows which is over '
                             f'the max allowed rows for this type of query ({max_count}). '
@@ -553,16 +1078,12 @@ LIMIT {max_number_of_outliers})
                 logger.warning(warn_msg)
             else:
                 assert count <= max_count
-            logger.debug(
-                f'Query count safe at {count} rows in {time.time()-start_time} seconds.')
         except AssertionError as exc:
             message = (f'failed to execute query, result would have returned {count} rows '
                        f'but the max allowed rows for this type of query is {max_count}.')
             logger.error(message)
             logger.debug(f'failed sql: {query}')
             raise TooManyRecords(message) from exc
-        response = self._safe_query(query)
-        return response
 
     @overrides
     def get_connection(
@@ -1,13 +1,17 @@
 import os
+from concurrent.futures import Future
 from datetime import datetime
-from time import sleep
-from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+from time import sleep, time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
 import logging
 
 import pandas as pd
+import sqlalchemy
 
 from snowshu.adapters import BaseSQLAdapter
 from snowshu.configs import (DEFAULT_INSERT_CHUNK_SIZE,
+                             DOCKER_READY_INITIAL_BACKOFF,
+                             DOCKER_READY_MAX_BACKOFF, DOCKER_READY_TIMEOUT,
                              DOCKER_TARGET_CONTAINER, DOCKER_TARGET_PORT,
                              IS_IN_DOCKER)
 from snowshu.core.docker import SnowShuDocker
@@ -17,6 +21,7 @@ from snowshu.core.models import materializations as mz
 from snowshu.core.models.credentials import (DATABASE, HOST, PASSWORD, PORT,
                                              USER)
 from snowshu.core.utils import case_insensitive_dict_value
+from snowshu.exceptions import UnableToStartTarget
 
 if TYPE_CHECKING:
     from docker.models.containers import Container
@@ -29,6 +34,12 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
     REQUIRED_CREDENTIALS = [USER, PASSWORD, HOST, PORT, DATABASE]
     ALLOWED_CREDENTIALS = []
     DOCKER_TARGET_PORT = DOCKER_TARGET_PORT
+    # the command replica containers start with, if different from the build container's
+    DOCKER_REPLICA_START_COMMAND = None
+    # the command baked into replicas as their HEALTHCHECK, if any
+    DOCKER_HEALTHCHECK_COMMAND = None
+    # whether the local arch replica is flattened into a single layer
+    squash_replica = False
 
     def __init__(self, replica_metadata: dict):
         super().__init__()
@@ -44,7 +55,7 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
         self.credentials = self._generate_credentials(self.target)
         self.shdocker = SnowShuDocker()
         self.container: "Container" = None
-        self.passive_container: "Container" = None
+        self.passive_container = None
         self.target_arch = None
         self.replica_meta = replica_metadata
         self.is_incremental = False
@@ -57,6 +68,25 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
         """
         raise NotImplementedError()
 
+    @property
+    def passive_container(self) -> Optional["Container"]:
+        """the passive container, waiting for it if it is still prepared in the background."""
+        if isinstance(self._passive_container, Future):
+            if not self._passive_container.done():
+                logger.info('Waiting for the passive container to be prepared...')
+            self._passive_container = self._passive_container.result()
+        return self._passive_container
+
+    @passive_container.setter
+    def passive_container(self, container) -> None:
+        self._passive_container = container
+
+    def check_passive_container(self) -> None:
+        """Fails the build early if the passive container could not be prepared in the
+        background, instead of once all of the data is loaded and about to be copied."""
+        if isinstance(self._passive_container, Future) and self._passive_container.done():
+            self._passive_container.result()
+
     def copy_replica_data(self) -> Tuple[bool, str]:
         """
             A service function that copies replica data to a shared location
@@ -83,12 +113,28 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
     def create_all_database_extensions(self):
         raise NotImplementedError()
 
+    def create_relationship_indexes(self,
+                                    relation_attributes: Dict[Relation, Set[str]],
+                                    threads: int) -> None:
+        """Indexes the attributes relations are joined on, then updates their statistics.
+
+        Args:
+            relation_attributes: the attribute names to index for each relation.
+            threads: the number of relations to index at once.
+        """
+        raise NotImplementedError()
+
+    def set_relations_logged(self) -> None:
+        """Makes the relations loaded without durability durable, before the replica is
+        copied and finalized. Targets that always load durably have nothing to do."""
+
     def create_schema_if_not_exists(self, database: str, schema: str) -> str:
         raise NotImplementedError()
 
     def create_and_load_relation(self,
                                  relation: "Relation",
                                  data: Optional[pd.DataFrame]) -> None:
+        self.check_passive_container()
         if relation.is_view:
             self.create_or_replace_view(relation)
         else:
@@ -105,12 +151,13 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
         """
         raise NotImplementedError()
 
-    def load_data_into_relation(self, relation: Relation, data: pd.DataFrame) -> None:
+    def load_data_into_relation(self, relation: Relation, data: pd.DataFrame, if_exists: str = 'replace') -> None:
         """Loads data into a target.
 
         Args:
             relation: The relation containing info about dataset to load.
             data: The data to load into the relation.
+            if_exists: What to do if the relation already exists, ``replace`` or ``append``.
         """
         database = self.quoted(self._correct_case(relation.database))
         schema = self.quoted(self._correct_case(relation.schema))
@@ -143,7 +190,7 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
         }
 
         data_type_map = {
-            col: case_insensitive_dict_value(attribute_type_map, col)
+            col: self._load_type(case_insensitive_dict_value(attribute_type_map, col))
             for col in data.columns.to_list()
         }
 
@@ -152,7 +199,7 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
                 self._correct_case(relation.name),
                 engine,
                 schema=self._correct_case(schema),
-                if_exists='replace',
+                if_exists=if_exists,
                 index=False,
                 dtype=data_type_map,
                 chunksize=DEFAULT_INSERT_CHUNK_SIZE,
@@ -166,6 +213,28 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
 
         logger.info(final_message)
 
+    @staticmethod
+    def _load_type(sqlalchemy_type):
+        """The column type to load a source type with, can be overridden to pass values
+        through in a faster form than the generic sqlalchemy type.
+
+        Args:
+            sqlalchemy_type: The sqlalchemy type of the source attribute.
+        """
+        return sqlalchemy_type
+
+    def load_spilled_data_into_relation(self, relation: Relation, paths: List[str]) -> None:
+        """Loads data spilled to Parquet files into a target, one file at a time.
+
+        Args:
+            relation: The relation containing info about dataset to load.
+            paths: The spill files, in load order.
+        """
+        for index, path in enumerate(paths):
+            self.load_data_into_relation(relation,
+                                         pd.read_parquet(path, memory_map=True),
+                                         'replace' if index == 0 else 'append')
+
     def initialize_replica(self,
                            source_adapter_name: str,
                            incremental_image: str = None) -> None:
@@ -189,17 +258,38 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
             source_adapter_name,
             self.target_arch,
             self._build_snowshu_envars(
-                self.DOCKER_SNOWSHU_ENVARS))
+                self.DOCKER_SNOWSHU_ENVARS),
+            wait_for_passive=False)
 
         logger.info('Container initialized.')
-        while not self.target_database_is_ready():
-            sleep(.5)
+        self.wait_until_ready()
 
         self._initialize_snowshu_meta_database()
 
     def target_database_is_ready(self) -> bool:
-        return self.container.exec_run(
-            self.DOCKER_READY_COMMAND).exit_code == 0
+        """Probes the running target container with a connection. Unlike an exec in the
+        container this needs no docker api call or process spawn."""
+        try:
+            self.get_connection().connect().close()
+            return True
+        except sqlalchemy.exc.OperationalError:
+            return False
+
+    def wait_until_ready(self, timeout: float = DOCKER_READY_TIMEOUT) -> None:
+        """Waits for the running target container to accept connections, probing with
+        exponential backoff.
+
+        Args:
+            timeout: the maximum number of seconds to wait.
+        """
+        deadline = time() + timeout
+        backoff = DOCKER_READY_INITIAL_BACKOFF
+        while not self.target_database_is_ready():
+            if time() > deadline:
+                raise UnableToStartTarget(
+                    f'Target database did not accept connections within {timeout} seconds, aborting.')
+            sleep(backoff)
+            backoff = min(backoff * 2, DOCKER_READY_MAX_BACKOFF)
 
     def finalize_replica(self) -> None:
         """ Converts all containers to respective replicas,
@@ -208,7 +298,10 @@ class BaseTargetAdapter(BaseSQLAdapter):  # noqa pylint: disable=too-many-instan
         logger.info('Finalizing target container into replica...')
         self.shdocker.convert_container_to_replica(self.replica_meta['name'],
                                                    self.container,
-                                                   self.passive_container)
+                                                   self.passive_container,
+                                                   self.DOCKER_REPLICA_START_COMMAND,
+                                                   self.DOCKER_HEALTHCHECK_COMMAND,
+                                                   self.squash_replica)
         logger.info(f'Finalized replica image {self.replica_meta["name"]}')
 
     def _generate_credentials(self, host) -> Credentials:
@@ -1,10 +1,15 @@
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+import json
 import logging
+import math
+import re
 import time
 from pandas import DataFrame
 
 import sqlalchemy
 from overrides import overrides
+from sqlalchemy.types import JSON, UserDefinedType
 
 import snowshu.core.models.data_types as dtypes
 from snowshu.adapters.target_adapters import BaseTargetAdapter
@@ -12,12 +17,30 @@ from snowshu.configs import DOCKER_REMOUNT_DIRECTORY, DOCKER_REPLICA_MOUNT_FOLDE
 from snowshu.core.models import materializations as mz
 from snowshu.core.models.attribute import Attribute
 from snowshu.core.models.relation import Relation
-from snowshu.core.utils import correct_case
-from snowshu.exceptions import UnableToStartPostgres
+from snowshu.core.utils import correct_case, decode_json_column
+from snowshu.logger import duration
 
 logger = logging.getLogger(__name__)
 
 
+class JSONText(UserDefinedType):  # noqa pylint: disable=abstract-method
+    """jsonb column type that passes JSON text through as is, so the text is parsed once
+    by Postgres instead of being decoded and encoded again in Python."""
+    cache_ok = True
+
+    def get_col_spec(self, **kw) -> str:  # noqa pylint: disable=unused-argument
+        return "JSONB"
+
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None or isinstance(value, str):
+                return value
+            if isinstance(value, float) and math.isnan(value):
+                return None
+            return json.dumps(value)
+        return process
+
+
 class PostgresAdapter(BaseTargetAdapter):
     name = 'postgres'
     dialect = 'postgresql'
@@ -29,7 +52,36 @@ class PostgresAdapter(BaseTargetAdapter):
         TABLE=mz.TABLE, BASE_TABLE=mz.TABLE, VIEW=mz.VIEW)
     DOCKER_REMOUNT_DIRECTORY = DOCKER_REMOUNT_DIRECTORY
     DOCKER_REPLICA_MOUNT_FOLDER = DOCKER_REPLICA_MOUNT_FOLDER
+    DOCKER_REPLICA_DUMP_DIRECTORY = 'replica_dump'
+    # seconds to wait for a clean shutdown before the container is killed
+    DOCKER_STOP_TIMEOUT = 600
+    # names of the WAL segment files, timeline and segment number in hex
+    WAL_SEGMENT_PATTERN = re.compile(r'[0-9A-F]{24}')
+    # pg_controldata fields that have to match for a data directory to be usable by another build
+    PHYSICAL_COPY_CONTROL_FIELDS = ('pg_control version number',
+                                    'Catalog version number',
+                                    'Maximum data alignment',
+                                    'Database block size',
+                                    'Blocks per segment of large relation',
+                                    'WAL block size',
+                                    'Bytes per WAL segment',
+                                    'Maximum length of identifiers',
+                                    'Maximum columns in an index',
+                                    'Maximum size of a TOAST chunk',
+                                    'Size of a large-object chunk',
+                                    'Date/time type storage',
+                                    'Float4 argument passing',
+                                    'Float8 argument passing',)
     DEFAULT_CASE = 'lower'
+    # bulk load settings for the build container, nothing in it has to survive a crash
+    # since a failed build is discarded. wal_level minimal requires max_wal_senders 0
+    LOAD_TUNING_SETTINGS = dict(fsync='off',
+                                synchronous_commit='off',
+                                full_page_writes='off',
+                                wal_level='minimal',
+                                max_wal_senders='0',
+                                max_wal_size='8GB',
+                                maintenance_work_mem='1GB')
 
     # NOTE: either start container with db listening on port 9999,
     # or override with DOCKER_TARGET_PORT
@@ -83,16 +135,61 @@ class PostgresAdapter(BaseTargetAdapter):
         self.extensions = kwargs.get("pg_extensions", [])
         self.x00_replacement = kwargs.get("pg_0x00_replacement", "")
 
-        self.DOCKER_START_COMMAND = f'postgres -p {self._credentials.port} '  # noqa pylint: disable=invalid-name
-        self.DOCKER_READY_COMMAND = (f'pg_isready -p {self._credentials.port} '  # noqa pylint: disable=invalid-name
-                                     f'-h {self._credentials.host} '
-                                     f'-U {self._credentials.user} '
-                                     f'-d {self._credentials.database}')
-        self.DOCKER_SHARE_REPLICA_DATA = f"pg_dumpall -c -U {self._credentials.user} -p 9999 | " \
-                                         f"gzip > {self.DOCKER_REPLICA_MOUNT_FOLDER}/replica_dump.gz"  # noqa pylint: disable=invalid-name
+        self.load_tuning = kwargs.get("pg_load_tuning", True)
+        self.unlogged_tables = kwargs.get("pg_unlogged_tables", False)
+        self.vacuum_freeze = kwargs.get("pg_vacuum_freeze", True)
+        self.physical_copy = kwargs.get("pg_physical_copy", False)
+        self.compact_replica = kwargs.get("pg_compact_replica", True)
+        self.squash_replica = kwargs.get("pg_squash_replica", False)
+        self._unlogged_relations = list()
+
+        # replicas are committed to start with the stock durable settings
+        self.DOCKER_REPLICA_START_COMMAND = f'postgres -p {self._credentials.port} '  # noqa pylint: disable=invalid-name
+        self.DOCKER_START_COMMAND = self.DOCKER_REPLICA_START_COMMAND  # noqa pylint: disable=invalid-name
+        if self.load_tuning:
+            self.DOCKER_START_COMMAND += ' '.join(f'-c {setting}={value}'
+                                                  for setting, value in self.LOAD_TUNING_SETTINGS.items())
+        self.DOCKER_CHECKPOINT_COMMAND = (f'psql -p {self._credentials.port} '  # noqa pylint: disable=invalid-name
+                                          f'-U {self._credentials.user} '
+                                          f'-d {self._credentials.database} '
+                                          '-c CHECKPOINT')
+        self.DOCKER_VACUUM_COMMAND = (f'vacuumdb --all --freeze --analyze --jobs $(nproc) '  # noqa pylint: disable=invalid-name
+                                      f'-p {self._credentials.port} -U {self._credentials.user}')
+        # run with an argument list while the server is up, only files it does not use are removed.
+        # Prints the WAL segment of the current insert position, all older segments are before the
+        # redo point of the shutdown checkpoint and are removed once the server is stopped
+        self.DOCKER_COMPACT_COMMAND = (  # noqa pylint: disable=invalid-name
+            'rm -rf "$PGDATA"/base/pgsql_tmp/* /var/lib/apt/lists/* /var/cache/apt/archives/*.deb && '
+            f'psql -p {self._credentials.port} -U {self._credentials.user} '
+            f'-d {self._credentials.database} -Atc "SELECT pg_walfile_name(pg_current_wal_lsn())"')
+        self.DOCKER_HEALTHCHECK_COMMAND = (f'pg_isready -p {self._credentials.port} '  # noqa pylint: disable=invalid-name
+                                           f'-U {self._credentials.user} '
+                                           f'-d {self._credentials.database}')
+        # each database is dumped and restored in parallel over the cores of the container.
+        # The dump is not compressed since it only ever sits on the local shared volume.
+        # The scripts run in single quotes so must not contain any single quotes themselves.
+        connection_args = f'-U {self._credentials.user} -p {self._credentials.port}'
+        dump_directory = f'{self.DOCKER_REPLICA_MOUNT_FOLDER}/{self.DOCKER_REPLICA_DUMP_DIRECTORY}'
+        self.DOCKER_SHARE_REPLICA_DATA = (  # noqa pylint: disable=invalid-name
+            'set -o pipefail; '
+            f'rm -rf {dump_directory} && mkdir -p {dump_directory} && '
+            f'pg_dumpall -g {connection_args} > {dump_directory}/globals.sql && '
+            f'psql {connection_args} -d postgres -Atc '
+            '"SELECT datname FROM pg_database WHERE datallowconn AND NOT datistemplate" | '
+            'while read -r db; do '
+            f'pg_dump {connection_args} -Fd -Z 0 -j $(nproc) -f "{dump_directory}/$db" "$db" || exit 1; '
+            'done')
+        # the roles of the globals already exist in the passive container, so only a failure of
+        # psql itself stops the import. Every database is restored and the script fails if any did not
         self.DOCKER_IMPORT_REPLICA_DATA_FROM_SHARE = (  # noqa pylint: disable=invalid-name
-            f"gunzip -c {self.DOCKER_REPLICA_MOUNT_FOLDER}/replica_dump.gz"
-            f" | psql -p {self._credentials.port} -U {self._credentials.user}")
+            f'psql -q {connection_args} -d postgres -f {dump_directory}/globals.sql > /dev/null || exit $?; '
+            'status=0; '
+            f'for dump in {dump_directory}/*/; do '
+            'db=$(basename "$dump"); '
+            f'{{ createdb {connection_args} "$db" 2> /dev/null || '
+            f'psql {connection_args} -d postgres -Atc "SELECT datname FROM pg_database" | grep -qxF "$db"; }} && '
+            f'pg_restore {connection_args} -j $(nproc) --clean --if-exists -d "$db" "$dump" || status=1; '
+            f'done; rm -rf {dump_directory}; exit $status')
 
     @staticmethod
     def _create_snowshu_schema_statement() -> str:
@@ -246,10 +343,32 @@ class PostgresAdapter(BaseTargetAdapter):
             f'Acquired {len(relations)} total relations from database {quoted_database}.')
         return relations
 
+    @staticmethod
     @overrides
-    def load_data_into_relation(self, relation: "Relation", data: Optional[DataFrame]) -> None:
+    def _load_type(sqlalchemy_type):
+        return JSONText() if isinstance(sqlalchemy_type, JSON) else sqlalchemy_type
+
+    @overrides
+    def load_data_into_relation(self,
+                                relation: "Relation",
+                                data: Optional[DataFrame],
+                                if_exists: str = 'replace') -> None:
+        if self.unlogged_tables and if_exists == 'replace':
+            self._create_unlogged_relation(relation, data if data is not None else relation.data)
+            if_exists = 'append'
         try:
-            return super().load_data_into_relation(relation, data)
+            return super().load_data_into_relation(relation, data, if_exists)
+        except sqlalchemy.exc.DataError as exc:
+            if 'invalid input syntax for type json' in str(exc):
+                logger.warning("Invalid JSON found in %s. "
+                               "Replacing invalid values with NULL and trying again",
+                               self.quoted_dot_notation(relation))
+                fixed_data = self.replace_invalid_json_values(relation, data if data is not None else relation.data)
+                logger.info("Retrying data load for %s",
+                            self.quoted_dot_notation(relation))
+                return super().load_data_into_relation(relation, fixed_data, if_exists)
+
+            raise exc
         except ValueError as exc:
             if 'cannot contain NUL' in str(exc):
                 logger.warning("Invalid 0x00 char found in %s. "
@@ -258,10 +377,85 @@ class PostgresAdapter(BaseTargetAdapter):
                 fixed_data = self.replace_x00_values(data)
                 logger.info("Retrying data load for %s",
                             self.quoted_dot_notation(relation))
-                return super().load_data_into_relation(relation, fixed_data)
+                return super().load_data_into_relation(relation, fixed_data, if_exists)
 
             raise exc
 
+    def _identifier(self, name: str) -> str:
+        # always quoted, loaded relations are created with sqlalchemy which quotes mixed case names
+        return '"{}"'.format(self._correct_case(name).replace('"', '""'))  # noqa pylint: disable=consider-using-f-string
+
+    def _relation_table(self, relation: "Relation") -> str:
+        return '.'.join(self._identifier(name) for name in (relation.schema, relation.name,))
+
+    def _create_unlogged_relation(self, relation: "Relation", data: DataFrame) -> None:
+        """Creates the relation as an empty UNLOGGED table, so loading it skips the WAL.
+        Switching an empty table to UNLOGGED does not rewrite any data."""
+        super().load_data_into_relation(relation, data.iloc[:0], 'replace')
+        engine = self.get_connection(database_override=self.quoted(self._correct_case(relation.database)),
+                                     schema_override=self.quoted(self._correct_case(relation.schema)))
+        engine.execute(f'ALTER TABLE {self._relation_table(relation)} SET UNLOGGED')
+        self._unlogged_relations.append(relation)
+
+    @overrides
+    def set_relations_logged(self) -> None:
+        """Switches the relations loaded as UNLOGGED tables to LOGGED, one batch per database.
+
+        pg_dump keeps tables UNLOGGED and Postgres truncates UNLOGGED tables after a crash,
+        so this has to run before the replica data is copied and the containers are committed.
+        """
+        by_database = dict()
+        for relation in self._unlogged_relations:
+            by_database.setdefault(self.quoted(self._correct_case(relation.database)), set()).add(
+                self._relation_table(relation))
+        for database, tables in by_database.items():
+            logger.info('Setting %s relations in %s to LOGGED...', len(tables), database)
+            start_time = time.time()
+            conn = self.get_connection(database_override=database)
+            conn.execute(' '.join(f'ALTER TABLE {table} SET LOGGED;' for table in sorted(tables)))
+            logger.info('Relations in %s set to LOGGED in %s.', database, duration(start_time))
+        self._unlogged_relations = list()
+
+    @overrides
+    def create_relationship_indexes(self,
+                                    relation_attributes: Dict[Relation, Set[str]],
+                                    threads: int) -> None:
+        def index_relation(relation: Relation, attributes: Set[str]) -> None:
+            columns = {attr.name.lower(): attr.name for attr in relation.attributes}
+            table = self._relation_table(relation)
+            conn = self.get_connection(database_override=self.quoted(self._correct_case(relation.database)))
+            for attribute in sorted(attributes):
+                if attribute.lower() not in columns:
+                    logger.warning('%s has no attribute %s, skipping its index.',
+                                   self.quoted_dot_notation(relation), attribute)
+                    continue
+                column = self._identifier(columns[attribute.lower()])
+                try:
+                    conn.execute(f'CREATE INDEX ON {table} ({column})')
+                except sqlalchemy.exc.SQLAlchemyError as exc:
+                    logger.warning('Failed to index %s on %s: %s',
+                                   self.quoted_dot_notation(relation), column, exc)
+            conn.execute(f'ANALYZE {table}')
+
+        logger.info('Indexing relationship attributes of %s relations...', len(relation_attributes))
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = [executor.submit(index_relation, relation, attributes)
+                       for relation, attributes in relation_attributes.items()]
+        for future in futures:
+            future.result()
+        logger.info('Relationship attributes indexed in %s.', duration(start_time))
+
+    @staticmethod
+    def replace_invalid_json_values(relation: "Relation", data: DataFrame) -> DataFrame:
+        """decodes the JSON columns of data, reporting and nulling each invalid value."""
+        json_columns = {correct_case(attr.name, False) for attr in relation.attributes
+                        if isinstance(attr.data_type.sqlalchemy_type, JSON)}
+        for col in data.columns:
+            if correct_case(col, False) in json_columns:
+                data[col] = decode_json_column(data[col], f"{relation.dot_notation}.{col}")
+        return data
+
     def replace_x00_values(self, data: DataFrame) -> DataFrame:
         for col, col_type in data.dtypes.items():
             # str types are put into object type columns
@@ -289,7 +483,8 @@ class PostgresAdapter(BaseTargetAdapter):
     def image_initialize_bash_commands(self) -> List[str]:
         # install extra postgres extension packages here
         commands = [
-            f'apt-get update && apt-get install -y {" ".join(self.PRELOADED_PACKAGES)}']
+            f'apt-get update && apt-get install -y {" ".join(self.PRELOADED_PACKAGES)} '
+            '&& rm -rf /var/lib/apt/lists/*']
         return commands
 
     def initialize_replica(self,
@@ -401,11 +596,80 @@ AS
                     statement_runner(f'IMPORT FOREIGN SCHEMA {schema} FROM SERVER '
                                      f'{schema_database} INTO {schema_database}__{schema}')
 
+    def vacuum_container(self, container) -> None:
+        """Runs VACUUM (FREEZE, ANALYZE) over all databases of a container, in parallel
+        over the cores of the container. Replicas then start with planner statistics and
+        frozen pages instead of paying for them on first use."""
+        if not self.vacuum_freeze:
+            return
+        logger.info('Vacuuming and analyzing container %s...', container.name)
+        start_time = time.time()
+        result = container.exec_run(f"/bin/bash -c '{self.DOCKER_VACUUM_COMMAND}'")
+        if result.exit_code != 0:
+            logger.warning('Failed to vacuum container %s: %s', container.name, result.output)
+            return
+        logger.info('Container %s vacuumed and analyzed in %s.', container.name, duration(start_time))
+
+    @staticmethod
+    def _control_data(container) -> dict:
+        """Reads the pg_controldata fields of the data directory of a running container."""
+        output = container.exec_run(f'pg_controldata -D /{DOCKER_REMOUNT_DIRECTORY}').output
+        return dict(tuple(part.strip() for part in line.split(':', 1))
+                    for line in output.decode('utf-8').splitlines() if ':' in line)
+
+    def _copy_data_directory(self) -> bool:
+        """Copies the data directory of the active container into the passive one.
+
+        The files of the data directory are the same across architectures as long as the
+        binary layout settings reported by pg_controldata match, which is checked with both
+        containers' own binaries first. The active container is checkpointed and shut down
+        cleanly before the copy so the passive one starts without recovery. The passive
+        container's own data directory is emptied before the copy, so none of its files
+        are left next to the copied ones.
+
+        Returns:
+            True if the data was copied, False if the containers are not compatible. The
+            active container is running again in that case.
+        """
+        active_control = self._control_data(self.container)
+        self.container.exec_run(self.DOCKER_CHECKPOINT_COMMAND)
+        self.container.stop(timeout=self.DOCKER_STOP_TIMEOUT)
+
+        self.passive_container.start()
+        self.wait_until_ready()
+        passive_control = self._control_data(self.passive_container)
+        mismatched = [field for field in self.PHYSICAL_COPY_CONTROL_FIELDS
+                      if active_control.get(field) != passive_control.get(field)]
+        self.passive_container.stop(timeout=self.DOCKER_STOP_TIMEOUT)
+        if mismatched:
+            logger.warning('Data directories of %s and %s are not compatible (%s differ), '
+                           'falling back to dump and restore.',
+                           self.container.name, self.passive_container.name, ', '.join(mismatched))
+            self.container.start()
+            self.wait_until_ready()
+            return False
+
+        logger.info('Copying data directory of %s into %s...', self.container.name, self.passive_container.name)
+        start_time = time.time()
+        self.shdocker.copy_container_directory(self.container,
+                                               self.passive_container,
+                                               f'/{DOCKER_REMOUNT_DIRECTORY}')
+        self.passive_container.start()
+        self.wait_until_ready()
+        logger.info('Data directory copied in %s.', duration(start_time))
+        return True
+
     def copy_replica_data(self) -> Tuple[bool, str]:
+        self.vacuum_container(self.container)
         if self.passive_container:
+            if self.physical_copy and self._copy_data_directory():
+                return [0]
+
             # Dump from active to shared volume
             status = self.container.exec_run(
                 f"/bin/bash -c '{self.DOCKER_SHARE_REPLICA_DATA}'", tty=True)
+            if status[0] != 0:
+                return status
 
             # Load dump from shared volume to passive
             self.container.stop()
@@ -413,21 +677,74 @@ AS
             logger.info('Copying replica data into passive container')
 
             # Wait for db init
-            for _ in range(1200):  # for 10 minutes
-                if self.passive_container.exec_run(self.DOCKER_READY_COMMAND).exit_code == 0:
-                    break
-                time.sleep(.5)
-            else:
-                raise UnableToStartPostgres(
-                    'Unable to verify that postgres has started, aborting due to timeout')
+            self.wait_until_ready()
 
-            self.passive_container.exec_run(
+            import_status = self.passive_container.exec_run(
                 f"/bin/bash -c '{self.DOCKER_IMPORT_REPLICA_DATA_FROM_SHARE}'", tty=True)
+            if import_status[0] != 0:
+                return import_status
+            # the restored data has no statistics and is not frozen
+            self.vacuum_container(self.passive_container)
             return status
 
         logger.info('Build is single arch, skipping copy...')
         return [0]
 
+    def _compact_container(self, container) -> None:
+        if not self.compact_replica:
+            result = container.exec_run(self.DOCKER_CHECKPOINT_COMMAND)
+            if result.exit_code != 0:
+                logger.warning('Failed to checkpoint container %s: %s', container.name, result.output)
+            return
+        size_before = self.shdocker.container_size(container)
+        result = container.exec_run(['/bin/bash', '-c', self.DOCKER_COMPACT_COMMAND])
+        container.stop(timeout=self.DOCKER_STOP_TIMEOUT)
+        if result.exit_code != 0:
+            logger.warning('Failed to compact container %s: %s', container.name, result.output)
+            return
+        container.reload()
+        if container.attrs['State']['ExitCode'] != 0:
+            logger.warning('Container %s did not shut down cleanly, keeping its WAL segments.', container.name)
+            return
+        current = result.output.decode('utf-8').split()[-1]
+
+        def is_needed(name: str) -> bool:
+            # segment names sort in WAL order, anything that is not a segment is kept
+            return not self.WAL_SEGMENT_PATTERN.fullmatch(name) or name >= current
+
+        removed = self.shdocker.prune_container_directory(container,
+                                                          f'/{DOCKER_REMOUNT_DIRECTORY}/pg_wal',
+                                                          is_needed)
+        logger.info('Compacted container %s from %.1f MB to %.1f MB, removed %d WAL segments.',
+                    container.name,
+                    size_before / 1024 / 1024,
+                    self.shdocker.container_size(container) / 1024 / 1024,
+                    removed)
+
+    @overrides
+    def finalize_replica(self) -> None:
+        """ Compacts the containers before they are committed. The temp files the replica
+            does not need are removed, the database is shut down cleanly so the replicas
+            start without recovery, and the WAL segments before the shutdown checkpoint
+            are removed from the stopped container
+        """
+        containers = [container for container in (self.container, self.passive_container,)
+                      if container is not None]
+        for container in containers:
+            container.reload()
+            if container.status != 'running':
+                if not self.compact_replica:
+                    # stopped containers were checkpointed by their clean shutdown
+                    continue
+                # only one container can publish the target port at a time
+                for other in containers:
+                    if other is not container:
+                        other.stop(timeout=self.DOCKER_STOP_TIMEOUT)
+                container.start()
+                self.wait_until_ready()
+            self._compact_container(container)
+        super().finalize_replica()
+
     @staticmethod
     def is_fdw_schema(schema, unique_databases) -> bool:
         splitted = schema.split('__')
@@ -8,8 +8,21 @@ PACKAGE_ROOT = Path().parent.absolute()
 MAX_ALLOWED_DATABASES = 2000
 MAX_ALLOWED_ROWS = 1000000
 DEFAULT_MAX_NUMBER_OF_OUTLIERS = 100
+INLINE_KEY_SET_LIMIT = 1000
+SEMI_JOIN_KEY_SET_LIMIT = 100000
+SYSTEM_SAMPLING_THRESHOLD = 100000000
+SYSTEM_SAMPLING_OVERDRAW = 1.1
+STRATIFIED_MAX_STRATA = 1000
+DEFAULT_MAX_RESAMPLE_ITERATIONS = 2
+DEFAULT_RESAMPLE_BUDGET = 1.0
+MAX_RESAMPLE_FACTOR = 10
+DEFAULT_SAMPLE_CACHE_DIRECTORY = os.path.join(Path.home(), '.snowshu', 'sample_cache')
+DEFAULT_SAMPLE_CACHE_MAX_SIZE = 10240  # in megabytes
+DEFAULT_SAMPLE_CACHE_MAX_AGE = 30  # in days
 DEFAULT_PRESERVE_CASE = False
 DEFAULT_INSERT_CHUNK_SIZE = 50000
+DEFAULT_MEMORY_BUDGET = 0  # in megabytes, 0 for no limit
+IN_MEMORY_BYTES_FACTOR = 5  # dataframes take several times the compressed source size
 DEFAULT_THREAD_COUNT = 4
 DEFAULT_RETRY_COUNT = 1
 DOCKER_NETWORK = 'snowshu'
@@ -18,6 +31,10 @@ DOCKER_REMOUNT_DIRECTORY = 'snowshu_replica_data'
 DOCKER_TARGET_PORT = 9999
 DOCKER_WORKING_DIR = Path('/app').as_posix()
 DOCKER_API_TIMEOUT = 600  # in seconds, default is 60 which causes issues
+DOCKER_READY_TIMEOUT = 600  # in seconds
+DOCKER_READY_INITIAL_BACKOFF = 0.05  # in seconds, doubled after every failed probe
+DOCKER_READY_MAX_BACKOFF = 1  # in seconds
+REPLICA_HEALTHCHECK_OPTIONS = '--interval=5s --timeout=5s --start-period=10s --retries=3'
 POSTGRES_IMAGE = 'postgres:12'
 DEFAULT_TEMPORARY_DATABASE = 'SNOWSHU'
 
@@ -74,3 +91,5 @@ DOCKER_REPLICA_MOUNT_FOLDER = os.path.join(os.path.sep,
                                            DOCKER_SHARED_FOLDER_NAME)
 
 DOCKER_REPLICA_VOLUME = 'snowshu_container_share'
+DOCKER_BASE_IMAGE_REPOSITORY = 'snowshu_target_base'
+DOCKER_WARM_CONTAINER_PREFIX = 'snowshu_warm'
@@ -5,19 +5,40 @@ import networkx
 
 from snowshu.adapters.source_adapters.base_source_adapter import \
     BaseSourceAdapter
+from snowshu.configs import INLINE_KEY_SET_LIMIT, SEMI_JOIN_KEY_SET_LIMIT
 from snowshu.core.models import Relation
+from snowshu.core.models import predicate_strategies as ps
+from snowshu.core.models.predicate_strategies import PredicateStrategy
 
 logger = logging.getLogger(__name__)
 
 
 class RuntimeSourceCompiler:
 
+    @staticmethod
+    def choose_predicate_strategy(cardinality: int) -> PredicateStrategy:
+        """ Picks how a key set is pushed down into a downstream predicate
+
+            Args:
+                cardinality (int): the number of distinct keys in the key set
+
+            Returns:
+                PredicateStrategy: INLINE for small key sets, SEMI_JOIN for medium ones
+                    and EXISTS for large ones
+        """
+        if cardinality <= INLINE_KEY_SET_LIMIT:
+            return ps.INLINE
+        if cardinality <= SEMI_JOIN_KEY_SET_LIMIT:
+            return ps.SEMI_JOIN
+        return ps.EXISTS
+
     # TODO breakout edge logic into edgetype/direction handling functions
     @staticmethod
-    def compile_queries_for_relation(relation: Relation,  # pylint: disable=too-many-locals, too-many-branches
+    def compile_queries_for_relation(relation: Relation,  # pylint: disable=too-many-locals, too-many-branches, too-many-statements
                                      dag: networkx.Graph,
                                      source_adapter: Type[BaseSourceAdapter],
-                                     analyze: bool) -> Relation:
+                                     analyze: bool,
+                                     upstream_materialized: bool = True) -> Relation:
         """ Generates the sql statements for the given relation
 
             Args:
@@ -25,6 +46,8 @@ class RuntimeSourceCompiler:
                 dag (Graph): the connected dependency graph that contains the relation
                 source_adapter (BaseSourceAdapter): the source adapter for the sql dialect
                 analyze (bool): whether to generate sql statements for analyze or actaul sampling
+                upstream_materialized (bool): whether the upstream samples already exist in the source,
+                    if not the constraints are compiled without querying them
 
             Returns:
                 Relation: the given relation with `compiled_query` populated
@@ -38,27 +61,38 @@ class RuntimeSourceCompiler:
         else:
             do_not_sample = False
             predicates = list()
-            unions = list()
+            outlier_constraints = list()
             polymorphic_predicates = list()
+            polymorphic_types = list()
+            strategies = list()
+            adaptive_predicates = relation.adaptive_predicates and not analyze and upstream_materialized
             for child in dag.successors(relation):
                 # parallel edges are supported
                 edges_num = dag.number_of_edges(relation, child)
                 for key in range(0, edges_num):
                     edge = dag.edges[relation, child, key]
                     if edge['direction'] == 'bidirectional':
-                        predicates.append(source_adapter.upstream_constraint_statement(child,
-                                                                                       edge['remote_attribute'],
-                                                                                       edge['local_attribute']))
+                        if adaptive_predicates:
+                            # the downstream key set is the full population, so it is always large
+                            strategy = ps.EXISTS
+                            strategies.append(f"{child.dot_notation}.{edge['remote_attribute']} -> "
+                                              f"{relation.dot_notation}.{edge['local_attribute']}: "
+                                              f"{strategy} (full population)")
+                            predicates.append(source_adapter.upstream_constraint_statement(child,
+                                                                                           edge['remote_attribute'],
+                                                                                           edge['local_attribute'],
+                                                                                           strategy,
+                                                                                           relation))
+                        else:
+                            predicates.append(source_adapter.upstream_constraint_statement(child,
+                                                                                           edge['remote_attribute'],
+                                                                                           edge['local_attribute']))
                     if relation.include_outliers and edge['direction'] == 'polymorphic':
                         logger.warning("Polymorphic relationships currently do not support including outliers. "
                                        "Ignoring include_outliers flag for edge "
                                        f"from {relation.dot_notation} to {child.dot_notation}. ")
                     elif relation.include_outliers:
-                        unions.append(source_adapter.union_constraint_statement(relation,
-                                                                                child,
-                                                                                edge['remote_attribute'],
-                                                                                edge['local_attribute'],
-                                                                                relation.max_number_of_outliers))
+                        outlier_constraints.append((child, edge['remote_attribute'], edge['local_attribute'],))
 
             for parent in dag.predecessors(relation):
                 edges_num = dag.number_of_edges(parent, relation)
@@ -67,53 +101,88 @@ class RuntimeSourceCompiler:
                     # if any incoming edge is bidirectional or polymorphic set do_not_sample flag
                     # do_not_sample is set since those types are most likely already restricted
                     do_not_sample = (edge['direction'] in ('polymorphic',) or do_not_sample)
+                    strategy_args = tuple()
+                    if not (analyze or upstream_materialized):
+                        # the parent sample does not exist yet so the key set can not be validated
+                        strategy_args = (ps.SEMI_JOIN, relation,)
+                    elif adaptive_predicates:
+                        cardinality = source_adapter.key_set_cardinality(parent,
+                                                                         edge['remote_attribute'],
+                                                                         parent.materialize_key_tables)
+                        strategy = RuntimeSourceCompiler.choose_predicate_strategy(cardinality)
+                        strategies.append(f"{parent.dot_notation}.{edge['remote_attribute']} -> "
+                                          f"{relation.dot_notation}.{edge['local_attribute']}: "
+                                          f"{strategy} ({cardinality} keys)")
+                        strategy_args = (strategy, relation,)
                     if edge['direction'] == 'polymorphic':
                         # if the local type attribute is set, the constraint needs to account for it
                         # otherwise we only need the normal predicate constraint
                         if 'local_type_attribute' in edge:
                             local_type_override = edge['local_type_overrides'].get(parent.dot_notation, None)
+                            # union branches compare an overridden type as is so each branch can be pruned
+                            exact_type_match = relation.polymorphic_union_branches
+                            polymorphic_types.append(
+                                source_adapter.polymorphic_type_match_value(parent, local_type_override).lower())
                             polymorphic_predicates.append(
                                 source_adapter.polymorphic_constraint_statement(parent,
                                                                                 analyze,
                                                                                 edge['local_attribute'],
                                                                                 edge['remote_attribute'],
                                                                                 edge['local_type_attribute'],
-                                                                                local_type_override))
+                                                                                local_type_override,
+                                                                                parent.materialize_key_tables,
+                                                                                *strategy_args,
+                                                                                exact_type_match=exact_type_match))
                         else:
+                            polymorphic_types.append(None)
                             polymorphic_predicates.append(
                                 source_adapter.predicate_constraint_statement(parent,
                                                                               analyze,
                                                                               edge['local_attribute'],
-                                                                              edge['remote_attribute']))
+                                                                              edge['remote_attribute'],
+                                                                              parent.materialize_key_tables,
+                                                                              *strategy_args))
                     else:
                         predicates.append(source_adapter.predicate_constraint_statement(parent,
                                                                                         analyze,
                                                                                         edge['local_attribute'],
-                                                                                        edge['remote_attribute']))
+                                                                                        edge['remote_attribute'],
+                                                                                        parent.materialize_key_tables,
+                                                                                        *strategy_args))
                     if relation.include_outliers and edge['direction'] == 'polymorphic':
                         logger.warning("Polymorphic relationships currently do not support including outliers. "
                                        "Ignoring include_outliers flag for edge "
                                        f"from {parent.dot_notation} to {relation.dot_notation}. ")
                     elif relation.include_outliers:
-                        unions.append(source_adapter.union_constraint_statement(relation,
-                                                                                parent,
-                                                                                edge['local_attribute'],
-                                                                                edge['remote_attribute'],
-                                                                                relation.max_number_of_outliers))
+                        outlier_constraints.append((parent, edge['local_attribute'], edge['remote_attribute'],))
+            relation.predicate_strategies = tuple(strategies)
 
+            # union branches are only used when there is more than one polymorphic parent
+            union_branches = relation.polymorphic_union_branches and len(polymorphic_predicates) > 1
             # if polymorphic predicates are set up, then generate the or predicate
-            if polymorphic_predicates:
+            if polymorphic_predicates and not union_branches:
                 full_polymorphic_predicate = " OR ".join(polymorphic_predicates)
                 predicates.append(f"( {full_polymorphic_predicate} )")
 
             query = source_adapter.sample_statement_from_relation(
-                relation, (None if predicates else relation.sampling.sample_method))
-            if predicates:
+                relation, (None if predicates or union_branches else relation.sampling.sample_method))
+            if union_branches:
+                # one branch per polymorphic parent so each type equality is pruned on its own,
+                # branches can only overlap when a type is missing or shared between parents
+                may_overlap = None in polymorphic_types or len(set(polymorphic_types)) < len(polymorphic_types)
+                branches = [query + " WHERE " + ' AND '.join(predicates + [polymorphic_predicate])
+                            for polymorphic_predicate in polymorphic_predicates]
+                query = (" UNION " if may_overlap else " UNION ALL ").join(branches)
+            elif predicates:
                 query += " WHERE " + ' AND '.join(predicates)
+            if predicates or union_branches:
                 query = source_adapter.directionally_wrap_statement(
                     query, relation, (None if do_not_sample else relation.sampling.sample_method))
-            if unions:
-                query += " UNION ".join([''] + unions)
+            if outlier_constraints:
+                # a single anti-join per relation covers the outliers of every edge
+                query += " UNION " + source_adapter.outliers_union_statement(relation,
+                                                                             outlier_constraints,
+                                                                             relation.max_number_of_outliers)
 
         relation.core_query = query
 
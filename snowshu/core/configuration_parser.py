@@ -11,7 +11,12 @@ import yaml
 from jsonschema.exceptions import ValidationError
 
 from snowshu.configs import (DEFAULT_MAX_NUMBER_OF_OUTLIERS,
-                             DEFAULT_PRESERVE_CASE, DEFAULT_THREAD_COUNT)
+                             DEFAULT_MAX_RESAMPLE_ITERATIONS,
+                             DEFAULT_MEMORY_BUDGET,
+                             DEFAULT_PRESERVE_CASE, DEFAULT_RESAMPLE_BUDGET,
+                             DEFAULT_SAMPLE_CACHE_MAX_AGE,
+                             DEFAULT_SAMPLE_CACHE_MAX_SIZE,
+                             DEFAULT_THREAD_COUNT)
 from snowshu.core.models import Credentials, materializations
 from snowshu.core.samplings.utils import get_sampling_from_partial
 from snowshu.core.utils import correct_case, fetch_adapter
@@ -102,6 +107,18 @@ class Configuration:  # noqa pylint: disable=too-many-instance-attributes
     max_number_of_outliers: int
     general_relations: List[MatchPattern]
     specified_relations: List[SpecifiedMatchPattern]
+    materialize_key_tables: bool = False
+    adaptive_predicates: bool = False
+    polymorphic_union_branches: bool = False
+    component_scripts: bool = False
+    adaptive_sample_sizing: bool = False
+    max_resample_iterations: int = DEFAULT_MAX_RESAMPLE_ITERATIONS
+    resample_budget: float = DEFAULT_RESAMPLE_BUDGET
+    sample_cache: bool = False
+    sample_cache_max_size: int = DEFAULT_SAMPLE_CACHE_MAX_SIZE
+    sample_cache_max_age: int = DEFAULT_SAMPLE_CACHE_MAX_AGE
+    memory_budget: int = DEFAULT_MEMORY_BUDGET
+    relationship_indexes: bool = False
 
 
 class ConfigurationParser:
@@ -236,6 +253,54 @@ class ConfigurationParser:
             loaded['source'],
             'max_number_of_outliers',
             DEFAULT_MAX_NUMBER_OF_OUTLIERS)
+        self._set_default(
+            loaded['source'],
+            'materialize_key_tables',
+            False)
+        self._set_default(
+            loaded['source'],
+            'adaptive_predicates',
+            False)
+        self._set_default(
+            loaded['source'],
+            'polymorphic_union_branches',
+            False)
+        self._set_default(
+            loaded['source'],
+            'component_scripts',
+            False)
+        self._set_default(
+            loaded['source'],
+            'adaptive_sample_sizing',
+            False)
+        self._set_default(
+            loaded['source'],
+            'max_resample_iterations',
+            DEFAULT_MAX_RESAMPLE_ITERATIONS)
+        self._set_default(
+            loaded['source'],
+            'resample_budget',
+            DEFAULT_RESAMPLE_BUDGET)
+        self._set_default(
+            loaded['source'],
+            'sample_cache',
+            False)
+        self._set_default(
+            loaded['source'],
+            'sample_cache_max_size',
+            DEFAULT_SAMPLE_CACHE_MAX_SIZE)
+        self._set_default(
+            loaded['source'],
+            'sample_cache_max_age',
+            DEFAULT_SAMPLE_CACHE_MAX_AGE)
+        self._set_default(
+            loaded['source'],
+            'memory_budget',
+            DEFAULT_MEMORY_BUDGET)
+        self._set_default(
+            loaded['source'],
+            'relationship_indexes',
+            False)
 
         try:
             replica_base = (loaded['name'],
@@ -257,7 +322,19 @@ class ConfigurationParser:
 
             return Configuration(*replica_base,
                                  general_relations,
-                                 specified_relations)
+                                 specified_relations,
+                                 materialize_key_tables=loaded['source']['materialize_key_tables'],
+                                 adaptive_predicates=loaded['source']['adaptive_predicates'],
+                                 polymorphic_union_branches=loaded['source']['polymorphic_union_branches'],
+                                 component_scripts=loaded['source']['component_scripts'],
+                                 adaptive_sample_sizing=loaded['source']['adaptive_sample_sizing'],
+                                 max_resample_iterations=loaded['source']['max_resample_iterations'],
+                                 resample_budget=loaded['source']['resample_budget'],
+                                 sample_cache=loaded['source']['sample_cache'],
+                                 sample_cache_max_size=loaded['source']['sample_cache_max_size'],
+                                 sample_cache_max_age=loaded['source']['sample_cache_max_age'],
+                                 memory_budget=loaded['source']['memory_budget'],
+                                 relationship_indexes=loaded['source']['relationship_indexes'])
         except KeyError as err:
             message = f"Configuration missing required section: {err}."
             logger.critical(message)
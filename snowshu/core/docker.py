@@ -1,21 +1,32 @@
 from __future__ import annotations
 
+import hashlib
+import io
+import json
+import posixpath
 import re
-from typing import TYPE_CHECKING, List, Type, Dict
+import shlex
+import tarfile
+import tempfile
+from typing import TYPE_CHECKING, Callable, Iterable, List, Type, Dict
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import docker
 
 from snowshu.configs import (
+    DOCKER_BASE_IMAGE_REPOSITORY,
     DOCKER_NETWORK,
     DOCKER_REPLICA_MOUNT_FOLDER,
     Architecture,
     DOCKER_WORKING_DIR,
     DOCKER_REPLICA_VOLUME,
     DOCKER_API_TIMEOUT,
+    DOCKER_WARM_CONTAINER_PREFIX,
     LOCAL_ARCHITECTURE,
+    REPLICA_HEALTHCHECK_OPTIONS,
 )
-from snowshu.core.utils import get_multiarch_list
+from snowshu.core.utils import generate_unique_uuid, get_multiarch_list
 
 if TYPE_CHECKING:
     from snowshu.adapters.target_adapters.base_target_adapter import BaseTargetAdapter
@@ -23,6 +34,28 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
+class _ArchiveStream(io.RawIOBase):
+    """reads the chunks of a container archive as a file, so it can be untarred as it streams"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._chunk:
+            try:
+                self._chunk = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
 class SnowShuDocker:
 
     def __init__(self):
@@ -41,10 +74,18 @@ class SnowShuDocker:
             self,
             replica_name: str,
             active_container: docker.models.containers.Container,
-            passive_container: docker.models.containers.Container) -> list[docker.models.images.Image]:
+            passive_container: docker.models.containers.Container,
+            start_command: str = None,
+            healthcheck_command: str = None,
+            squash: bool = False) -> list[docker.models.images.Image]:
         """coerces a live container into a replica image and returns the image.
 
         replica_name: the name of the new replica
+        start_command: if set, the command replica containers start with, replaces the
+            command the build container was started with
+        healthcheck_command: if set, baked into the replicas as their HEALTHCHECK
+        squash: if set, the local arch replica is flattened into a single layer. Replicas
+            then no longer share the layers of the target database image
 
         return: [replica_image_from_active,
                  replica_image_from_passive(skipped if no passive),
@@ -67,8 +108,20 @@ class SnowShuDocker:
             container_arch = container.name.split('_')[-1]
 
             # commit with arch tag
+            changes = []
+            if start_command:
+                changes.append(f'CMD {json.dumps(shlex.split(start_command))}')
+            if healthcheck_command:
+                changes.append(f'HEALTHCHECK {REPLICA_HEALTHCHECK_OPTIONS} CMD {healthcheck_command}')
             replica = container.commit(
-                repository=new_replica_name, tag=container_arch)
+                repository=new_replica_name, tag=container_arch, changes=changes or None)
+            logger.info(f'Replica image {replica.tags[0]} is {self._megabytes(replica.attrs["Size"])}.')
+            if squash:
+                if container_arch == LOCAL_ARCHITECTURE.value:
+                    replica = self._squash_image(container, replica, changes)
+                else:
+                    # images imported by the daemon take the local arch
+                    logger.info(f'Not squashing non-native replica image {replica.tags[0]}.')
             replica_list.append(replica)
 
             logger.info(
@@ -86,11 +139,255 @@ class SnowShuDocker:
 
         return actual_replica_list
 
-    def startup(self,  # noqa pylint: disable=too-many-locals, too-many-branches, too-many-statements
+    @staticmethod
+    def _megabytes(size: int) -> str:
+        return f'{size / 1024 / 1024:.1f} MB'
+
+    def container_size(self, container: docker.models.containers.Container) -> int:
+        """returns the size in bytes of the files a container wrote on top of its image."""
+        return self.client.api.containers(all=True,
+                                          size=True,
+                                          filters=dict(id=container.id))[0].get('SizeRw', 0)
+
+    def _squash_image(self,
+                      container: docker.models.containers.Container,
+                      image: docker.models.images.Image,
+                      changes: List[str]) -> docker.models.images.Image:
+        """flattens the filesystem of a stopped container into a single layer image
+        that replaces image, keeping the image config."""
+        config = image.attrs['Config']
+        squash_changes = [f'ENV {name}={json.dumps(value)}'
+                          for name, value in (env.split('=', 1) for env in config.get('Env') or [])]
+        squash_changes += [f'LABEL {name}={json.dumps(value)}'
+                           for name, value in (config.get('Labels') or {}).items()]
+        squash_changes += [f'EXPOSE {port}' for port in config.get('ExposedPorts') or {}]
+        for instruction, key in (('ENTRYPOINT', 'Entrypoint',),
+                                 ('CMD', 'Cmd',),
+                                 ('VOLUME', 'Volumes',),):
+            if config.get(key):
+                squash_changes.append(f'{instruction} {json.dumps(list(config[key]))}')
+        for instruction, key in (('WORKDIR', 'WorkingDir',),
+                                 ('USER', 'User',),
+                                 ('STOPSIGNAL', 'StopSignal',),):
+            if config.get(key):
+                squash_changes.append(f'{instruction} {config[key]}')
+        squash_changes += [change for change in changes if change.startswith('HEALTHCHECK')]
+
+        repository, tag = image.tags[0].rsplit(':', 1)
+        logger.info(f'Squashing replica image {image.tags[0]}...')
+        self.client.api.import_image_from_stream(container.export(),
+                                                 repository=repository,
+                                                 tag=tag,
+                                                 changes=squash_changes)
+        squashed = self.client.images.get(image.tags[0])
+        try:
+            self.client.images.remove(image.id)
+        except docker.errors.APIError:
+            pass
+        logger.info(f'Replica image {image.tags[0]} squashed from {self._megabytes(image.attrs["Size"])} '
+                    f'to {self._megabytes(squashed.attrs["Size"])}.')
+        return squashed
+
+    @staticmethod
+    def _clear_container_directory(container: docker.models.containers.Container, path: str) -> None:
+        """empties a directory of a container, which may be stopped, by putting an empty
+        file in its place. Extracting the directory again replaces the file as a whole."""
+        placeholder = io.BytesIO()
+        with tarfile.open(fileobj=placeholder, mode='w') as archive:
+            archive.addfile(tarfile.TarInfo(posixpath.basename(path.rstrip('/'))))
+        container.put_archive(posixpath.dirname(path.rstrip('/')) or '/', placeholder.getvalue())
+
+    @staticmethod
+    def copy_container_directory(source: docker.models.containers.Container,
+                                 target: docker.models.containers.Container,
+                                 path: str) -> None:
+        """streams a directory from one container into the same path of another.
+
+        Both containers may be stopped. The target directory is emptied first, so
+        only the files of the source directory are left in it.
+        """
+        SnowShuDocker._clear_container_directory(target, path)
+        stream, _ = source.get_archive(path)
+        target.put_archive(posixpath.dirname(path.rstrip('/')) or '/', stream)
+
+    @staticmethod
+    def prune_container_directory(container: docker.models.containers.Container,
+                                  path: str,
+                                  keep: Callable[[str], bool]) -> int:
+        """removes the files of a directory of a stopped container that keep() rejects.
+
+        A stopped container cannot run commands, so the directory is streamed out, the
+        rejected files are left out of the archive and the rest is extracted back in
+        place of the emptied directory.
+
+        Args:
+            container: the stopped container.
+            path: the directory to prune.
+            keep: called with the name of each file, returns False for the files to remove.
+        Returns:
+            the number of files removed.
+        """
+        stream, _ = container.get_archive(path)
+        removed = 0
+        with tempfile.TemporaryFile() as pruned:
+            with tarfile.open(fileobj=_ArchiveStream(stream), mode='r|') as source, \
+                    tarfile.open(fileobj=pruned, mode='w') as target:
+                for member in source:
+                    if member.isfile() and not keep(posixpath.basename(member.name)):
+                        removed += 1
+                        continue
+                    target.addfile(member, source.extractfile(member) if member.isfile() else None)
+            pruned.seek(0)
+            SnowShuDocker._clear_container_directory(container, path)
+            container.put_archive(posixpath.dirname(path.rstrip('/')) or '/', pruned)
+        return removed
+
+    def get_or_build_base_image(self,
+                                stock_image: docker.models.images.Image,
+                                target_adapter: Type['BaseTargetAdapter'],
+                                arch: str) -> docker.models.images.Image:
+        """ Finds or builds the target database image of an arch with the setup commands
+            of the target adapter already run, so containers do not need to run them.
+
+            The image is tagged with a digest of the stock image and the setup commands,
+            so it is rebuilt whenever either changes.
+
+            input: the stock target database image of the arch, the target adapter and the arch
+            return: the base image
+        """
+        commands = target_adapter.image_initialize_bash_commands()
+        digest = hashlib.sha256('\n'.join([stock_image.id] + commands).encode('utf-8')).hexdigest()[:12]
+        base_image_name = f'{DOCKER_BASE_IMAGE_REPOSITORY}:{arch}-{digest}'
+        try:
+            image = self.client.images.get(base_image_name)
+            logger.info(f'Found base image {base_image_name}.')
+            return image
+        except docker.errors.ImageNotFound:
+            pass
+
+        logger.info(f'Building base image {base_image_name}...')
+        builder_name = f'{DOCKER_BASE_IMAGE_REPOSITORY}_builder_{arch}'
+        self.remove_container(builder_name)
+        # the stock entrypoint runs anything but postgres as is, so no database is initialized
+        builder = self.client.containers.run(stock_image.id,
+                                             'sleep infinity',
+                                             name=builder_name,
+                                             detach=True)
+        try:
+            self._run_container_setup(builder, target_adapter)
+            repository, tag = base_image_name.split(':')
+            image = builder.commit(repository=repository,
+                                   tag=tag,
+                                   changes=[f'CMD {json.dumps(stock_image.attrs["Config"]["Cmd"])}'])
+        finally:
+            builder.remove(force=True)
+        logger.info(f'Base image {base_image_name} built.')
+        return image
+
+    @staticmethod
+    def _warm_container_prefix(image: docker.models.images.Image,
+                               target_adapter: Type['BaseTargetAdapter'],
+                               arch: str,
+                               envars: list) -> str:
+        # warm containers are only interchangeable if created the same way
+        digest = hashlib.sha256('\n'.join([image.id,
+                                           target_adapter.DOCKER_START_COMMAND,
+                                           target_adapter.credentials.host] + sorted(envars)
+                                          ).encode('utf-8')).hexdigest()[:12]
+        return f'{DOCKER_WARM_CONTAINER_PREFIX}_{arch}_{digest}_'
+
+    def warm_pool(self,  # noqa pylint: disable=too-many-arguments
+                  target_adapter: Type['BaseTargetAdapter'],
+                  source_adapter: str,
+                  arch_list: list[str],
+                  envars: list,
+                  size: int) -> List[docker.models.containers.Container]:
+        """ Tops up the pool of idle target containers of each arch to size.
+
+            Warm containers are created from the base image, started once so the database
+            is initialized, then stopped. Builds claim them instead of creating containers.
+            Warming needs the target port, so it should not run alongside a build.
+
+            return: the containers added to the pool
+        """
+        network = self._get_or_create_network(DOCKER_NETWORK)
+        replica_volume = self._create_snowshu_volume(DOCKER_REPLICA_VOLUME)
+        warmed = []
+        for arch in arch_list:
+            image = self.get_or_build_base_image(self._get_stock_image(target_adapter.DOCKER_IMAGE, arch),
+                                                 target_adapter,
+                                                 arch)
+            prefix = self._warm_container_prefix(image, target_adapter, arch, envars)
+            idle = self.client.containers.list(all=True, filters=dict(name=prefix))
+            for _ in range(size - len(idle)):
+                container = self.create_and_init_container(image=image,
+                                                           container_name=prefix + generate_unique_uuid(False),
+                                                           target_adapter=target_adapter,
+                                                           source_adapter=source_adapter,
+                                                           network=network,
+                                                           replica_volume=replica_volume,
+                                                           envars=envars,
+                                                           run_setup=False)
+                target_adapter.wait_until_ready()
+                container.stop()
+                logger.info(f'Container {container.name} added to the warm pool.')
+                warmed.append(container)
+        return warmed
+
+    def _claim_warm_container(self,  # noqa pylint: disable=too-many-arguments
+                              image: docker.models.images.Image,
+                              target_adapter: Type['BaseTargetAdapter'],
+                              arch: str,
+                              envars: list,
+                              container_name: str,
+                              start: bool = True) -> docker.models.containers.Container:
+        """ Renames an idle container of the warm pool to container_name and starts it,
+            unless start is False.
+
+            return: the claimed container, or None if the pool is empty
+        """
+        prefix = self._warm_container_prefix(image, target_adapter, arch, envars)
+        # the name filter is a regex matched against '/<name>', anchor it to the prefix
+        for container in self.client.containers.list(all=True, filters=dict(name=f'^/{prefix}')):
+            warm_name = container.name
+            try:
+                container.rename(container_name)
+            except docker.errors.APIError:
+                # claimed by a concurrent build
+                continue
+            # refresh the cached attrs so container.name is the claimed name
+            container.reload()
+            logger.info(f'Claimed warm container {warm_name} as {container_name}.')
+            if start:
+                container.start()
+            return container
+        return None
+
+    def _get_stock_image(self, image_name: str, arch: str) -> docker.models.images.Image:
+        try:
+            return self.client.images.get(f'{image_name.split(":")[0]}:{arch}')
+        except docker.errors.ImageNotFound:
+            image = self.client.images.pull(image_name, platform=f'linux/{arch}')
+            image.tag(f'{image_name.split(":")[0]}:{arch}')
+            return image
+
+    def startup(self,  # noqa pylint: disable=too-many-locals, too-many-branches, too-many-statements, too-many-arguments
                 target_adapter: Type['BaseTargetAdapter'],
                 source_adapter: str,
                 arch_list: list[str],
-                envars: list) -> tuple(docker.models.containers.Container):
+                envars: list,
+                wait_for_passive: bool = True) -> tuple(docker.models.containers.Container):
+        """ Starts the active target container and prepares the passive one.
+
+            For multi-arch builds the passive (usually emulated) container is pulled, built
+            and created on a background thread while the active one starts and takes loads.
+            It is left stopped, the active container holds the target port until the copy.
+
+            input: wait_for_passive, if False the passive container is returned as a
+                concurrent.futures.Future that resolves to the container
+            return: the running active container and the stopped passive container,
+                or None for single arch builds
+        """
 
         # Unpack target adapter's data
         image_name = target_adapter.DOCKER_IMAGE
@@ -103,7 +400,6 @@ class SnowShuDocker:
         replica_volume = self._create_snowshu_volume(DOCKER_REPLICA_VOLUME)
 
         logger.info(f'Finding base image {image_name}...')
-        container_list = []
 
         if is_incremental:
             name = self.replica_image_name_to_common_name(image_name)
@@ -121,12 +417,12 @@ class SnowShuDocker:
             # set arch list to always set supplied image as active container, regardless of if it is native
             if len(arch_list) == 2:
                 # If arch_list has exactly two elements, get the multiarch list for the base image architecture
-                arch_list_i = [
+                arch_list = [
                     arch.value for arch in get_multiarch_list(base_image_arch)
                 ]
             else:
                 # Otherwise, use a list containing only the base image architecture
-                arch_list_i = [base_image_arch.value]
+                arch_list = [base_image_arch.value]
 
             # warn user if non-native architecture base was supplied
             if base_image_arch != LOCAL_ARCHITECTURE.value:
@@ -134,7 +430,7 @@ class SnowShuDocker:
                     'Supplied base image is of a non-native architecture,'
                     ' please try to use native for better performance')
 
-            for arch in arch_list_i:
+            def prepare_container(arch: str, start: bool) -> docker.models.containers.Container:
                 try:
                     # Try to retreive supplied image
                     try:
@@ -148,17 +444,16 @@ class SnowShuDocker:
                         logger.info(
                             'Found base image...')
                         image = image_candidate
+                        run_setup = True
                     else:
                         # If supplied image is not of current arch, pull postgres instead
                         logger.info(
                             f'Getting target database image of arch {arch}...')
-                        try:
-                            image = self.client.images.get(
-                                f'{target_adapter.BASE_DB_IMAGE.split(":")[0]}:{arch}')
-                        except docker.errors.ImageNotFound:
-                            image = self.client.images.pull(
-                                target_adapter.BASE_DB_IMAGE, platform=f'linux/{arch}')
-                            image.tag(f'{target_adapter.BASE_DB_IMAGE.split(":")[0]}:{arch}')
+                        image = self.get_or_build_base_image(
+                            self._get_stock_image(target_adapter.BASE_DB_IMAGE, arch),
+                            target_adapter,
+                            arch)
+                        run_setup = False
 
                 except ConnectionError as error:
                     logger.error(
@@ -166,34 +461,24 @@ class SnowShuDocker:
                     raise
 
                 tagged_container_name = f'{name}_{arch}'
-                logger.info(
-                    f"Creating stopped container {tagged_container_name}...")
                 self.remove_container(tagged_container_name)
 
-                container = self.create_and_init_container(
+                return self.create_and_init_container(
                     image=image,
                     container_name=tagged_container_name,
                     target_adapter=target_adapter,
                     source_adapter=source_adapter,
                     network=network,
                     replica_volume=replica_volume,
-                    envars=envars
+                    envars=envars,
+                    run_setup=run_setup,
+                    start=start
                 )
-
-                if len(arch_list) > 1:
-                    container.stop()
-                container_list.append(container)
         else:
-            for arch in arch_list:
+            def prepare_container(arch: str, start: bool) -> docker.models.containers.Container:
                 try:
                     # This pulls raw postgres for regular full build
-                    try:
-                        image = self.client.images.get(
-                            f'{target_adapter.DOCKER_IMAGE.split(":")[0]}:{arch}')
-                    except docker.errors.ImageNotFound:
-                        image = self.client.images.pull(
-                            target_adapter.DOCKER_IMAGE, platform=f'linux/{arch}')
-                        image.tag(f'{target_adapter.DOCKER_IMAGE.split(":")[0]}:{arch}')
+                    image = self._get_stock_image(target_adapter.DOCKER_IMAGE, arch)
 
                     # verify the image is tagged properly (image's arch matches its tag)
                     try:
@@ -202,38 +487,60 @@ class SnowShuDocker:
                         logger.warning('Image tags do not match their actual architecture, '
                                        'retag or delete postgres images manually to correct')
 
+                    image = self.get_or_build_base_image(image, target_adapter, arch)
+
                 except ConnectionError as error:
                     logger.error(
                         'Looks like docker is not started, please start docker daemon\nError: %s', error)
                     raise
 
                 tagged_container_name = f'{hostname}_{arch}'
-                logger.info(
-                    f"Creating stopped container {tagged_container_name}...")
                 self.remove_container(tagged_container_name)
 
-                container = self.create_and_init_container(
-                    image=image,
-                    container_name=tagged_container_name,
-                    target_adapter=target_adapter,
-                    source_adapter=source_adapter,
-                    network=network,
-                    replica_volume=replica_volume,
-                    envars=envars
-                )
-
-                if len(arch_list) > 1:
-                    container.stop()
-                container_list.append(container)
+                container = self._claim_warm_container(image,
+                                                       target_adapter,
+                                                       arch,
+                                                       envars,
+                                                       tagged_container_name,
+                                                       start=start)
+                if container is None:
+                    container = self.create_and_init_container(
+                        image=image,
+                        container_name=tagged_container_name,
+                        target_adapter=target_adapter,
+                        source_adapter=source_adapter,
+                        network=network,
+                        replica_volume=replica_volume,
+                        envars=envars,
+                        run_setup=False,
+                        start=start
+                    )
+                return container
+
+        passive_container = None
+        if len(arch_list) > 1:
+            logger.info(f'Preparing passive container of arch {arch_list[1]} in the background...')
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snowshu_passive')
+            passive_container = executor.submit(prepare_container, arch_list[1], False)
+            executor.shutdown(wait=False)
+
+            def log_failure(future) -> None:
+                # reported as soon as it happens, not when the passive container is needed
+                if not future.cancelled() and future.exception() is not None:
+                    logger.error(f'Failed to prepare passive container of arch {arch_list[1]}, '
+                                 f'the build will fail: {future.exception()}')
+            passive_container.add_done_callback(log_failure)
 
-        if len(container_list) == 2:
-            active_container, passive_container = container_list[0], container_list[1]
-        else:
-            active_container = container_list[0]
-            passive_container = None
+        try:
+            active_container = prepare_container(arch_list[0], True)
+        except Exception:
+            # do not leave the passive container being prepared behind the failed startup
+            if passive_container is not None and not passive_container.cancel():
+                passive_container.exception()
+            raise
 
-        if len(arch_list) > 1:
-            active_container.start()
+        if passive_container is not None and wait_for_passive:
+            passive_container = passive_container.result()
 
         return active_container, passive_container
 
@@ -245,11 +552,15 @@ class SnowShuDocker:
                                     source_adapter: str,
                                     network: docker.models.networks.Network,
                                     replica_volume: docker.models.volumes.Volume,
-                                    envars: dict
+                                    envars: dict,
+                                    run_setup: bool = True,
+                                    start: bool = True
                                  ) -> docker.models.containers.Container:
         """ Method used during self.startup() execution, creates, starts and setups container
 
-            input: some stuff needed to define a container launch
+            input: some stuff needed to define a container launch,
+                run_setup is False for base images that were already set up,
+                start is False to leave the container stopped, it is then not set up
             return: container object instance, in a running state and already set up
         """
 
@@ -284,6 +595,9 @@ class SnowShuDocker:
         logger.info(
             f"Created stopped container {container.name}, connecting it to bridge network...")
         self._connect_to_bridge_network(container)
+        if not start:
+            logger.info(f'Connected. Container {container.name} left stopped.')
+            return container
         logger.info(
             f'Connected. Starting created container {container.name}...')
         try:
@@ -293,9 +607,10 @@ class SnowShuDocker:
                 logger.exception('One of the ports used by snowshu_target is '
                                  'already allocated, stop extra containers and rerun')
             raise
-        logger.info(
-            f'Container {container.name} started, running initial setup...')
-        self._run_container_setup(container, target_adapter)
+        if run_setup:
+            logger.info(
+                f'Container {container.name} started, running initial setup...')
+            self._run_container_setup(container, target_adapter)
         logger.info(f'Container {container.name} fully initialized.')
 
         return container
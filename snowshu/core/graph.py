@@ -1,6 +1,6 @@
 import os.path
 from datetime import datetime
-from typing import List, Set, Tuple, Optional, Union
+from typing import Dict, List, Set, Tuple, Optional, Union
 import logging
 
 import matplotlib.pyplot as plt
@@ -413,6 +413,25 @@ class SnowShuGraph:
 
         return tuple(dags)
 
+    @staticmethod
+    def relationship_attributes(graphs: Tuple[networkx.Graph]) -> Dict[Relation, Set[str]]:
+        """ Collects the attributes each relation is joined on by its relationships
+
+            Args:
+                graphs: the connected subgraphs of the processing graph
+
+            Returns:
+                the attribute names used by edges for each table relation, views are skipped
+        """
+        attributes = dict()
+        for graph in graphs:
+            for parent, child, edge in graph.edges(data=True):
+                for relation, attribute in ((parent, edge['remote_attribute'],),
+                                            (child, edge['local_attribute'],),):
+                    if not relation.is_view:
+                        attributes.setdefault(relation, set()).add(attribute)
+        return attributes
+
     @staticmethod
     def build_sum_patterns_from_configs(config: Configuration) -> List[dict]:
         """creates pattern dictionaries to filter with to build the total
@@ -463,4 +482,7 @@ class SnowShuGraph:
         relation.sampling = configs.sampling
         relation.include_outliers = configs.include_outliers
         relation.max_number_of_outliers = configs.max_number_of_outliers
+        relation.materialize_key_tables = configs.materialize_key_tables
+        relation.adaptive_predicates = configs.adaptive_predicates
+        relation.polymorphic_union_branches = configs.polymorphic_union_branches
         return relation
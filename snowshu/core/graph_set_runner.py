@@ -1,23 +1,36 @@
+import copy
 import gc
+import math
 import os
 import shutil
+import tempfile
 import time
-import json
 import threading
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
-from typing import Tuple, Set, List
+from typing import Dict, Optional, Tuple, Set, List
 import logging
 
 import networkx as nx
+import pandas as pd
 
 from snowshu.core.models import Relation
 from snowshu.adapters.base_sql_adapter import BaseSQLAdapter
 from snowshu.adapters.source_adapters.base_source_adapter import BaseSourceAdapter
 from snowshu.adapters.target_adapters.base_target_adapter import BaseTargetAdapter
 from snowshu.core import utils
+from snowshu.configs import (DEFAULT_INSERT_CHUNK_SIZE,
+                             DEFAULT_MAX_RESAMPLE_ITERATIONS,
+                             DEFAULT_MEMORY_BUDGET,
+                             DEFAULT_RESAMPLE_BUDGET,
+                             IN_MEMORY_BYTES_FACTOR,
+                             MAX_RESAMPLE_FACTOR)
 from snowshu.core.compile import RuntimeSourceCompiler
+from snowshu.core.memory_budget import MemoryBudget
+from snowshu.core.printable_result import process_relation
+from snowshu.core.sample_cache import SampleCache
 from snowshu.logger import duration
 
 logger = logging.getLogger(__name__)
@@ -39,6 +52,15 @@ class GraphSetRunner:
 
     def __init__(self):
         self.barf = None
+        self.component_scripts = False
+        self.adaptive_sample_sizing = False
+        self.max_resample_iterations = DEFAULT_MAX_RESAMPLE_ITERATIONS
+        self.resample_budget = DEFAULT_RESAMPLE_BUDGET
+        self.sample_cache: Optional[SampleCache] = None
+        self.from_cache = False
+        self._fingerprints: Dict[Relation, str] = dict()
+        self.memory_budget: Optional[MemoryBudget] = None
+        self._source_bytes: Dict[Relation, int] = dict()
 
     def execute_graph_set(  # noqa pylint: disable=too-many-arguments
         self,
@@ -49,6 +71,13 @@ class GraphSetRunner:
         retry_count: int,
         analyze: bool = False,
         barf: bool = False,
+        component_scripts: bool = False,
+        adaptive_sample_sizing: bool = False,
+        max_resample_iterations: int = DEFAULT_MAX_RESAMPLE_ITERATIONS,
+        resample_budget: float = DEFAULT_RESAMPLE_BUDGET,
+        sample_cache: Optional[SampleCache] = None,
+        from_cache: bool = False,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
     ) -> None:
         """Processes the given graphs in parallel based on the provided adapters
 
@@ -60,15 +89,38 @@ class GraphSetRunner:
             retry_count (int): number of times to retry failed query
             analyze (bool): whether to run analyze or actually transfer the sampled data
             barf (bool): whether to dump diagnostic files to disk
+            component_scripts (bool): whether to sample each graph in a single scripted
+                request to the source
+            adaptive_sample_sizing (bool): whether to re-sample graphs with relations below
+                their target sample size
+            max_resample_iterations (int): maximum number of re-samples of a graph
+            resample_budget (float): maximum time spent re-sampling a graph, as a multiple
+                of the time of its first sample
+            sample_cache (SampleCache): local cache to store the fetched records in
+            from_cache (bool): whether to load graphs from the sample cache when none of
+                their source tables changed since they were cached
+            memory_budget (int): maximum megabytes of records held in memory across threads,
+                0 for no limit
         """
 
         self.barf = barf
+        self.component_scripts = component_scripts
+        self.adaptive_sample_sizing = adaptive_sample_sizing
+        self.max_resample_iterations = max_resample_iterations
+        self.resample_budget = resample_budget
+        self.sample_cache = sample_cache
+        self.from_cache = from_cache
+        self.memory_budget = MemoryBudget(memory_budget * 1024 * 1024) if memory_budget else None
         if self.barf:
             shutil.rmtree(self.barf_output, ignore_errors=True)
             os.makedirs(self.barf_output)
 
         view_graph_set = [graph for graph in graph_set if graph.contains_views]
         table_graph_set = list(set(graph_set) - set(view_graph_set))
+        if self.memory_budget is not None and not analyze:
+            self._catalog_source_bytes(graph_set, source_adapter)
+            # the largest graphs start first, so the small ones fill in around them
+            table_graph_set.sort(key=self._graph_source_bytes, reverse=True)
 
         # Tables need to come first to prevent deps deadlocks with views
         try:
@@ -91,6 +143,8 @@ class GraphSetRunner:
             for schema in self.schemas:
                 source_adapter.drop_schema(schema)
             self.schemas.clear()
+            if self.sample_cache is not None and not analyze:
+                self.sample_cache.evict()
 
     def process_executables(
         self,
@@ -174,6 +228,25 @@ class GraphSetRunner:
             ) as cmp_file:
                 nx.write_multiline_adjlist(executable.graph, cmp_file)
 
+    @staticmethod
+    def _create_key_tables(relation: Relation, executable: GraphExecutable) -> None:
+        """Creates a compact key table for every remote attribute that downstream
+        relations in the graph are constrained on.
+
+        Args:
+            relation (Relation): relation whose temp sample table was just created
+            executable (GraphExecutable): object that contains the graph and source adapter
+        """
+        remote_keys = {
+            edge["remote_attribute"]
+            for _, _, edge in executable.graph.out_edges(relation, data=True)
+        }
+        for remote_key in sorted(remote_keys):
+            logger.debug(
+                f"Creating key table for {relation.dot_notation} on {remote_key}..."
+            )
+            executable.source_adapter.create_key_table(relation, remote_key)
+
     def _process_relation(
         self, i: int, relation: Relation, executable: GraphExecutable
     ) -> None:
@@ -207,119 +280,505 @@ class GraphSetRunner:
             relation,
             executable.graph,
             executable.source_adapter,
-            executable.analyze,
+            False,
         )
-        if executable.analyze:
-            if relation.is_view:
-                relation.population_size = "N/A"
-                relation.sample_size = "N/A"
-                logger.info(f"Relation {relation.dot_notation} is a view, skipping.")
-            else:
-                result = executable.source_adapter.check_count_and_query(
-                    relation.compiled_query,
-                    relation.sampling.max_allowed_rows,
-                    relation.unsampled,
-                ).iloc[0]
-                relation.population_size = result.population_size
-                relation.sample_size = result.sample_size
-                logger.info(
-                    f"Analysis of relation {relation.dot_notation} completed in {duration(start_time)}."
+        executable.target_adapter.create_database_if_not_exists(relation.database)
+        executable.target_adapter.create_schema_if_not_exists(
+            relation.database, relation.schema
+        )
+        if relation.is_view:
+            logger.info(
+                f"Retrieving DDL statement for view {relation.dot_notation} in source..."
+            )
+            relation.population_size = "N/A"
+            relation.sample_size = "N/A"
+            query_data = None
+            try:
+                relation.view_ddl = executable.source_adapter.scalar_query(
+                    relation.compiled_query
                 )
+            except Exception as exc:
+                raise SystemError(
+                    f"Failed to extract DDL statement: {relation.compiled_query}"
+                ) from exc
+            logger.info(
+                "Successfully extracted DDL statement for view "
+                f"{executable.target_adapter.quoted_dot_notation(relation)}"
+            )
+            self._cache_relation_if_necessary(relation, query_data)
+            self._load_relation(relation, query_data, executable, start_time)
         else:
-            executable.target_adapter.create_database_if_not_exists(relation.database)
-            executable.target_adapter.create_schema_if_not_exists(
-                relation.database, relation.schema
+            executable.source_adapter.create_table(
+                query=relation.compiled_query,
+                name=relation.name,
+                schema=relation.temp_schema,
+                database=relation.temp_database,
             )
-            if relation.is_view:
-                logger.info(
-                    f"Retrieving DDL statement for view {relation.dot_notation} in source..."
-                )
-                relation.population_size = "N/A"
-                relation.sample_size = "N/A"
-                try:
-                    relation.view_ddl = executable.source_adapter.scalar_query(
-                        relation.compiled_query
-                    )
-                except Exception as exc:
-                    raise SystemError(
-                        f"Failed to extract DDL statement: {relation.compiled_query}"
-                    ) from exc
-                logger.info(
-                    "Successfully extracted DDL statement for view "
-                    f"{executable.target_adapter.quoted_dot_notation(relation)}"
-                )
+            if relation.materialize_key_tables:
+                self._create_key_tables(relation, executable)
+
+            nbytes = self._estimate_bytes(relation)
+            if self._must_spill(nbytes):
+                self._spill_and_load(relation, executable, start_time, nbytes)
             else:
-                executable.source_adapter.create_table(
-                    query=relation.compiled_query,
-                    name=relation.name,
-                    schema=relation.temp_schema,
-                    database=relation.temp_database,
-                )
+                with self._reserve_memory(nbytes):
+                    try:
+                        logger.info(
+                            f"Retrieving records from source {relation.temp_dot_notation}..."
+                        )
+                        fetch_query = f"SELECT * FROM {relation.temp_dot_notation}"
+                        query_data = executable.source_adapter.check_count_and_query(
+                            fetch_query,
+                            relation.sampling.max_allowed_rows,
+                            relation.unsampled,
+                        )
+                        relation.sample_size = len(query_data)
+                        logger.info(
+                            f"{relation.sample_size} records retrieved for relation {relation.dot_notation}."
+                        )
+                    except Exception as exc:
+                        raise SystemError(
+                            f"Failed to retrieve records from source {relation.temp_dot_notation} "
+                            f"with query: {fetch_query} "
+                            f"issue details: {exc}"
+                        ) from exc
+                    self._cache_relation_if_necessary(relation, query_data)
+                    self._load_relation(relation, query_data, executable, start_time)
+                    # free the records before the reservation is released
+                    del query_data
+
+        relation.source_extracted = True
+        logger.info(
+            f"population:{relation.population_size}, sample:{relation.sample_size}"
+        )
+        self._write_barf_if_necessary(relation)
 
+    def _catalog_source_bytes(self, graph_set: Tuple[nx.Graph], source_adapter: BaseSourceAdapter) -> None:
+        """Looks up the catalog size of every table in the run in a single round trip"""
+        tables = [relation for graph in graph_set for relation in graph.nodes if not relation.is_view]
+        if tables:
+            self._source_bytes = dict(zip(tables, source_adapter.relation_bytes(tables)))
+            logger.debug(
+                f"Source tables of the run take {sum(self._source_bytes.values())} bytes in the catalog."
+            )
+
+    def _graph_source_bytes(self, graph: nx.Graph) -> int:
+        """The total catalog size of the source tables of a graph"""
+        return sum(self._source_bytes.get(relation, 0) for relation in graph.nodes)
+
+    def _estimate_bytes(self, relation: Relation, count: Optional[int] = None) -> int:
+        """Estimates the memory the fetched sample of a relation takes, from the catalog size
+        of the source table scaled by the sample ratio. Always 0 without a memory budget."""
+        if self.memory_budget is None or not relation.population_size:
+            return 0
+        source_bytes = self._source_bytes.get(relation, 0)
+        ratio = 1.0 if relation.unsampled else min(self._expected_rows(relation, count) / relation.population_size, 1.0)
+        return int(source_bytes * ratio * IN_MEMORY_BYTES_FACTOR)
+
+    @staticmethod
+    def _expected_rows(relation: Relation, count: Optional[int] = None) -> int:
+        """The number of rows the sample of a relation is expected to have"""
+        if count is not None:
+            return count
+        if relation.unsampled:
+            return relation.population_size
+        return min(relation.sampling.size, relation.population_size)
+
+    def _must_spill(self, nbytes: int) -> bool:
+        """Whether a sample of nbytes is too large to ever be held in memory"""
+        return self.memory_budget is not None and nbytes > self.memory_budget.limit
+
+    def _reserve_memory(self, nbytes: int):
+        """Holds nbytes of the memory budget, if there is one, for the duration of the block"""
+        return self.memory_budget.reserve(nbytes) if self.memory_budget else nullcontext()
+
+    def _spill_and_load(self,  # noqa pylint: disable=too-many-arguments
+                        relation: Relation,
+                        executable: GraphExecutable,
+                        start_time: float,
+                        nbytes: int,
+                        count: Optional[int] = None) -> None:
+        """Streams the sample of a relation that does not fit in the memory budget to disk,
+        then loads it into the target from there one chunk at a time.
+
+        Args:
+            relation (Relation): relation to fetch and load
+            executable (GraphExecutable): object that contains the source and target adapters
+            start_time (float): time the processing of the relation started at
+            nbytes (int): the estimated memory of the whole sample
+            count (int): the row count of the sample, if already known
+        """
+        fetch_query = f"SELECT * FROM {relation.temp_dot_notation}"
+        # only one chunk of the sample is in memory at a time
+        chunk_bytes = int(nbytes * DEFAULT_INSERT_CHUNK_SIZE
+                          / max(self._expected_rows(relation, count), DEFAULT_INSERT_CHUNK_SIZE))
+        spill_directory = tempfile.mkdtemp(prefix="snowshu_spill_")
+        try:
+            with self._reserve_memory(chunk_bytes):
+                logger.info(
+                    f"Sample of {relation.dot_notation} exceeds the memory budget, "
+                    f"spilling records from source {relation.temp_dot_notation} to {spill_directory}..."
+                )
                 try:
-                    logger.info(
-                        f"Retrieving records from source {relation.temp_dot_notation}..."
-                    )
-                    fetch_query = f"SELECT * FROM {relation.temp_dot_notation}"
-                    query_data = executable.source_adapter.check_count_and_query(
+                    relation.sample_size, spill_paths = executable.source_adapter.check_count_and_spill(
                         fetch_query,
                         relation.sampling.max_allowed_rows,
                         relation.unsampled,
+                        spill_directory,
+                        count,
                     )
-                    relation.sample_size = len(query_data)
-                    logger.info(
-                        f"{relation.sample_size} records retrieved for relation {relation.dot_notation}."
-                    )
-                # This except block is necessary due to VARIANT data type issues
-                # in Snowflake. In the future, we should remove this and find a
-                # better solution.
-                except json.decoder.JSONDecodeError as exc:
-                    logger.error(
-                        f"Failed to retrieve records from source {relation.temp_dot_notation} "
-                        f"with query: {fetch_query}"
-                    )
-                    logger.error(f"Issue details: {exc}")
-                    logger.error(f"Skipping relation insert {relation.dot_notation}")
-                    return  # Return early to avoid inserting empty relation
-
                 except Exception as exc:
                     raise SystemError(
                         f"Failed to retrieve records from source {relation.temp_dot_notation} "
                         f"with query: {fetch_query} "
                         f"issue details: {exc}"
                     ) from exc
+                # spilled samples are not kept in the sample cache, nor is an older sample kept in their place
+                if self.sample_cache is not None:
+                    self.sample_cache.discard(relation)
+                self._load_relation(relation, None, executable, start_time, spill_paths)
+        finally:
+            shutil.rmtree(spill_directory, ignore_errors=True)
 
-            logger.info(
-                f"Inserting relation {executable.target_adapter.quoted_dot_notation(relation)}"
-                " into target..."
-            )
-            try:
-                executable.target_adapter.create_and_load_relation(relation, query_data)
-            except Exception as exc:
-                raise SystemError(
-                    "Failed to load relation "
-                    f"{executable.target_adapter.quoted_dot_notation(relation)} "
-                    f" into target: {exc}"
-                ) from exc
+    @staticmethod
+    def _load_relation(
+        relation: Relation,
+        query_data: Optional[pd.DataFrame],
+        executable: GraphExecutable,
+        start_time: float,
+        spill_paths: Optional[List[str]] = None,
+    ) -> None:
+        """Loads the retrieved records of a relation into the target
 
-            logger.info(
-                "Done replication of relation "
+        Args:
+            relation (Relation): relation to load
+            query_data (DataFrame): records retrieved from the source
+            executable (GraphExecutable): object that contains the target adapter
+            start_time (float): time the processing of the relation started at
+            spill_paths (list): files the records were spilled to instead, if any
+        """
+        logger.info(
+            f"Inserting relation {executable.target_adapter.quoted_dot_notation(relation)}"
+            " into target..."
+        )
+        try:
+            if spill_paths is not None:
+                executable.target_adapter.load_spilled_data_into_relation(relation, spill_paths)
+            else:
+                executable.target_adapter.create_and_load_relation(relation, query_data)
+        except Exception as exc:
+            raise SystemError(
+                "Failed to load relation "
                 f"{executable.target_adapter.quoted_dot_notation(relation)} "
-                f" in {duration(start_time)}."
-            )
-            relation.target_loaded = True
-        relation.source_extracted = True
+                f" into target: {exc}"
+            ) from exc
+
         logger.info(
-            f"population:{relation.population_size}, sample:{relation.sample_size}"
+            "Done replication of relation "
+            f"{executable.target_adapter.quoted_dot_notation(relation)} "
+            f" in {duration(start_time)}."
         )
+        relation.target_loaded = True
+
+    def _fingerprint_graph(self, executable: GraphExecutable) -> None:
+        """Fingerprints every relation of the graph with the last-altered times of all of
+        the source tables in it and their sampling configuration, since the sample of each
+        relation depends on the others."""
+        relations = list(executable.graph.nodes)
+        last_altered = executable.source_adapter.last_altered(relations)
+        fingerprint = SampleCache.graph_fingerprint(executable.graph, last_altered)
+        for relation in relations:
+            self._fingerprints[relation] = fingerprint
+
+    def _cache_relation_if_necessary(self, relation: Relation, query_data: Optional[pd.DataFrame]) -> None:
+        """Stores the fetched records of the relation if the sample cache is enabled"""
+        if self.sample_cache is not None and relation in self._fingerprints:
+            self.sample_cache.put(relation, self._fingerprints[relation], query_data)
+
+    def _load_from_cache(self, executable: GraphExecutable) -> bool:
+        """Loads the whole graph into the target from the sample cache.
+
+        Args:
+            executable (GraphExecutable): object that contains the graph and target adapter
+
+        Returns:
+            bool: False, without loading anything, if any relation of the graph is not cached
+        """
+        entries = {relation: self.sample_cache.get(relation, self._fingerprints[relation])
+                   for relation in executable.graph.nodes}
+        missing = [relation.dot_notation for relation, entry in entries.items() if entry is None]
+        if missing:
+            logger.info(
+                f"Relations {', '.join(missing)} are not cached or changed in source, sampling graph from source..."
+            )
+            return False
+        for relation in nx.algorithms.dag.topological_sort(executable.graph):
+            start_time = time.time()
+            entry = entries[relation]
+            relation.population_size = entry["population_size"]
+            relation.sample_size = entry["sample_size"]
+            if relation.is_view:
+                relation.view_ddl = entry["view_ddl"]
+            executable.target_adapter.create_database_if_not_exists(relation.database)
+            executable.target_adapter.create_schema_if_not_exists(
+                relation.database, relation.schema
+            )
+            logger.info(f"Loading relation {relation.dot_notation} from sample cache...")
+            self._load_relation(relation, entry["data"], executable, start_time)
+            relation.source_extracted = True
+        return True
+
+    def _write_barf_if_necessary(self, relation: Relation) -> None:
+        """Writes the compiled query of the relation to disk if the barf flag is set"""
         if self.barf:
             with open(
                 os.path.join(self.barf_output, f"{relation.dot_notation}.sql"),
                 "w",
                 encoding="utf-8",
             ) as barf_file:
+                for strategy in relation.predicate_strategies:
+                    barf_file.write(f"-- predicate strategy: {strategy}\n")
                 barf_file.write(relation.compiled_query)
 
+    def _analyze_component(self, executable: GraphExecutable) -> None:
+        """Analyzes a whole graph with one population query and one analyze query
+
+        Args:
+            executable (GraphExecutable): object that contains all of the necessary info for
+                analyzing the graph
+        """
+        start_time = time.time()
+        source_adapter = executable.source_adapter
+        relations = list(nx.algorithms.dag.topological_sort(executable.graph))
+        tables = [relation for relation in relations if not relation.is_view]
+        for relation in relations:
+            relation.temp_schema = "_".join([relation.database, relation.schema, self.uuid])
+        if tables:
+            for relation, population_size in zip(tables, source_adapter.population_counts(tables)):
+                relation.population_size = population_size
+
+        for relation in relations:
+            if relation.is_view:
+                logger.info(f"Relation {relation.dot_notation} is a view, skipping.")
+            else:
+                relation.sampling.prepare(relation, source_adapter)
+            RuntimeSourceCompiler.compile_queries_for_relation(
+                relation,
+                executable.graph,
+                source_adapter,
+                True,
+            )
+
+        if tables:
+            logger.info(f"Analyzing {len(tables)} relations in a single query...")
+            result = source_adapter.analyze_relations(tables)
+            for relation, (_, row) in zip(tables, result.iterrows()):
+                relation.population_size = row.population_size
+                relation.sample_size = row.sample_size
+        for relation in relations:
+            if relation.is_view:
+                relation.population_size = "N/A"
+                relation.sample_size = "N/A"
+            relation.source_extracted = True
+            logger.info(
+                f"population:{relation.population_size}, sample:{relation.sample_size}"
+            )
+            self._write_barf_if_necessary(relation)
+        logger.info(
+            f"Analysis of {len(relations)} relations completed in {duration(start_time)}."
+        )
+
+    def _execute_component_script(self, executable: GraphExecutable) -> None:
+        """Samples a whole graph in a single scripted request to the source
+
+        Every relation is compiled up front in topological order, the source creates
+        all of the temp sample tables server-side and returns their row counts, and
+        the samples are then fetched and loaded into the target one after another.
+
+        Args:
+            executable (GraphExecutable): object that contains all of the necessary info for
+                executing a sample and loading it into the target
+        """
+        start_time = time.time()
+        source_adapter = executable.source_adapter
+        relations = list(nx.algorithms.dag.topological_sort(executable.graph))
+        for relation in relations:
+            relation.temp_schema = "_".join([relation.database, relation.schema, self.uuid])
+            self._generate_schemas_if_necessary(
+                source_adapter,
+                relation.temp_schema,
+                relation.temp_database,
+            )
+
+        for relation, population_size in zip(relations, source_adapter.population_counts(relations)):
+            relation.population_size = population_size
+
+        statements = list()
+        for relation in relations:
+            relation.sampling.prepare(relation, source_adapter)
+            relation = RuntimeSourceCompiler.compile_queries_for_relation(
+                relation,
+                executable.graph,
+                source_adapter,
+                False,
+                upstream_materialized=False,
+            )
+            statements.append(source_adapter.create_table_statement(
+                relation.compiled_query,
+                relation.name,
+                relation.temp_schema,
+                relation.temp_database,
+            ))
+            if relation.materialize_key_tables:
+                remote_keys = {
+                    edge["remote_attribute"]
+                    for _, _, edge in executable.graph.out_edges(relation, data=True)
+                }
+                statements.extend(source_adapter.create_key_table_statement(relation, remote_key)
+                                  for remote_key in sorted(remote_keys))
+
+        logger.info(
+            f"Executing component script for {len(relations)} relations..."
+        )
+        sample_sizes = source_adapter.execute_component_script(statements, relations)
+        logger.info(
+            f"Component script for {len(relations)} relations completed in {duration(start_time)}."
+        )
+        for relation, sample_size in zip(relations, sample_sizes):
+            relation.sample_size = sample_size
+        for relation in relations:
+            if relation.sample_size == 0 and any(True for _ in executable.graph.successors(relation)):
+                logger.critical(
+                    f"Failed to build predicates for {relation.dot_notation}: the constraint set "
+                    "is empty, please validate the relation."
+                )
+                raise IndexError("Failed to build predicates, the constraint set is empty.")
+
+        for i, relation in enumerate(relations, start=1):
+            relation_start_time = time.time()
+            executable.target_adapter.create_database_if_not_exists(relation.database)
+            executable.target_adapter.create_schema_if_not_exists(
+                relation.database, relation.schema
+            )
+            fetch_query = f"SELECT * FROM {relation.temp_dot_notation}"
+            logger.info(
+                f"Retrieving records from source {relation.temp_dot_notation} "
+                f"({i} of {len(relations)} in graph)..."
+            )
+            nbytes = self._estimate_bytes(relation, relation.sample_size)
+            if self._must_spill(nbytes):
+                self._spill_and_load(relation, executable, relation_start_time, nbytes, relation.sample_size)
+            else:
+                with self._reserve_memory(nbytes):
+                    try:
+                        query_data = source_adapter.check_known_count_and_query(
+                            fetch_query,
+                            relation.sample_size,
+                            relation.sampling.max_allowed_rows,
+                            relation.unsampled,
+                        )
+                    except Exception as exc:
+                        raise SystemError(
+                            f"Failed to retrieve records from source {relation.temp_dot_notation} "
+                            f"with query: {fetch_query} "
+                            f"issue details: {exc}"
+                        ) from exc
+                    self._cache_relation_if_necessary(relation, query_data)
+                    self._load_relation(relation, query_data, executable, relation_start_time)
+                    # free the records before the reservation is released
+                    del query_data
+            relation.source_extracted = True
+            logger.info(
+                f"population:{relation.population_size}, sample:{relation.sample_size}"
+            )
+            self._write_barf_if_necessary(relation)
+
+    @staticmethod
+    def _root_rescale_factors(graph: nx.Graph) -> Dict[Relation, float]:
+        """Finds how much the root sample sizes of a graph need to grow to bring every
+        relation up to its target sample size.
+
+        Args:
+            graph (Graph): the sampled graph
+
+        Returns:
+            dict: the rescale factor of each root relation that needs to grow
+        """
+        factors = dict()
+        for relation in graph.nodes:
+            row = process_relation(graph, relation)
+            if row.percent_is_acceptable or not isinstance(row.percent_to_target, int) \
+                    or row.percent_to_target >= 100 or row.target_sample_size < 1:
+                continue
+            factor = (MAX_RESAMPLE_FACTOR if not row.final_sample_size
+                      else min(row.target_sample_size / row.final_sample_size, MAX_RESAMPLE_FACTOR))
+            roots = [ancestor for ancestor in nx.ancestors(graph, relation) | {relation}
+                     if graph.in_degree(ancestor) == 0 and not (ancestor.unsampled or ancestor.is_view)]
+            for root in roots:
+                factors[root] = max(factors.get(root, 1.0), factor)
+        return factors
+
+    @staticmethod
+    def _drop_samples(executable: GraphExecutable) -> None:
+        """Drops the temp sample tables (and key tables) of a graph so it can be sampled again"""
+        for relation in executable.graph.nodes:
+            if relation.is_view or relation.temp_schema is None:
+                continue
+            executable.source_adapter.drop_table(relation.name,
+                                                 relation.temp_schema,
+                                                 relation.temp_database)
+            if relation.materialize_key_tables:
+                for remote_key in {edge["remote_attribute"]
+                                   for _, _, edge in executable.graph.out_edges(relation, data=True)}:
+                    executable.source_adapter.drop_table(relation.key_table_name(remote_key),
+                                                         relation.temp_schema,
+                                                         relation.temp_database)
+
+    def _execute_graph(self, executable: GraphExecutable) -> None:
+        """Samples (or analyzes) every relation of the graph once"""
+        if executable.analyze:
+            self._analyze_component(executable)
+        elif self.component_scripts and not executable.graph.contains_views:
+            self._execute_component_script(executable)
+        else:
+            sorted_graphs = nx.algorithms.dag.topological_sort(executable.graph)
+            for i, relation in enumerate(sorted_graphs, start=1):
+                self._process_relation(i, relation, executable)
+
+    def _execute_graph_with_resampling(self, executable: GraphExecutable) -> None:
+        """Samples the graph, then re-samples it with larger root samples while relations
+        are below their target sample size, within the iteration and time budget.
+
+        Args:
+            executable (GraphExecutable): object that contains all of the necessary info for
+                executing a sample and loading it into the target
+        """
+        # root sample sizes are rescaled per relation, so samplings can no longer be shared
+        for relation in executable.graph.nodes:
+            relation.sampling = copy.copy(relation.sampling)
+
+        start_time = time.time()
+        self._execute_graph(executable)
+        deadline = start_time + (time.time() - start_time) * (1.0 + self.resample_budget)
+        for iteration in range(1, self.max_resample_iterations + 1):
+            factors = self._root_rescale_factors(executable.graph)
+            if not factors:
+                return
+            if time.time() >= deadline:
+                logger.warning(
+                    f"Resample budget exhausted, {len(factors)} root relations remain below target."
+                )
+                return
+            for root, factor in factors.items():
+                root.sampling.min_sample_size = math.ceil(root.sampling.size * factor)
+                logger.info(
+                    f"Resampling {root.dot_notation} with {root.sampling.min_sample_size} rows "
+                    f"(x{factor:.2f}), iteration {iteration} of {self.max_resample_iterations}..."
+                )
+            if not executable.analyze:
+                self._drop_samples(executable)
+            self._execute_graph(executable)
+
     def _traverse_and_execute(self, executable: GraphExecutable) -> None:
         """Processes the given graph in topological order, executing each relation in turn
 
@@ -332,9 +791,14 @@ class GraphSetRunner:
             logger.debug(
                 f"Executing graph with {len(executable.graph)} relations in it..."
             )
-            sorted_graphs = nx.algorithms.dag.topological_sort(executable.graph)
-            for i, relation in enumerate(sorted_graphs, start=1):
-                self._process_relation(i, relation, executable)
+            if self.sample_cache is not None and not executable.analyze:
+                self._fingerprint_graph(executable)
+                if self.from_cache and self._load_from_cache(executable):
+                    return
+            if self.adaptive_sample_sizing:
+                self._execute_graph_with_resampling(executable)
+            else:
+                self._execute_graph(executable)
             gc.collect()
         except Exception as exc:
             logger.error(f"failed with error of type {type(exc)}: {str(exc)}")
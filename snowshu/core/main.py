@@ -121,12 +121,19 @@ def init(path: click.Path) -> None:
     help="Tells SnowShu to build replicas of both arm and amd architectures",
     is_flag=True
 )
+@click.option(
+    '--from-cache',
+    help="loads relations from the local sample cache when their source tables did not change "
+         "since they were cached, instead of sampling them again",
+    is_flag=True
+)
 def create(replica_file: click.Path,  # noqa pylint: disable=too-many-arguments
            name: str,
            barf: bool,
            incremental: str,
            retry_count: int,
-           multiarch):
+           multiarch,
+           from_cache: bool):
     """Generate a new replica from a replica.yml file.
     """
     if multiarch:
@@ -137,6 +144,7 @@ def create(replica_file: click.Path,  # noqa pylint: disable=too-many-arguments
     replica = ReplicaFactory()
     replica.load_config(replica_file, target_arch=target_arch)
     replica.incremental = incremental
+    replica.from_cache = from_cache
 
     click.echo(replica.create(name=name, barf=barf, retry_count=retry_count))
 
@@ -166,6 +174,38 @@ def analyze(replica_file: click.Path,
     click.echo(replica.analyze(barf=barf, retry_count=retry_count))
 
 
+@cli.command()
+@click.option(
+    '--replica-file',
+    type=click.Path(
+        exists=True),
+    default=REPLICA_DEFAULT,
+    help="where snowshu will look for your replica configuration file, default is ./replica.yml")
+@click.option(
+    '--size', '-s',
+    help="the number of idle target containers to keep per architecture (default is 1)",
+    default=1
+)
+@click.option(
+    '--multiarch', '-m',
+    help="Warms containers of both arm and amd architectures",
+    is_flag=True
+)
+def warm_pool(replica_file: click.Path,
+              size: int,
+              multiarch: bool):
+    """Start and stop idle target containers that the next `snowshu create` runs claim.
+    """
+    if multiarch:
+        target_arch = get_multiarch_list(LOCAL_ARCHITECTURE)
+    else:
+        target_arch = [LOCAL_ARCHITECTURE.value]
+
+    replica = ReplicaFactory()
+    replica.load_config(replica_file, target_arch=target_arch)
+    click.echo(replica.warm_pool(size))
+
+
 @cli.command()
 def list():     # noqa pylint: disable=redefined-builtin
     """List all the available SnowShu replicas found on this computer."""
@@ -0,0 +1,46 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """Admission control for the bytes held in memory by in-flight relations.
+
+    Reservations block while they would take the total over the limit. A reservation
+    is always admitted when nothing else is in flight, so a single relation larger
+    than the limit can not deadlock the run.
+
+    Args:
+        limit: the maximum number of bytes in flight.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes: int) -> None:
+        """Blocks until nbytes fit in the budget, then reserves them."""
+        with self._condition:
+            while self.in_flight and self.in_flight + nbytes > self.limit:
+                logger.debug(f"Waiting to reserve {nbytes} bytes, {self.in_flight} of {self.limit} in flight...")
+                self._condition.wait()
+            self.in_flight += nbytes
+
+    def release(self, nbytes: int) -> None:
+        """Returns nbytes to the budget."""
+        with self._condition:
+            self.in_flight -= nbytes
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int) -> Iterator[None]:
+        """Holds a reservation of nbytes for the duration of the block."""
+        self.acquire(nbytes)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
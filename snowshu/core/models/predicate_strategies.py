@@ -0,0 +1,15 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, eq=True)
+class PredicateStrategy:
+    name: str
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+SUBQUERY = PredicateStrategy("SUBQUERY")
+INLINE = PredicateStrategy("INLINE")
+SEMI_JOIN = PredicateStrategy("SEMI_JOIN")
+EXISTS = PredicateStrategy("EXISTS")
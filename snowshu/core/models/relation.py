@@ -1,6 +1,5 @@
-from typing import TYPE_CHECKING, List, Optional, Union
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 import logging
-import json
 import re
 from sqlalchemy.types import JSON
 import pandas as pd
@@ -11,7 +10,7 @@ from snowshu.configs import (
 )
 from snowshu.core.models import materializations as mz
 from snowshu.core.models.attribute import Attribute
-from snowshu.core.utils import correct_case
+from snowshu.core.utils import correct_case, decode_json_column
 
 if TYPE_CHECKING:
     from snowshu.core.configuration_parser import SpecifiedMatchPattern
@@ -32,6 +31,10 @@ class Relation:
     unsampled: bool = False
     include_outliers: bool = False
     max_number_of_outliers: int = DEFAULT_MAX_NUMBER_OF_OUTLIERS
+    materialize_key_tables: bool = False
+    adaptive_predicates: bool = False
+    predicate_strategies: Tuple[str, ...] = ()
+    polymorphic_union_branches: bool = False
     temp_database: str = DEFAULT_TEMPORARY_DATABASE
     temp_schema: Optional[str] = None
 
@@ -74,18 +77,13 @@ class Relation:
             Adjusts data columns to match corrected attribute names and
             fixes mismatched datatypes
         """
-        lowered_columns = [correct_case(col, False)
-                           for col in val.columns.to_list()]
-        attrs = [attr.name for attr in self.attributes]
-        lowered_attrs = [correct_case(attr, False) for attr in attrs]
-        val.columns = [attrs[lowered_attrs.index(
-            col)] for col in lowered_columns]
+        attrs = {correct_case(attr.name, False): attr.name for attr in self.attributes}
+        val.columns = [attrs[correct_case(col, False)] for col in val.columns.to_list()]
 
         # handle the fact that pandas.read_sql may not preserve json type on load
         for attr in self.attributes:
             if isinstance(attr.data_type.sqlalchemy_type, JSON):
-                transform_func = (lambda v: json.loads(v) if isinstance(v, str) else v)  # noqa pylint: disable=unnecessary-lambda-assignment
-                val[attr.name] = val[attr.name].transform(func=transform_func)
+                val[attr.name] = decode_json_column(val[attr.name], f"{self.dot_notation}.{attr.name}")
 
         self._data = val
 
@@ -109,6 +107,15 @@ class Relation:
                 f"Cannot create temp dot notation. Missing {', '.join(missing)}")
         return f"{self.temp_database}.{self.temp_schema}.{self.name}"
 
+    def key_table_name(self, key: str) -> str:
+        """ returns the name of the compact key table holding the distinct values of _key_."""
+        return "__".join([self.name, key, 'SNOWSHU_KEYS'])
+
+    def temp_key_table_dot_notation(self, key: str) -> str:
+        """ returns the temp dot notation of the compact key table for _key_."""
+        temp_location = self.temp_dot_notation.rsplit('.', 1)[0]
+        return f"{temp_location}.{self.key_table_name(key)}"
+
     @property
     def star(self) -> str:
         attr_string = str()
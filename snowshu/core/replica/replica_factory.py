@@ -11,6 +11,7 @@ from snowshu.core.graph import SnowShuGraph
 from snowshu.core.graph_set_runner import GraphSetRunner
 from snowshu.core.printable_result import (graph_to_result_list,
                                            printable_result)
+from snowshu.core.sample_cache import SampleCache
 from snowshu.logger import duration
 from snowshu.configs import DEFAULT_RETRY_COUNT
 from snowshu.core.models.relation import alter_relation_case
@@ -27,6 +28,7 @@ class ReplicaFactory:
         self.config: Optional[Configuration] = None
         self.run_analyze: Optional[bool] = None
         self.incremental: Optional[str] = None
+        self.from_cache: bool = False
         self.retry_count: Optional[int] = DEFAULT_RETRY_COUNT
 
     def create(self,
@@ -83,6 +85,14 @@ class ReplicaFactory:
             self.config.target_profile.adapter.initialize_replica(
                 self.config.source_profile.name)
 
+        if not self.run_analyze:
+            self.config.target_profile.adapter.check_passive_container()
+
+        sample_cache = None
+        if (self.config.sample_cache or self.from_cache) and not self.run_analyze:
+            sample_cache = SampleCache(max_size=self.config.sample_cache_max_size,
+                                       max_age=self.config.sample_cache_max_age)
+
         runner = GraphSetRunner()
         runner.execute_graph_set(graphs,
                                  self.config.source_profile.adapter,
@@ -90,7 +100,14 @@ class ReplicaFactory:
                                  threads=self.config.threads,
                                  retry_count=self.retry_count,
                                  analyze=self.run_analyze,
-                                 barf=barf)
+                                 barf=barf,
+                                 component_scripts=self.config.component_scripts,
+                                 adaptive_sample_sizing=self.config.adaptive_sample_sizing,
+                                 max_resample_iterations=self.config.max_resample_iterations,
+                                 resample_budget=self.config.resample_budget,
+                                 sample_cache=sample_cache,
+                                 from_cache=self.from_cache,
+                                 memory_budget=self.config.memory_budget)
         if not self.run_analyze:
             relations = [relation for graph in graphs for relation in graph.nodes]
             if self.config.source_profile.adapter.SUPPORTS_CROSS_DATABASE:
@@ -107,6 +124,13 @@ class ReplicaFactory:
                     function, relations)
             logger.info('Emulation functions applied.')
 
+            self.config.target_profile.adapter.set_relations_logged()
+
+            if self.config.relationship_indexes:
+                self.config.target_profile.adapter.create_relationship_indexes(
+                    SnowShuGraph.relationship_attributes(graphs),
+                    self.config.threads)
+
             logger.info('Copying replica data to shared location...')
             status_message = self.config.target_profile.adapter.copy_replica_data()
             if status_message[0] != 0:
@@ -120,6 +144,21 @@ class ReplicaFactory:
             graph_to_result_list(graphs),
             self.run_analyze)
 
+    def warm_pool(self, size: int) -> str:
+        """Tops up the pool of idle target containers builds of this replica can claim.
+
+        Args:
+            size: the number of idle containers to keep per arch.
+        """
+        adapter = self.config.target_profile.adapter
+        containers = adapter.shdocker.warm_pool(adapter,
+                                                self.config.source_profile.name,
+                                                adapter.target_arch,
+                                                adapter._build_snowshu_envars(  # noqa pylint: disable=protected-access
+                                                    adapter.DOCKER_SNOWSHU_ENVARS),
+                                                size)
+        return f'Added {len(containers)} containers to the warm pool.'
+
     def load_config(self,
                     config: Union[Path, str, TextIO],
                     target_arch=None):
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, List, Optional
+import logging
+
+import networkx as nx
+import pandas as pd
+
+from snowshu.configs import (DEFAULT_SAMPLE_CACHE_DIRECTORY,
+                             DEFAULT_SAMPLE_CACHE_MAX_AGE,
+                             DEFAULT_SAMPLE_CACHE_MAX_SIZE)
+from snowshu.core.models import Relation
+
+logger = logging.getLogger(__name__)
+
+
+class SampleCache:
+    """Local on-disk cache of the records fetched from the source for each relation.
+
+    Records are stored as Parquet files keyed by the compiled query, the sampling seed
+    and the fingerprint of the graph the relation is sampled in. An index maps each
+    relation to its latest entry so a replica can be rebuilt without sampling.
+
+    Args:
+        directory: where the cache lives.
+        max_size: the maximum size of the cache in megabytes, oldest entries are evicted first.
+        max_age: the maximum age of an entry in days.
+    """
+    INDEX_FILE = 'index.json'
+
+    def __init__(self,
+                 directory: str = DEFAULT_SAMPLE_CACHE_DIRECTORY,
+                 max_size: int = DEFAULT_SAMPLE_CACHE_MAX_SIZE,
+                 max_age: int = DEFAULT_SAMPLE_CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(relation: Relation, fingerprint: str) -> str:
+        """Hashes the compiled query, sampling seed and source fingerprint of a relation."""
+        seed = getattr(relation.sampling, 'seed', None)
+        return hashlib.sha256('\n'.join((relation.compiled_query,
+                                         str(seed),
+                                         fingerprint,)).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def graph_fingerprint(graph: nx.Graph, last_altered: List[Any]) -> str:
+        """Hashes the last-altered times of the source tables of a graph with the sampling
+        configuration of its relations and its edges, since the sample of each relation
+        depends on all of them.
+
+        Args:
+            graph: the graph of relations.
+            last_altered: the last-altered time of each relation, in the order of the graph nodes.
+        Returns:
+            the fingerprint shared by all of the relations of the graph.
+        """
+        relations = list(graph.nodes)
+        lines = sorted(f"{relation.dot_notation}:{altered}:{SampleCache._relation_config(relation)}"
+                       for relation, altered in zip(relations, last_altered))
+        lines += sorted(f"{upstream.dot_notation}->{downstream.dot_notation}:"
+                        f"{json.dumps(edge, sort_keys=True, default=str)}"
+                        for upstream, downstream, edge in graph.edges(data=True))
+        return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _relation_config(relation: Relation) -> str:
+        """Serializes the settings the sample of a relation is compiled from."""
+        def describe(value: Any) -> Any:
+            if isinstance(value, dict):
+                return {str(key): describe(item) for key, item in value.items()}
+            if isinstance(value, (list, tuple, set)):
+                return [describe(item) for item in value]
+            if hasattr(value, '__dict__'):
+                # the size and method are set by prepare, from the source, not the configuration
+                return dict(type=type(value).__name__,
+                            **{key: describe(item) for key, item in vars(value).items()
+                               if key not in ('size', 'sample_method')})
+            return value
+
+        return json.dumps(dict(sampling=describe(getattr(relation, 'sampling', None)),
+                               unsampled=relation.unsampled,
+                               include_outliers=relation.include_outliers,
+                               max_number_of_outliers=relation.max_number_of_outliers,
+                               adaptive_predicates=relation.adaptive_predicates,
+                               predicate_strategies=describe(relation.predicate_strategies),
+                               polymorphic_union_branches=relation.polymorphic_union_branches),
+                          sort_keys=True,
+                          default=str)
+
+    @staticmethod
+    def _size(value):
+        # sizes are "N/A" for views and may be numpy integers for tables
+        return value if isinstance(value, str) else int(value)
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as index_file:
+                return json.load(index_file)
+        except FileNotFoundError:
+            return dict()
+
+    def _write_index(self, index: dict) -> None:
+        with open(self._index_path, 'w', encoding='utf-8') as index_file:
+            json.dump(index, index_file)
+
+    def put(self, relation: Relation, fingerprint: str, data: Optional[pd.DataFrame]) -> None:
+        """Stores the records (or the view ddl) fetched for a relation.
+
+        Args:
+            relation: the relation the records belong to, with its sizes populated.
+            fingerprint: the last-altered fingerprint of the source tables the query reads.
+            data: the fetched records, None for views.
+        """
+        key = self.key(relation, fingerprint)
+        if data is not None:
+            try:
+                data.to_parquet(self._entry_path(key), index=False)
+            except Exception as exc:  # noqa pylint: disable=broad-except
+                logger.warning(f"Failed to cache records of {relation.dot_notation}: {exc}")
+                return
+        with self._lock:
+            index = self._read_index()
+            index[relation.dot_notation] = dict(key=key,
+                                                fingerprint=fingerprint,
+                                                population_size=self._size(relation.population_size),
+                                                sample_size=self._size(relation.sample_size),
+                                                view_ddl=getattr(relation, 'view_ddl', None),
+                                                created_at=time.time())
+            self._write_index(index)
+        logger.debug(f"Cached records of {relation.dot_notation} under {key}.")
+
+    def get(self, relation: Relation, fingerprint: str) -> Optional[dict]:
+        """Finds the latest entry of a relation if its source has not changed since.
+
+        Args:
+            relation: the relation to look up.
+            fingerprint: the current last-altered fingerprint of the source tables.
+        Returns:
+            the index entry with the records under ``data`` (None for views), or None on a miss.
+        """
+        with self._lock:
+            entry = self._read_index().get(relation.dot_notation)
+        if entry is None or entry['fingerprint'] != fingerprint \
+                or time.time() - entry['created_at'] > self.max_age * 86400:
+            return None
+        entry = dict(entry)
+        if relation.is_view:
+            entry['data'] = None
+            return entry
+        try:
+            entry['data'] = pd.read_parquet(self._entry_path(entry['key']))
+        except FileNotFoundError:
+            return None
+        return entry
+
+    def discard(self, relation: Relation) -> None:
+        """Removes the entry of a relation, so a stale sample is not loaded in place of one
+        that was not cached.
+
+        Args:
+            relation: the relation to remove.
+        """
+        with self._lock:
+            index = self._read_index()
+            entry = index.pop(relation.dot_notation, None)
+            if entry is None:
+                return
+            self._write_index(index)
+            if os.path.exists(self._entry_path(entry['key'])):
+                os.remove(self._entry_path(entry['key']))
+        logger.debug(f"Discarded cached records of {relation.dot_notation}.")
+
+    def evict(self) -> None:
+        """Removes entries older than the maximum age, then the oldest entries until
+        the cache fits in the maximum size."""
+        with self._lock:
+            index = self._read_index()
+            now = time.time()
+            live = {dot_notation: entry for dot_notation, entry in index.items()
+                    if now - entry['created_at'] <= self.max_age * 86400}
+            referenced = {entry['key'] for entry in live.values()}
+            files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith('.parquet')]
+            for path in files:
+                if os.path.basename(path)[:-len('.parquet')] not in referenced:
+                    os.remove(path)
+
+            def entry_size(entry: dict) -> int:
+                path = self._entry_path(entry['key'])
+                return os.path.getsize(path) if os.path.exists(path) else 0
+
+            total = sum(entry_size(entry) for entry in live.values())
+            for dot_notation, entry in sorted(live.items(), key=lambda item: item[1]['created_at']):
+                if total <= self.max_size * 1024 * 1024:
+                    break
+                total -= entry_size(entry)
+                if os.path.exists(self._entry_path(entry['key'])):
+                    os.remove(self._entry_path(entry['key']))
+                del live[dot_notation]
+            if len(live) < len(index):
+                logger.info(f"Evicted {len(index) - len(live)} relations from the sample cache.")
+            self._write_index(live)
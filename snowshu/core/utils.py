@@ -1,3 +1,4 @@
+import json
 import os
 import re
 import uuid
@@ -8,6 +9,7 @@ from typing import TYPE_CHECKING, Any, Optional, TextIO, Type, Union, List
 import logging
 import yaml
 import docker
+import pandas as pd
 
 from snowshu.configs import Architecture, ARCH_MAP
 if TYPE_CHECKING:
@@ -53,6 +55,33 @@ def case_insensitive_dict_value(dictionary, caseless_key) -> Any:
     return dictionary[lowered[caseless_key.lower()]]
 
 
+def decode_json_column(values: pd.Series, label: str) -> pd.Series:
+    """decodes the JSON text cells of a column.
+
+    Every text cell is decoded on its own, so a malformed cell can never be merged with
+    its neighbours into valid JSON. Each bad cell is reported by row and replaced with None.
+
+    ARGS:
+        - values: The column to decode, cells that are not text are kept as they are.
+        - label: The name of the column to report bad cells with.
+    RETURNS:
+        the decoded column.
+    """
+    texts = values[values.map(lambda value: isinstance(value, str))]
+    if texts.empty:
+        return values
+    decoded = list()
+    for row, text in texts.items():
+        try:
+            decoded.append(json.loads(text))
+        except ValueError as exc:
+            logger.warning(f"Invalid JSON in {label} at row {row}, replacing with NULL: {exc}")
+            decoded.append(None)
+    result = values.astype(object)
+    result.loc[texts.index] = pd.Series(decoded, index=texts.index, dtype=object)
+    return result
+
+
 def key_for_value(dictionary, value):
     """finds the key for a given value in a dict."""
     return list(dictionary.keys())[list(dictionary.values()).index(value)]
@@ -14,5 +14,9 @@ class UnableToExecuteCopyReplicaCommand(Exception):
     pass
 
 
-class UnableToStartPostgres(Exception):
+class UnableToStartTarget(Exception):
+    pass
+
+
+class UnableToStartPostgres(UnableToStartTarget):
     pass
@@ -1 +1,5 @@
 from .bernoulli_sample_method import BernoulliSampleMethod
+from .hash_sample_method import HashSampleMethod
+from .system_sample_method import SystemSampleMethod
+from .time_window_sample_method import TimeWindowSampleMethod
+from .stratified_sample_method import StratifiedSampleMethod
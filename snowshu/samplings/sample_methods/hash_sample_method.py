@@ -0,0 +1,48 @@
+from typing import List, Optional
+
+from snowshu.core.samplings.bases.base_sample_method import BaseSampleMethod
+
+
+class HashSampleMethod(BaseSampleMethod):
+    """Deterministic sample selection by hashing each row.
+
+    A row is selected when its seeded hash falls in the lowest ``probability`` share of the
+    hash space, so the same population, seed and key columns always select the same rows.
+
+    Args:
+        probability: the share of the population to select, from 0.0 to 1.0
+        seed: mixed into the hash so different seeds select different rows. Default 0
+        key_columns: the columns to hash. Default ``None`` hashes every column of the row
+        rows: the number of rows the sample is expected to return, used to select by rows
+            wherever the population share does not apply
+
+    Example:
+        ``HashSampleMethod(0.3, seed=42, key_columns=['ID'])`` would give you the same
+        aprox. 30% of the population on every run.
+    """
+    name = 'HASH'
+    buckets = 1000000
+
+    def __init__(self,
+                 probability: float,
+                 seed: int = 0,
+                 key_columns: Optional[List[str]] = None,
+                 rows: Optional[int] = None):
+        assert 0 <= probability <= 1
+        self._probability = probability
+        self.seed = seed
+        self.key_columns = key_columns
+        self._rows = rows
+
+    @property
+    def probability(self) -> float:
+        return self._probability
+
+    @property
+    def rows(self) -> Optional[int]:
+        return self._rows
+
+    @property
+    def threshold(self) -> int:
+        """the number of hash buckets (out of ``buckets``) that are selected"""
+        return round(self._probability * self.buckets)
@@ -0,0 +1,38 @@
+from typing import Any, Dict, Optional
+
+from snowshu.core.samplings.bases.base_sample_method import BaseSampleMethod
+
+
+class StratifiedSampleMethod(BaseSampleMethod):
+    """Sample selection of a random quota of rows from every stratum of a categorical column.
+
+    Each stratum gets its quota, or ``probability`` of its rows without quotas, but never fewer than
+    ``min_rows_per_stratum`` (or the whole stratum if it is smaller), so rare categories are always represented.
+
+    Args:
+        column: the categorical column that defines the strata
+        probability: the share of the rows of each stratum to select, from 0.0 to 1.0
+        min_rows_per_stratum: the minimum number of rows to select from each stratum
+        quotas: the number of rows to select from each stratum. Strata without a quota get
+            ``min_rows_per_stratum``. Default ``None`` selects by ``probability`` instead
+
+    Example:
+        ``StratifiedSampleMethod('REGION', 0.01, 10)`` would give you aprox. 1% of the rows of every region,
+        and at least 10 rows of every region.
+    """
+    name = 'STRATIFIED'
+
+    def __init__(self,
+                 column: str,
+                 probability: float,
+                 min_rows_per_stratum: int,
+                 quotas: Optional[Dict[Any, int]] = None):
+        assert 0 <= probability <= 1
+        self.column = column
+        self._probability = probability
+        self.min_rows_per_stratum = min_rows_per_stratum
+        self.quotas = quotas or dict()
+
+    @property
+    def probability(self) -> float:
+        return self._probability
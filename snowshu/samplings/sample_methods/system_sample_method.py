@@ -0,0 +1,42 @@
+from typing import Optional
+
+from snowshu.core.samplings.bases.base_sample_method import BaseSampleMethod
+
+
+class SystemSampleMethod(BaseSampleMethod):
+    """Sample selection of whole storage blocks using the SYSTEM (block) sampling method.
+
+    Block sampling only reads the selected blocks, so it is much cheaper than Bernoulli
+    sampling on very large tables, at the cost of rows from the same block being selected together.
+
+    Args:
+        probability: the percent of blocks to select, from 0 to 100
+        seed: makes the selection repeatable. Default ``None`` selects different blocks each run
+        rows: the number of rows the block sample is expected to return, used to sample by rows
+            wherever block sampling is not possible
+        top_up_rows: the number of rows to add with Bernoulli sampling when the blocks come up short.
+            Default ``None`` adds none
+
+    Example:
+        ``SystemSampleMethod(0.5, seed=42)`` would give you the same aprox. 0.5% of the blocks of a table on every run.
+    """
+    name = 'SYSTEM'
+
+    def __init__(self,
+                 probability: float,
+                 seed: Optional[int] = None,
+                 rows: Optional[int] = None,
+                 top_up_rows: Optional[int] = None):
+        assert 0 <= probability <= 100
+        self._probability = probability
+        self.seed = seed
+        self._rows = rows
+        self.top_up_rows = top_up_rows
+
+    @property
+    def probability(self) -> float:
+        return self._probability
+
+    @property
+    def rows(self) -> Optional[int]:
+        return self._rows
@@ -0,0 +1,38 @@
+from typing import Any, Optional
+
+from snowshu.core.samplings.bases.base_sample_method import BaseSampleMethod
+
+
+class TimeWindowSampleMethod(BaseSampleMethod):
+    """Sample selection of the rows inside a time window, using Bernoulli sampling within the window.
+
+    The window is applied as a range filter on the timestamp column, so a source that is
+    clustered on that column only reads the partitions inside the window.
+
+    Args:
+        column: the timestamp (or date) column the window applies to
+        lower_bound: the start of the window, inclusive
+        upper_bound: the end of the window, inclusive
+        probability: the share of the rows inside the window to select, from 0.0 to 1.0.
+            Default ``None`` selects every row inside the window
+
+    Example:
+        ``TimeWindowSampleMethod('CREATED_AT', date(2024, 1, 1), date(2024, 1, 31), 0.1)`` would give you
+        aprox. 10% of the rows created in January 2024.
+    """
+    name = 'TIME_WINDOW'
+
+    def __init__(self,
+                 column: str,
+                 lower_bound: Any,
+                 upper_bound: Any,
+                 probability: Optional[float] = None):
+        assert probability is None or 0 <= probability <= 1
+        self.column = column
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        self._probability = probability
+
+    @property
+    def probability(self) -> Optional[float]:
+        return self._probability
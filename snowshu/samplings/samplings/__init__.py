@@ -1,2 +1,6 @@
 from .brute_force_sampling import BruteForceSampling
 from .default_sampling import DefaultSampling
+from .deterministic_sampling import DeterministicSampling
+from .adaptive_sampling import AdaptiveSampling
+from .time_window_sampling import TimeWindowSampling
+from .stratified_sampling import StratifiedSampling
@@ -0,0 +1,112 @@
+import logging
+from typing import TYPE_CHECKING, Optional
+from snowshu.configs import (MAX_ALLOWED_ROWS,
+                             SYSTEM_SAMPLING_OVERDRAW,
+                             SYSTEM_SAMPLING_THRESHOLD)
+
+from snowshu.core.samplings.bases.base_sampling import BaseSampling
+from snowshu.samplings.sample_methods import BernoulliSampleMethod, SystemSampleMethod
+from snowshu.samplings.sample_sizes import CochransSampleSize
+
+if TYPE_CHECKING:
+    from snowshu.core.models.relation import Relation
+    from snowshu.adapters.source_adapters.base_source_adapter import BaseSourceAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveSampling(BaseSampling):
+    """
+    Size-adaptive sampling using :class:`Cochrans <snowshu.samplings.sample_sizes.cochrans_sample_size.CochransSampleSize>`
+    theorem for sample size. Small relations use :class:`Bernoulli
+    <snowshu.samplings.sample_methods.bernoulli_sample_method.BernoulliSampleMethod>` sampling like
+    :class:`DefaultSampling <snowshu.samplings.samplings.default_sampling.DefaultSampling>`, relations over the
+    threshold use :class:`System <snowshu.samplings.sample_methods.system_sample_method.SystemSampleMethod>`
+    block sampling so only a fraction of the table is read.
+
+    The block probability is derived from the Cochran's size and checked against the source. If the blocks come
+    up short it is corrected once, and if they are still short the missing rows are topped up with Bernoulli
+    sampling. A block sample that comes up empty falls back to Bernoulli sampling.
+
+    Args:
+        margin_of_error: The acceptable error % expressed in a decimal from 0.01 to 0.10 (1% to 10%).
+            Default 0.02 (2%).
+        confidence: The confidence interval to be observed for the sample expressed in a decimal
+            from 0.01 to 0.99 (1% to 99%). Default 0.99 (99%).
+        min_sample_size: The minimum number of records to retrieve from the population. Default 1000.
+        system_threshold: The population size from which block sampling is used. Default 100M rows.
+        system_threshold_bytes: The table size in bytes from which block sampling is used. Default None (disabled).
+        seed: The seed for the block selection, so the checked blocks are the sampled blocks. Default 0.
+    """
+
+    size: int
+
+    def __init__(self,  # noqa pylint: disable=too-many-arguments
+                 margin_of_error: float = 0.02,
+                 confidence: float = 0.99,
+                 min_sample_size: int = 1000,
+                 max_allowed_rows: int = MAX_ALLOWED_ROWS,
+                 system_threshold: int = SYSTEM_SAMPLING_THRESHOLD,
+                 system_threshold_bytes: Optional[int] = None,
+                 seed: int = 0):
+        self.min_sample_size = min_sample_size
+        self.max_allowed_rows = max_allowed_rows
+        self.system_threshold = system_threshold
+        self.system_threshold_bytes = system_threshold_bytes
+        self.seed = seed
+        self.sample_size_method = CochransSampleSize(margin_of_error,
+                                                     confidence)
+
+    def _use_system_sampling(self,
+                             relation: "Relation",
+                             source_adapter: "BaseSourceAdapter") -> bool:
+        if relation.population_size >= self.system_threshold:
+            return True
+        if self.system_threshold_bytes is None:
+            return False
+        size_in_bytes = source_adapter.relation_bytes([relation])[0]
+        return size_in_bytes >= self.system_threshold_bytes
+
+    def prepare(self,
+                relation: "Relation",
+                source_adapter: "BaseSourceAdapter") -> None:
+        """Runs all necessary pre-activities and instantiates the sample method.
+
+        For relations over the threshold this counts the rows of the seeded block sample,
+        so the blocks that are checked are the blocks that will be sampled.
+
+        Args:
+            relation: The :class:`Relation <snowshu.core.models.relation.Relation>` object to prepare.
+            source_adapter: The :class:`source adapter
+                <snowshu.adapters.source_adapters.base_source_adapter.BaseSourceAdapter>` instance to use
+                for executing prepare queries.
+        """
+        self.size = max(self.sample_size_method.size(
+                        relation.population_size),
+                        self.min_sample_size)
+        self.sample_method = BernoulliSampleMethod(self.size,
+                                                   units='rows')
+        if self.size >= relation.population_size or not self._use_system_sampling(relation, source_adapter):
+            return
+
+        percent = min(100.0 * SYSTEM_SAMPLING_OVERDRAW * self.size / relation.population_size, 100.0)
+        for attempt in range(2):
+            sample_method = SystemSampleMethod(percent, seed=self.seed, rows=self.size)
+            sampled = source_adapter.scalar_query(source_adapter.sample_count_statement(relation, sample_method))
+            if sampled >= self.size:
+                self.sample_method = sample_method
+                return
+            if not sampled or percent >= 100.0 or attempt:
+                break
+            # the blocks held fewer rows than average, scale the probability up by the shortfall
+            percent = min(percent * SYSTEM_SAMPLING_OVERDRAW * self.size / sampled, 100.0)
+        if not sampled:
+            logger.info(f"Block sample of {relation.dot_notation} came up empty, "
+                        "falling back to Bernoulli sampling.")
+            return
+        logger.info(f"Block sample of {relation.dot_notation} came up {self.size - sampled} rows short "
+                    f"of {self.size}, topping up with Bernoulli sampling.")
+        self.sample_method = SystemSampleMethod(percent,
+                                                seed=self.seed,
+                                                rows=self.size,
+                                                top_up_rows=self.size - sampled)
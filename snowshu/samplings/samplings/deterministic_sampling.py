@@ -0,0 +1,69 @@
+from typing import TYPE_CHECKING, List, Optional
+from snowshu.configs import MAX_ALLOWED_ROWS
+
+from snowshu.core.samplings.bases.base_sampling import BaseSampling
+from snowshu.samplings.sample_methods import HashSampleMethod
+from snowshu.samplings.sample_sizes import CochransSampleSize
+
+if TYPE_CHECKING:
+    from snowshu.core.models.relation import Relation
+    from snowshu.adapters.source_adapters.base_source_adapter import BaseSourceAdapter
+
+
+class DeterministicSampling(BaseSampling):
+    """
+    Repeatable sampling using :class:`Cochrans <snowshu.samplings.sample_sizes.cochrans_sample_size.CochransSampleSize>`
+    theorem for sample size and :class:`Hash <snowshu.samplings.sample_methods.hash_sample_method.HashSampleMethod>`
+    sampling.
+
+    Identical configurations over identical source data select identical rows, which makes
+    samples comparable between runs.
+
+    Args:
+        margin_of_error: The acceptable error % expressed in a decimal from 0.01 to 0.10 (1% to 10%).
+            Default 0.02 (2%).
+        confidence: The confidence interval to be observed for the sample expressed in a decimal
+            from 0.01 to 0.99 (1% to 99%). Default 0.99 (99%).
+        min_sample_size: The minimum number of records to retrieve from the population. Default 1000.
+        seed: The seed mixed into the row hash. Default 0.
+        key_columns: The columns to hash, ideally a stable primary key. Default hashes the full row.
+    """
+
+    size: int
+
+    def __init__(self,  # noqa pylint: disable=too-many-arguments
+                 margin_of_error: float = 0.02,
+                 confidence: float = 0.99,
+                 min_sample_size: int = 1000,
+                 max_allowed_rows: int = MAX_ALLOWED_ROWS,
+                 seed: int = 0,
+                 key_columns: Optional[List[str]] = None):
+        self.min_sample_size = min_sample_size
+        self.max_allowed_rows = max_allowed_rows
+        self.seed = seed
+        self.key_columns = key_columns
+        self.sample_size_method = CochransSampleSize(margin_of_error,
+                                                     confidence)
+
+    def prepare(self,
+                relation: "Relation",
+                source_adapter: "BaseSourceAdapter") -> None:
+        """Runs all necessary pre-activities and instantiates the sample method.
+
+        The Cochran's sample size is converted into the share of the population to select.
+
+        Args:
+            relation: The :class:`Relation <snowshu.core.models.relation.Relation>` object to prepare.
+            source_adapter: The :class:`source adapter
+                <snowshu.adapters.source_adapters.base_source_adapter.BaseSourceAdapter>` instance to use
+                for executing prepare queries.
+        """
+        self.size = max(self.sample_size_method.size(
+                        relation.population_size),
+                        self.min_sample_size)
+        probability = min(self.size / relation.population_size, 1.0) if relation.population_size else 1.0
+
+        self.sample_method = HashSampleMethod(probability,
+                                              seed=self.seed,
+                                              key_columns=self.key_columns,
+                                              rows=self.size)
@@ -0,0 +1,101 @@
+import logging
+import math
+from typing import TYPE_CHECKING
+from snowshu.configs import MAX_ALLOWED_ROWS, STRATIFIED_MAX_STRATA
+
+from snowshu.core.samplings.bases.base_sampling import BaseSampling
+from snowshu.samplings.sample_methods import StratifiedSampleMethod
+from snowshu.samplings.sample_sizes import CochransSampleSize
+
+if TYPE_CHECKING:
+    from snowshu.core.models.relation import Relation
+    from snowshu.adapters.source_adapters.base_source_adapter import BaseSourceAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class StratifiedSampling(BaseSampling):
+    """
+    Stratified sampling over a categorical column, using :class:`Cochrans
+    <snowshu.samplings.sample_sizes.cochrans_sample_size.CochransSampleSize>` theorem for the overall
+    sample size and :class:`Stratified <snowshu.samplings.sample_methods.stratified_sample_method.StratifiedSampleMethod>`
+    sampling to spread it over the strata.
+
+    Every stratum gets at least ``min_rows_per_stratum`` rows, the rest of the sample is allocated
+    proportionally to the stratum sizes.
+
+    Args:
+        strata_column: The categorical column that defines the strata (ie tenant, region or event type).
+        min_rows_per_stratum: The minimum number of records to retrieve from each stratum. Default 10.
+        margin_of_error: The acceptable error % expressed in a decimal from 0.01 to 0.10 (1% to 10%).
+            Default 0.02 (2%).
+        confidence: The confidence interval to be observed for the sample expressed in a decimal
+            from 0.01 to 0.99 (1% to 99%). Default 0.99 (99%).
+        min_sample_size: The minimum number of records to retrieve from the population. Default 1000.
+        max_strata: The maximum number of distinct values of the strata column. Default 1000.
+    """
+
+    size: int
+
+    def __init__(self,  # noqa pylint: disable=too-many-arguments
+                 strata_column: str,
+                 min_rows_per_stratum: int = 10,
+                 margin_of_error: float = 0.02,
+                 confidence: float = 0.99,
+                 min_sample_size: int = 1000,
+                 max_allowed_rows: int = MAX_ALLOWED_ROWS,
+                 max_strata: int = STRATIFIED_MAX_STRATA):
+        self.strata_column = strata_column
+        self.min_rows_per_stratum = min_rows_per_stratum
+        self.max_strata = max_strata
+        self.min_sample_size = min_sample_size
+        self.max_allowed_rows = max_allowed_rows
+        self.sample_size_method = CochransSampleSize(margin_of_error,
+                                                     confidence)
+
+    def prepare(self,
+                relation: "Relation",
+                source_adapter: "BaseSourceAdapter") -> None:
+        """Runs all necessary pre-activities and instantiates the sample method.
+
+        Collects the stratum histogram in a single query and derives the quota of each
+        stratum so that, with the per-stratum minimum, the quotas add up to the Cochran's
+        sample size.
+
+        Args:
+            relation: The :class:`Relation <snowshu.core.models.relation.Relation>` object to prepare.
+            source_adapter: The :class:`source adapter
+                <snowshu.adapters.source_adapters.base_source_adapter.BaseSourceAdapter>` instance to use
+                for executing prepare queries.
+        """
+        histogram = source_adapter._safe_query(  # noqa pylint: disable=protected-access
+            source_adapter.histogram_statement(relation, self.strata_column, self.max_strata + 1))
+        histogram.columns = [column.lower() for column in histogram.columns]
+        if len(histogram) > self.max_strata:
+            message = (f"{relation.dot_notation}.{self.strata_column} has more than {self.max_strata} distinct "
+                       "values, which is too many to stratify on. Pick a column with fewer values "
+                       "or raise max_strata.")
+            logger.error(message)
+            raise ValueError(message)
+        strata = dict(zip(histogram['stratum'], histogram['stratum_size'].astype(int)))
+        population = sum(strata.values())
+        target = min(max(self.sample_size_method.size(population), self.min_sample_size),
+                     self.max_allowed_rows)
+
+        # strata at or below the minimum are taken whole, the remaining target is spread proportionally
+        floored = sum(size for size in strata.values() if size <= self.min_rows_per_stratum)
+        proportional = sum(size for size in strata.values() if size > self.min_rows_per_stratum)
+        probability = min(max(target - floored, 0) / proportional, 1.0) if proportional else 1.0
+
+        quotas = {stratum: min(size, max(math.ceil(size * probability), self.min_rows_per_stratum))
+                  for stratum, size in strata.items()}
+        self.size = sum(quotas.values())
+        if self.size > self.max_allowed_rows:
+            logger.warning(f"{len(strata)} strata of {relation.dot_notation}.{self.strata_column} need "
+                           f"{self.size} rows at {self.min_rows_per_stratum} rows per stratum, "
+                           f"which is over the max allowed rows ({self.max_allowed_rows}).")
+
+        self.sample_method = StratifiedSampleMethod(self.strata_column,
+                                                    probability,
+                                                    self.min_rows_per_stratum,
+                                                    quotas)
@@ -0,0 +1,84 @@
+import datetime
+import logging
+from typing import TYPE_CHECKING
+from snowshu.configs import MAX_ALLOWED_ROWS
+
+from snowshu.core.samplings.bases.base_sampling import BaseSampling
+from snowshu.samplings.sample_methods import TimeWindowSampleMethod
+from snowshu.samplings.sample_sizes import CochransSampleSize
+
+if TYPE_CHECKING:
+    from snowshu.core.models.relation import Relation
+    from snowshu.adapters.source_adapters.base_source_adapter import BaseSourceAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class TimeWindowSampling(BaseSampling):
+    """
+    Recency sampling that only selects rows from the most recent time window, using
+    :class:`Cochrans <snowshu.samplings.sample_sizes.cochrans_sample_size.CochransSampleSize>` theorem
+    for the sample size within the window and :class:`TimeWindow
+    <snowshu.samplings.sample_methods.time_window_sample_method.TimeWindowSampleMethod>` sampling.
+
+    The window ends at the latest value of the timestamp column, so relations that are no longer
+    loaded still produce a sample.
+
+    Args:
+        timestamp_column: The timestamp (or date) column to window on, ideally the clustering key.
+        window_days: The length of the window in days. Default 30.
+        margin_of_error: The acceptable error % expressed in a decimal from 0.01 to 0.10 (1% to 10%).
+            Default 0.02 (2%).
+        confidence: The confidence interval to be observed for the sample expressed in a decimal
+            from 0.01 to 0.99 (1% to 99%). Default 0.99 (99%).
+        min_sample_size: The minimum number of records to retrieve from the window. Default 1000.
+    """
+
+    size: int
+
+    def __init__(self,  # noqa pylint: disable=too-many-arguments
+                 timestamp_column: str,
+                 window_days: int = 30,
+                 margin_of_error: float = 0.02,
+                 confidence: float = 0.99,
+                 min_sample_size: int = 1000,
+                 max_allowed_rows: int = MAX_ALLOWED_ROWS):
+        self.timestamp_column = timestamp_column
+        self.window_days = window_days
+        self.min_sample_size = min_sample_size
+        self.max_allowed_rows = max_allowed_rows
+        self.sample_size_method = CochransSampleSize(margin_of_error,
+                                                     confidence)
+
+    def prepare(self,
+                relation: "Relation",
+                source_adapter: "BaseSourceAdapter") -> None:
+        """Runs all necessary pre-activities and instantiates the sample method.
+
+        Finds the window bounds from the latest timestamp and counts the rows inside the
+        window, so the compiled sample is a literal range filter the source can prune on.
+
+        Args:
+            relation: The :class:`Relation <snowshu.core.models.relation.Relation>` object to prepare.
+            source_adapter: The :class:`source adapter
+                <snowshu.adapters.source_adapters.base_source_adapter.BaseSourceAdapter>` instance to use
+                for executing prepare queries.
+        """
+        upper_bound = source_adapter.scalar_query(
+            source_adapter.max_value_statement(relation, self.timestamp_column))
+        if upper_bound is None:
+            logger.warning(f"{relation.dot_notation}.{self.timestamp_column} has no values, "
+                           "the time window sample will be empty.")
+            upper_bound = datetime.datetime.now()
+        lower_bound = upper_bound - datetime.timedelta(days=self.window_days)
+
+        window_population = source_adapter.scalar_query(source_adapter.sample_count_statement(
+            relation, TimeWindowSampleMethod(self.timestamp_column, lower_bound, upper_bound)))
+        self.size = max(self.sample_size_method.size(window_population),
+                        self.min_sample_size)
+        probability = min(self.size / window_population, 1.0) if window_population else 1.0
+
+        self.sample_method = TimeWindowSampleMethod(self.timestamp_column,
+                                                    lower_bound,
+                                                    upper_bound,
+                                                    probability)
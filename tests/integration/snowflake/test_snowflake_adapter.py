@@ -165,14 +165,15 @@ def test_union_constraint_statement(sf_adapter):
             (SELECT
                 *
             FROM
-            {sf_adapter.quoted_dot_notation(subject)}
+            {sf_adapter.quoted_dot_notation(subject)} AS SNOWSHU_OUTLIER_SUBJECT
             WHERE
-                {subject_key}
-            NOT IN
-            (SELECT
-                {constraint_key}
-            FROM
-            {sf_adapter.quoted_dot_notation(constraint)})
+                ( SNOWSHU_OUTLIER_SUBJECT.{subject_key} IS NOT NULL
+                AND NOT EXISTS (SELECT
+                    1
+                FROM
+                {sf_adapter.quoted_dot_notation(constraint)} AS SNOWSHU_OUTLIER_CONSTRAINT
+                WHERE
+                    SNOWSHU_OUTLIER_CONSTRAINT.{constraint_key} = SNOWSHU_OUTLIER_SUBJECT.{subject_key}) )
             LIMIT {max_number_of_outliers})
             """)
 
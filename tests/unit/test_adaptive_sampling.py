@@ -0,0 +1,70 @@
+from unittest import mock
+import pytest
+
+from snowshu.samplings.samplings import AdaptiveSampling
+
+
+@pytest.fixture()
+def mock_args():
+    mock_rel=mock.MagicMock()
+    mock_source_adapter=mock.MagicMock()
+    yield mock_rel,mock_source_adapter
+
+
+ONE_BILLION_ROWS=int(1e9)
+ONE_HUNDRED_THOUSAND_ROWS=int(1e5)
+def test_adaptive_sampling_below_threshold(mock_args):
+    mock_args[0].population_size=ONE_HUNDRED_THOUSAND_ROWS
+    adaptive=AdaptiveSampling()
+    adaptive.prepare(*mock_args)
+    assert adaptive.sample_method.name == 'BERNOULLI'
+    mock_args[1].scalar_query.assert_not_called()
+
+
+def test_adaptive_sampling_system(mock_args):
+    mock_args[0].population_size=ONE_BILLION_ROWS
+    mock_args[1].scalar_query.return_value=ONE_HUNDRED_THOUSAND_ROWS
+    adaptive=AdaptiveSampling(min_sample_size=10000, seed=42)
+    adaptive.prepare(*mock_args)
+    assert adaptive.sample_method.name == 'SYSTEM'
+    assert adaptive.sample_method.seed == 42
+    assert adaptive.sample_method.rows == 10000
+    assert adaptive.sample_method.probability == pytest.approx(0.0011)
+
+
+def test_adaptive_sampling_corrects_probability(mock_args):
+    mock_args[0].population_size=ONE_BILLION_ROWS
+    mock_args[1].scalar_query.side_effect=[5000, 12000]
+    adaptive=AdaptiveSampling(min_sample_size=10000)
+    adaptive.prepare(*mock_args)
+    assert adaptive.sample_method.name == 'SYSTEM'
+    assert adaptive.sample_method.probability == pytest.approx(0.0011 * 1.1 * 2)
+
+
+def test_adaptive_sampling_tops_up_with_bernoulli(mock_args):
+    mock_args[0].population_size=ONE_BILLION_ROWS
+    mock_args[1].scalar_query.side_effect=[5000, 6000]
+    adaptive=AdaptiveSampling(min_sample_size=10000)
+    adaptive.prepare(*mock_args)
+    assert adaptive.sample_method.name == 'SYSTEM'
+    assert adaptive.sample_method.probability == pytest.approx(0.0011 * 1.1 * 2)
+    assert adaptive.sample_method.top_up_rows == 4000
+
+
+def test_adaptive_sampling_falls_back_to_bernoulli(mock_args):
+    mock_args[0].population_size=ONE_BILLION_ROWS
+    mock_args[1].scalar_query.return_value=0
+    adaptive=AdaptiveSampling(min_sample_size=10000)
+    adaptive.prepare(*mock_args)
+    assert adaptive.sample_method.name == 'BERNOULLI'
+    assert adaptive.sample_method.rows == 10000
+
+
+def test_adaptive_sampling_byte_threshold(mock_args):
+    mock_args[0].population_size=ONE_HUNDRED_THOUSAND_ROWS * 10
+    mock_args[1].relation_bytes.return_value=[int(1e12)]
+    mock_args[1].scalar_query.return_value=20000
+    adaptive=AdaptiveSampling(min_sample_size=10000, system_threshold_bytes=int(1e11))
+    adaptive.prepare(*mock_args)
+    assert adaptive.sample_method.name == 'SYSTEM'
+    mock_args[1].relation_bytes.assert_called_once_with([mock_args[0]])
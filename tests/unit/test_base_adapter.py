@@ -1,4 +1,6 @@
+import pandas as pd
 import pytest
+import sqlalchemy
 from unittest.mock import patch
 
 import snowshu.core.models.materializations as mz
@@ -101,3 +103,14 @@ def test_build_catalog():
             assert not r in catalog
         for r in included_relations:
             assert r in catalog
+
+
+def test_spill_query(tmp_path):
+    base = StubbedAdapter()
+    query = " UNION ALL ".join(f"SELECT {i} AS id" for i in range(5))
+    with patch.object(StubbedAdapter, 'get_connection', return_value=sqlalchemy.create_engine('sqlite://')):
+        paths = base._spill_query(query, str(tmp_path), chunksize=2)
+
+    assert len(paths) == 3
+    spilled = pd.concat([pd.read_parquet(path) for path in paths])
+    assert spilled['id'].to_list() == list(range(5))
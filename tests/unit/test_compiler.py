@@ -2,10 +2,13 @@ from unittest import mock
 from unittest.mock import Mock, patch
 import networkx as nx
 import pandas as pd
+import pytest
 
 import snowshu.core.models.data_types as dt
 from snowshu.adapters.source_adapters.snowflake_adapter import SnowflakeAdapter
+from snowshu.configs import INLINE_KEY_SET_LIMIT, SEMI_JOIN_KEY_SET_LIMIT
 from snowshu.core.compile import RuntimeSourceCompiler
+from snowshu.core.models import predicate_strategies as ps
 from snowshu.core.models.attribute import Attribute
 from snowshu.core.models.relation import Relation
 from snowshu.samplings.sample_methods import BernoulliSampleMethod
@@ -226,6 +229,85 @@ def test_run_deps_polymorphic_parentid(stub_relation_set):
     assert query_equalize(parent.compiled_query)==query_equalize(expected_query)
 
 
+def test_run_deps_polymorphic_idtype_union_branches(stub_relation_set):
+    child1 = stub_relation_set.child_relation_type_1
+    child2 = stub_relation_set.child_relation_type_2
+    parent = stub_relation_set.parent_relation_childid_type
+    childid = stub_relation_set.childid_key
+    childtype = stub_relation_set.childtype_key
+    for relation in (child1, child2, parent,):
+        relation = stub_out_sampling(relation)
+        relation.temp_schema = 'mock_schema'
+    parent.polymorphic_union_branches = True
+
+    dag=nx.MultiDiGraph()
+    dag.add_edge(child1,parent,direction="polymorphic",remote_attribute=childid,local_attribute=childid,
+        local_type_attribute=childtype,local_type_overrides=dict())
+    dag.add_edge(child2,parent,direction="polymorphic",remote_attribute=childid,local_attribute=childid,
+        local_type_attribute=childtype,local_type_overrides=dict())
+    adapter=SnowflakeAdapter()
+
+    mock_polymorphic_constraint_statements = [
+        f"({childid} IN ('1','2') AND LOWER({childtype}) = LOWER('CHILD_TYPE_1_RECORD'))",
+        f"({childid} IN ('1','3') AND LOWER({childtype}) = LOWER('CHILD_TYPE_2_RECORD'))",
+    ]
+    _mock = Mock()
+    _mock.polymorphic_constraint_statement.side_effect = mock_polymorphic_constraint_statements
+
+    with patch.object(adapter, 'polymorphic_constraint_statement', new=_mock.polymorphic_constraint_statement):
+        parent = RuntimeSourceCompiler.compile_queries_for_relation(parent,dag,adapter,False)
+
+    # the branches compare overridden type values without wrapping the type column
+    for call in _mock.polymorphic_constraint_statement.call_args_list:
+        assert call.kwargs['exact_type_match'] is True
+
+    # distinct type values can not overlap so the branches are not deduplicated
+    expected_query = f"""
+        SELECT * FROM {adapter.quoted_dot_notation(parent)}
+        WHERE {mock_polymorphic_constraint_statements[0]}
+        UNION ALL
+        SELECT * FROM {adapter.quoted_dot_notation(parent)}
+        WHERE {mock_polymorphic_constraint_statements[1]}
+    """
+    assert query_equalize(parent.compiled_query)==query_equalize(expected_query)
+
+
+def test_run_deps_polymorphic_parentid_union_branches(stub_relation_set):
+    child1 = stub_relation_set.child_relation_type_1
+    child2 = stub_relation_set.child_relation_type_2
+    parent = stub_relation_set.parent_relation_parentid
+    parentid = stub_relation_set.parentid_key
+    for relation in (child1, child2, parent,):
+        relation = stub_out_sampling(relation)
+        relation.temp_schema = 'mock_schema'
+    parent.polymorphic_union_branches = True
+
+    dag=nx.MultiDiGraph()
+    dag.add_edge(child1,parent,direction="polymorphic",remote_attribute=parentid,local_attribute=parentid)
+    dag.add_edge(child2,parent,direction="polymorphic",remote_attribute=parentid,local_attribute=parentid)
+    adapter=SnowflakeAdapter()
+
+    mock_predicate_constraint_statements = [
+        f"({parentid} IN ('1','10'))",
+        f"({parentid} IN ('1','20'))",
+    ]
+    _mock = Mock()
+    _mock.predicate_constraint_statement.side_effect = mock_predicate_constraint_statements
+
+    with patch.object(adapter, 'predicate_constraint_statement', new=_mock.predicate_constraint_statement):
+        parent = RuntimeSourceCompiler.compile_queries_for_relation(parent,dag,adapter,False)
+
+    # without a type attribute the branches may share rows and must be deduplicated
+    expected_query = f"""
+        SELECT * FROM {adapter.quoted_dot_notation(parent)}
+        WHERE {mock_predicate_constraint_statements[0]}
+        UNION
+        SELECT * FROM {adapter.quoted_dot_notation(parent)}
+        WHERE {mock_predicate_constraint_statements[1]}
+    """
+    assert query_equalize(parent.compiled_query)==query_equalize(expected_query)
+
+
 def test_run_deps_directional(stub_relation_set):
     upstream=stub_relation_set.upstream_relation
     downstream=stub_relation_set.downstream_relation
@@ -299,7 +381,10 @@ def test_run_deps_bidirectional_include_outliers(stub_relation_set):
         ,{downstream.scoped_cte('SNOWSHU_DIRECTIONAL_SAMPLE')} AS (
             SELECT * FROM {downstream.scoped_cte('SNOWSHU_FINAL_SAMPLE')} SAMPLE BERNOULLI (1500 ROWS) )
         SELECT * FROM {downstream.scoped_cte('SNOWSHU_DIRECTIONAL_SAMPLE')} UNION
-        (SELECT * FROM {adapter.quoted_dot_notation(downstream)} WHERE id NOT IN (SELECT id FROM {adapter.quoted_dot_notation(upstream)}) LIMIT 100)
+        (SELECT * FROM {adapter.quoted_dot_notation(downstream)} AS SNOWSHU_OUTLIER_SUBJECT
+        WHERE ( SNOWSHU_OUTLIER_SUBJECT.id IS NOT NULL AND NOT EXISTS (SELECT 1
+        FROM {adapter.quoted_dot_notation(upstream)} AS SNOWSHU_OUTLIER_CONSTRAINT
+        WHERE SNOWSHU_OUTLIER_CONSTRAINT.id = SNOWSHU_OUTLIER_SUBJECT.id) ) LIMIT 100)
         """)
 
 
@@ -325,14 +410,15 @@ def test_run_deps_bidirectional_include_outliers(stub_relation_set):
         (SELECT
             *
         FROM
-        {adapter.quoted_dot_notation(upstream)}
+        {adapter.quoted_dot_notation(upstream)} AS SNOWSHU_OUTLIER_SUBJECT
         WHERE
-            id
-        NOT IN
-            (SELECT
-                id
+            ( SNOWSHU_OUTLIER_SUBJECT.id IS NOT NULL
+            AND NOT EXISTS (SELECT
+                1
             FROM
-        {adapter.quoted_dot_notation(downstream)}) LIMIT 100)
+            {adapter.quoted_dot_notation(downstream)} AS SNOWSHU_OUTLIER_CONSTRAINT
+            WHERE
+                SNOWSHU_OUTLIER_CONSTRAINT.id = SNOWSHU_OUTLIER_SUBJECT.id) ) LIMIT 100)
         """
         )
 
@@ -1036,4 +1122,36 @@ def test_run_deps_mixed_multi_deps():
             *
         FROM
         {relations['rel_e'].scoped_cte('SNOWSHU_DIRECTIONAL_SAMPLE')}
-    """)
\ No newline at end of file
+    """)
+
+@pytest.mark.parametrize('cardinality, expected', [
+    (1, ps.INLINE),
+    (INLINE_KEY_SET_LIMIT, ps.INLINE),
+    (INLINE_KEY_SET_LIMIT + 1, ps.SEMI_JOIN),
+    (SEMI_JOIN_KEY_SET_LIMIT + 1, ps.EXISTS),
+])
+def test_choose_predicate_strategy(cardinality, expected):
+    assert RuntimeSourceCompiler.choose_predicate_strategy(cardinality) == expected
+
+
+def test_run_deps_directional_adaptive_predicates(stub_relation_set):
+    upstream = stub_relation_set.upstream_relation
+    downstream = stub_relation_set.downstream_relation
+    for relation in (downstream, upstream,):
+        relation.attributes = [Attribute('id', dt.INTEGER)]
+        relation = stub_out_sampling(relation)
+        relation.temp_schema = 'mock_schema'
+    downstream.adaptive_predicates = True
+
+    dag = nx.MultiDiGraph()
+    dag.add_edge(upstream, downstream, direction="directional", remote_attribute='id', local_attribute='id')
+    adapter = SnowflakeAdapter()
+
+    with patch.object(adapter, 'key_set_cardinality', return_value=3), \
+         patch.object(adapter, 'predicate_constraint_statement', return_value="id IN ('1', '2', '3')") as predicate:
+        downstream = RuntimeSourceCompiler.compile_queries_for_relation(downstream, dag, adapter, False)
+
+    predicate.assert_called_once_with(upstream, False, 'id', 'id', False, ps.INLINE, downstream)
+    assert downstream.predicate_strategies == (
+        f"{upstream.dot_notation}.id -> {downstream.dot_notation}.id: INLINE (3 keys)",)
+    assert "WHERE id IN ('1', '2', '3')" in downstream.compiled_query
@@ -1,6 +1,7 @@
+import pandas as pd
 import pytest
 
-from snowshu.core.utils import case_insensitive_dict_value, correct_case
+from snowshu.core.utils import case_insensitive_dict_value, correct_case, decode_json_column
 
 
 def test_case_insensitive_search():
@@ -26,3 +27,16 @@ def test_correct_case():
 
     [correct_test_suite(correct,x) for x in (True,False,)]
     [leave_test_suite(leave,x) for x in (True,False,)]
+
+
+def test_decode_json_column():
+    decoded = decode_json_column(pd.Series(['{"a": 1}', None, '[1, 2]', {"b": 2}]), 'content')
+    assert decoded.to_list() == [{"a": 1}, None, [1, 2], {"b": 2}]
+
+    # bad cells are replaced one by one, the valid ones are still decoded
+    decoded = decode_json_column(pd.Series(['{"a": 1}', 'not json', '1,2', '3']), 'content')
+    assert decoded.to_list() == [{"a": 1}, None, None, 3]
+
+    # adjacent malformed cells that would join into valid JSON are still rejected
+    decoded = decode_json_column(pd.Series(['[1', '2]', '4,5']), 'content')
+    assert decoded.to_list() == [None, None, None]
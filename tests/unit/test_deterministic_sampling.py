@@ -0,0 +1,41 @@
+from unittest import mock
+import pytest
+
+from snowshu.core.samplings.utils import get_sampling_from_partial
+from snowshu.samplings.samplings import DeterministicSampling
+
+
+@pytest.fixture()
+def mock_args():
+    mock_rel=mock.MagicMock()
+    mock_source_adapter=mock.MagicMock()
+    yield mock_rel,mock_source_adapter
+
+
+ONE_HUNDRED_THOUSAND_ROWS=1e5
+def test_deterministic_sampling_probability(mock_args):
+    mock_args[0].population_size=ONE_HUNDRED_THOUSAND_ROWS
+    deterministic=DeterministicSampling(min_sample_size=20000)
+    deterministic.prepare(*mock_args)
+    assert deterministic.sample_method.probability == 0.2
+    assert deterministic.sample_method.threshold == 200000
+    assert deterministic.sample_method.rows == 20000
+
+
+def test_deterministic_sampling_small_population(mock_args):
+    mock_args[0].population_size=10
+    deterministic=DeterministicSampling()
+    deterministic.prepare(*mock_args)
+    assert deterministic.sample_method.probability == 1.0
+
+    mock_args[0].population_size=0
+    deterministic.prepare(*mock_args)
+    assert deterministic.sample_method.probability == 1.0
+
+
+def test_deterministic_sampling_from_partial(mock_args):
+    mock_args[0].population_size=ONE_HUNDRED_THOUSAND_ROWS
+    deterministic=get_sampling_from_partial(dict(deterministic=dict(seed=42, key_columns=['ID'])))
+    deterministic.prepare(*mock_args)
+    assert deterministic.sample_method.seed == 42
+    assert deterministic.sample_method.key_columns == ['ID']
@@ -1,3 +1,9 @@
+import io
+import tarfile
+import threading
+from unittest.mock import MagicMock, patch
+
+import docker
 import pytest
 
 from snowshu.core.docker import SnowShuDocker
@@ -25,4 +31,232 @@ def test_makes_replica_name_safe():
 
     for rep in INVALID_REP_NAMES:
         with pytest.raises(ValueError):
-            shdocker.sanitize_replica_name(rep)
\ No newline at end of file
+            shdocker.sanitize_replica_name(rep)
+
+def test_copy_container_directory():
+    source, target = MagicMock(), MagicMock()
+    source.get_archive.return_value = (iter([b'tar']), dict())
+    SnowShuDocker.copy_container_directory(source, target, '/snowshu_replica_data/')
+    source.get_archive.assert_called_once_with('/snowshu_replica_data/')
+    assert target.put_archive.call_count == 2
+    # the target directory is cleared by replacing it with an empty file first
+    placeholder = target.put_archive.call_args_list[0]
+    assert placeholder.args[0] == '/'
+    with tarfile.open(fileobj=io.BytesIO(placeholder.args[1])) as archive:
+        members = archive.getmembers()
+    assert [(member.name, member.isfile(), member.size) for member in members] == \
+        [('snowshu_replica_data', True, 0)]
+    assert target.put_archive.call_args_list[1].args == ('/', source.get_archive.return_value[0])
+
+
+def make_archive(members):
+    archive_bytes = io.BytesIO()
+    with tarfile.open(fileobj=archive_bytes, mode='w') as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                archive.addfile(info)
+            else:
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    return archive_bytes.getvalue()
+
+
+def test_prune_container_directory():
+    container = MagicMock()
+    archive = make_archive([('pg_wal', None),
+                            ('pg_wal/archive_status', None),
+                            ('pg_wal/000000010000000000000001', b'old'),
+                            ('pg_wal/000000010000000000000002', b'current')])
+    # streamed in chunks that do not line up with the tar records
+    container.get_archive.return_value = ((archive[i:i + 1000] for i in range(0, len(archive), 1000)), dict())
+    pruned = list()
+    container.put_archive.side_effect = lambda path, data: pruned.append(
+        data if isinstance(data, bytes) else data.read())
+
+    removed = SnowShuDocker.prune_container_directory(container,
+                                                      '/snowshu_replica_data/pg_wal',
+                                                      lambda name: name != '000000010000000000000001')
+
+    assert removed == 1
+    container.get_archive.assert_called_once_with('/snowshu_replica_data/pg_wal')
+    assert [call.args[0] for call in container.put_archive.call_args_list] == ['/snowshu_replica_data'] * 2
+    # the directory is emptied, then the kept files are put back
+    with tarfile.open(fileobj=io.BytesIO(pruned[1])) as archive:
+        kept = {member.name: archive.extractfile(member).read() if member.isfile() else None
+                for member in archive.getmembers()}
+    assert kept == {'pg_wal': None,
+                    'pg_wal/archive_status': None,
+                    'pg_wal/000000010000000000000002': b'current'}
+
+
+def make_shdocker():
+    with patch('snowshu.core.docker.docker.from_env'):
+        return SnowShuDocker()
+
+
+def test_get_or_build_base_image():
+    shdocker = make_shdocker()
+    stock_image = MagicMock(id='sha256:stock', attrs={'Config': {'Cmd': ['postgres']}})
+    target_adapter = MagicMock()
+    target_adapter.image_initialize_bash_commands.return_value = ['apt-get install -y something']
+
+    # found by tag
+    image = shdocker.get_or_build_base_image(stock_image, target_adapter, 'amd64')
+    assert image == shdocker.client.images.get.return_value
+    tag = shdocker.client.images.get.call_args.args[0]
+    assert tag.startswith('snowshu_target_base:amd64-')
+    shdocker.client.containers.run.assert_not_called()
+
+    # a different setup is a different image
+    target_adapter.image_initialize_bash_commands.return_value = ['apt-get install -y other']
+    shdocker.get_or_build_base_image(stock_image, target_adapter, 'amd64')
+    assert shdocker.client.images.get.call_args.args[0] != tag
+
+    # built when missing
+    shdocker.client.images.get.side_effect = docker.errors.ImageNotFound('missing')
+    builder = shdocker.client.containers.run.return_value
+    builder.exec_run.return_value = (0, b'')
+    image = shdocker.get_or_build_base_image(stock_image, target_adapter, 'amd64')
+    assert shdocker.client.containers.run.call_args.args == ('sha256:stock', 'sleep infinity',)
+    builder.exec_run.assert_called_once_with("/bin/bash -c 'apt-get install -y other'", tty=True)
+    assert builder.commit.call_args.kwargs['changes'] == ['CMD ["postgres"]']
+    builder.remove.assert_called_once_with(force=True)
+    assert image == builder.commit.return_value
+
+
+def test_claim_warm_container():
+    shdocker = make_shdocker()
+    target_adapter = MagicMock(DOCKER_START_COMMAND='postgres -p 9999')
+    target_adapter.credentials.host = 'snowshu_target'
+    image = MagicMock(id='sha256:base')
+    taken, idle = MagicMock(), MagicMock()
+    taken.rename.side_effect = docker.errors.APIError('name in use')
+    shdocker.client.containers.list.return_value = [taken, idle]
+
+    container = shdocker._claim_warm_container(image, target_adapter, 'amd64', ['A=b'], 'snowshu_target_amd64')
+
+    assert container == idle
+    idle.rename.assert_called_once_with('snowshu_target_amd64')
+    idle.reload.assert_called_once()
+    taken.reload.assert_not_called()
+    idle.start.assert_called_once()
+    name_filter = shdocker.client.containers.list.call_args.kwargs['filters']['name']
+    assert name_filter.startswith('^/snowshu_warm_amd64_')
+
+    shdocker.client.containers.list.return_value = []
+    assert shdocker._claim_warm_container(image, target_adapter, 'amd64', ['A=b'], 'snowshu_target_amd64') is None
+
+
+def test_squash_image_keeps_config():
+    shdocker = make_shdocker()
+    container = MagicMock()
+    image = MagicMock(id='sha256:layered', tags=['snowshu_replica_replica:amd64'])
+    image.attrs = {'Size': 300 * 1024 * 1024,
+                   'Config': {'Env': ['PGDATA=/snowshu_replica_data', 'PATH=/usr/bin:/bin'],
+                              'Entrypoint': ['docker-entrypoint.sh'],
+                              'Cmd': ['postgres', '-p', '9999'],
+                              'ExposedPorts': {'9999/tcp': {}},
+                              'StopSignal': 'SIGINT'}}
+    shdocker.client.images.get.return_value.attrs = {'Size': 100 * 1024 * 1024}
+
+    squashed = shdocker._squash_image(container, image, ['CMD ["postgres"]', 'HEALTHCHECK CMD pg_isready'])
+
+    assert squashed == shdocker.client.images.get.return_value
+    args = shdocker.client.api.import_image_from_stream.call_args
+    assert args.args == (container.export.return_value,)
+    assert args.kwargs['repository'] == 'snowshu_replica_replica'
+    assert args.kwargs['tag'] == 'amd64'
+    assert args.kwargs['changes'] == ['ENV PGDATA="/snowshu_replica_data"',
+                                      'ENV PATH="/usr/bin:/bin"',
+                                      'EXPOSE 9999/tcp',
+                                      'ENTRYPOINT ["docker-entrypoint.sh"]',
+                                      'CMD ["postgres", "-p", "9999"]',
+                                      'STOPSIGNAL SIGINT',
+                                      'HEALTHCHECK CMD pg_isready']
+    shdocker.client.images.remove.assert_called_once_with('sha256:layered')
+
+
+def test_startup_prepares_passive_container_in_background():
+    shdocker = make_shdocker()
+    target_adapter = MagicMock(DOCKER_IMAGE='postgres:12', is_incremental=False)
+    target_adapter.credentials.host = 'snowshu_target'
+    passive_prepared = threading.Event()
+
+    def create_and_init_container(**kwargs):
+        if not kwargs['start']:
+            passive_prepared.wait(5)
+        return MagicMock(name=kwargs['container_name'])
+
+    with patch.multiple(shdocker,
+                        _get_or_create_network=MagicMock(),
+                        _create_snowshu_volume=MagicMock(),
+                        _get_stock_image=MagicMock(),
+                        get_or_build_base_image=MagicMock(),
+                        remove_container=MagicMock(),
+                        _claim_warm_container=MagicMock(return_value=None),
+                        create_and_init_container=MagicMock(side_effect=create_and_init_container)):
+        active, passive = shdocker.startup(target_adapter, 'SnowflakeAdapter', ['amd64', 'arm64'], [],
+                                           wait_for_passive=False)
+        # the active container is returned while the passive one is still being prepared
+        assert not passive.done()
+        passive_prepared.set()
+        passive = passive.result(5)
+
+        calls = {call.kwargs['container_name']: call.kwargs['start']
+                 for call in shdocker.create_and_init_container.call_args_list}
+    assert calls == {'snowshu_target_amd64': True, 'snowshu_target_arm64': False}
+    assert active is not passive
+
+
+def test_startup_passive_container_failures():
+    shdocker = make_shdocker()
+    target_adapter = MagicMock(DOCKER_IMAGE='postgres:12', is_incremental=False)
+    target_adapter.credentials.host = 'snowshu_target'
+    passive_started = threading.Event()
+
+    def create_and_init_container(**kwargs):
+        if kwargs['start']:
+            # fail the active container once the passive one is being prepared
+            passive_started.wait(5)
+            raise docker.errors.APIError('port is already allocated')
+        passive_started.set()
+        raise docker.errors.ImageNotFound('postgres:12')
+
+    with patch.multiple(shdocker,
+                        _get_or_create_network=MagicMock(),
+                        _create_snowshu_volume=MagicMock(),
+                        _get_stock_image=MagicMock(),
+                        get_or_build_base_image=MagicMock(),
+                        remove_container=MagicMock(),
+                        _claim_warm_container=MagicMock(return_value=None),
+                        create_and_init_container=MagicMock(side_effect=create_and_init_container)), \
+            patch('snowshu.core.docker.logger') as logger:
+        logged = threading.Event()
+        logger.error.side_effect = lambda *args: logged.set()
+        with pytest.raises(docker.errors.APIError):
+            shdocker.startup(target_adapter, 'SnowflakeAdapter', ['amd64', 'arm64'], [],
+                             wait_for_passive=False)
+        # the passive preparation is finished before the failed startup returns, and its failure is logged
+        assert shdocker.create_and_init_container.call_count == 2
+        assert logged.wait(5)
+        logger.error.assert_called_once()
+        assert 'arm64' in logger.error.call_args.args[0]
+
+
+def test_startup_single_arch_has_no_passive_container():
+    shdocker = make_shdocker()
+    target_adapter = MagicMock(DOCKER_IMAGE='postgres:12', is_incremental=False)
+    target_adapter.credentials.host = 'snowshu_target'
+    with patch.multiple(shdocker,
+                        _get_or_create_network=MagicMock(),
+                        _create_snowshu_volume=MagicMock(),
+                        _get_stock_image=MagicMock(),
+                        get_or_build_base_image=MagicMock(),
+                        remove_container=MagicMock(),
+                        _claim_warm_container=MagicMock(return_value=None),
+                        create_and_init_container=MagicMock()):
+        active, passive = shdocker.startup(target_adapter, 'SnowflakeAdapter', ['amd64'], [])
+        assert active == shdocker.create_and_init_container.return_value
+    assert passive is None
@@ -834,3 +834,22 @@ def test_graph_diff_with_existing_relationships():
 
     result_graph = SnowShuGraph.catalog_difference(shgraph, target_catalog)
     assert set(result_graph.nodes) == expected_nodes
+
+
+def test_relationship_attributes():
+    helper = RelationTestHelper()
+    upstream = Relation(name='UPSTREAM', **helper.rand_relation_helper())
+    downstream = Relation(name='DOWNSTREAM', **helper.rand_relation_helper())
+    view = Relation(name='VIEW', **helper.rand_relation_helper())
+    view.materialization = mz.VIEW
+
+    dag = nx.MultiDiGraph()
+    dag.add_edge(upstream, downstream, direction='directional',
+                 local_attribute='UPSTREAM_ID', remote_attribute='ID')
+    dag.add_edge(upstream, downstream, direction='directional',
+                 local_attribute='OTHER_ID', remote_attribute='OTHER_ID')
+    dag.add_edge(upstream, view, direction='directional',
+                 local_attribute='UPSTREAM_ID', remote_attribute='ID')
+
+    assert SnowShuGraph.relationship_attributes((dag,)) == {upstream: {'ID', 'OTHER_ID'},
+                                                            downstream: {'UPSTREAM_ID', 'OTHER_ID'}}
@@ -3,8 +3,10 @@ from unittest import mock
 from unittest.mock import ANY
 
 import pandas as pd
+import pytest
 
 from snowshu.core.graph_set_runner import GraphExecutable, GraphSetRunner
+from snowshu.core.memory_budget import MemoryBudget
 from snowshu.samplings.samplings import DefaultSampling
 from snowshu.core.models.relation import Relation
 
@@ -13,13 +15,14 @@ def test_traverse_and_execute_analyze(stub_graph_set):
     source_adapter,target_adapter=[mock.MagicMock() for _ in range(2)]
     source_adapter.predicate_constraint_statement.return_value=str()
     source_adapter.upstream_constraint_statement.return_value=str()
-    source_adapter.union_constraint_statement.return_value=str()
+    source_adapter.outliers_union_statement.return_value=str()
     source_adapter.sample_statement_from_relation.return_value=str()
     runner=GraphSetRunner()
     runner.barf=False
     graph_set,vals=stub_graph_set
-    source_adapter.scalar_query.return_value=1000
-    source_adapter.check_count_and_query.return_value=pd.DataFrame([dict(population_size=1000,sample_size=100)])
+    source_adapter.population_counts.side_effect=lambda relations: [1000 for _ in relations]
+    source_adapter.analyze_relations.side_effect=lambda relations: pd.DataFrame(
+        [dict(population_size=1000,sample_size=100) for _ in relations])
     dag=copy.deepcopy(graph_set[-1]) # last graph in the set is the dag
     
     ## stub in the sampling pop defaults
@@ -32,6 +35,10 @@ def test_traverse_and_execute_analyze(stub_graph_set):
 
     # longer dag
     runner._traverse_and_execute(dag_executable)
+    # the whole component is analyzed in one population query and one analyze query
+    source_adapter.population_counts.assert_called_once()
+    source_adapter.analyze_relations.assert_called_once()
+    source_adapter.check_count_and_query.assert_not_called()
     for rel in dag.nodes:
         assert not isinstance(getattr(rel, 'data', None), pd.DataFrame)
         assert rel.source_extracted is True
@@ -65,7 +72,7 @@ def test_traverse_and_execute_custom_max_rows_pass(stub_graph_set):
     source_adapter,target_adapter=[mock.MagicMock() for _ in range(2)]
     source_adapter.predicate_constraint_statement.return_value=str()
     source_adapter.upstream_constraint_statement.return_value=str()
-    source_adapter.union_constraint_statement.return_value=str()
+    source_adapter.outliers_union_statement.return_value=str()
     source_adapter.sample_statement_from_relation.return_value=str()
     runner=GraphSetRunner()
     runner.barf=False
@@ -77,7 +84,8 @@ def test_traverse_and_execute_custom_max_rows_pass(stub_graph_set):
     def fake_data(self, val: pd.DataFrame):
         self._data = val
 
-    for do_analyze in [True, False]:
+    # analyze runs do not fetch records, so only sampling runs are count guarded
+    for do_analyze in [False]:
         # test if defaults are passed
         for rel in dag.nodes:
             rel.unsampled = False
@@ -106,3 +114,166 @@ def test_traverse_and_execute_custom_max_rows_pass(stub_graph_set):
              mock.patch.object(Relation, 'data', new=fake_data):
             runner._traverse_and_execute(dag_executable)
             mock_2.assert_called_with(ANY, 1234567, ANY)
+
+
+def test_traverse_and_execute_component_script(stub_graph_set):
+    source_adapter,target_adapter=[mock.MagicMock() for _ in range(2)]
+    source_adapter.predicate_constraint_statement.return_value=str()
+    source_adapter.upstream_constraint_statement.return_value=str()
+    source_adapter.outliers_union_statement.return_value=str()
+    source_adapter.sample_statement_from_relation.return_value=str()
+    source_adapter.create_table_statement.return_value=str()
+    runner=GraphSetRunner()
+    runner.barf=False
+    runner.component_scripts=True
+    graph_set,_=stub_graph_set
+    dag=copy.deepcopy(graph_set[-1])
+    dag.contains_views=False
+    for rel in dag.nodes:
+        rel.unsampled=False
+        rel.include_outliers=False
+        rel.sampling=DefaultSampling()
+    source_adapter.population_counts.return_value=[1000 for _ in dag.nodes]
+    source_adapter.execute_component_script.return_value=[100 for _ in dag.nodes]
+    source_adapter.check_known_count_and_query.return_value=pd.DataFrame([dict(id=1)])
+
+    runner._traverse_and_execute(GraphExecutable(dag, source_adapter, target_adapter, False))
+
+    # one round trip for the populations and one for the whole component
+    source_adapter.population_counts.assert_called_once()
+    source_adapter.execute_component_script.assert_called_once()
+    statements, relations = source_adapter.execute_component_script.call_args[0]
+    assert len(statements) == len(relations) == len(dag.nodes)
+    source_adapter.check_count_and_query.assert_not_called()
+    source_adapter.check_known_count_and_query.assert_called_with(ANY, 100, 1000000, False)
+    for rel in dag.nodes:
+        assert rel.source_extracted is True
+        assert rel.target_loaded is True
+        assert rel.sample_size == 100
+        assert rel.population_size == 1000
+
+
+def test_traverse_and_execute_adaptive_sample_sizing(stub_graph_set):
+    source_adapter,target_adapter=[mock.MagicMock() for _ in range(2)]
+    source_adapter.predicate_constraint_statement.return_value=str()
+    source_adapter.upstream_constraint_statement.return_value=str()
+    source_adapter.outliers_union_statement.return_value=str()
+    source_adapter.sample_statement_from_relation.return_value=str()
+    runner=GraphSetRunner()
+    runner.barf=False
+    runner.adaptive_sample_sizing=True
+    runner.resample_budget=1e9
+    graph_set,_=stub_graph_set
+    dag=copy.deepcopy(graph_set[-1])
+    shared_sampling=DefaultSampling()
+    for rel in dag.nodes:
+        rel.unsampled=False
+        rel.include_outliers=False
+        rel.sampling=shared_sampling
+    source_adapter.population_counts.side_effect=lambda relations: [100000 for _ in relations]
+    # the first pass comes back at half of the target, the second one on target
+    passes=[0.5, 1.0]
+
+    def analyze_relations(relations):
+        ratio=passes.pop(0)
+        return pd.DataFrame([dict(population_size=100000,sample_size=int(rel.sampling.size * ratio))
+                             for rel in relations])
+    source_adapter.analyze_relations.side_effect=analyze_relations
+
+    runner._traverse_and_execute(GraphExecutable(dag, source_adapter, target_adapter, True))
+
+    assert source_adapter.analyze_relations.call_count == 2
+    roots = [rel for rel in dag.nodes if dag.in_degree(rel) == 0]
+    for rel in dag.nodes:
+        # samplings are no longer shared so root sizes can be rescaled on their own
+        assert rel.sampling is not shared_sampling
+        assert rel.sample_size == rel.sampling.size
+    target_size=copy.copy(shared_sampling)
+    target_size.prepare(next(iter(dag.nodes)), source_adapter)
+    for root in roots:
+        assert root.sampling.min_sample_size == pytest.approx(2 * target_size.size, rel=1e-3)
+
+
+def test_traverse_and_execute_from_cache(stub_graph_set):
+    source_adapter,target_adapter=[mock.MagicMock() for _ in range(2)]
+    runner=GraphSetRunner()
+    runner.barf=False
+    runner.from_cache=True
+    runner.sample_cache=mock.MagicMock()
+    graph_set,_=stub_graph_set
+    dag=copy.deepcopy(graph_set[-1])
+    dag.contains_views=False
+    source_adapter.last_altered.side_effect=lambda relations: ['2024-01-01' for _ in relations]
+    data=pd.DataFrame([dict(id=1)])
+    runner.sample_cache.get.return_value=dict(population_size=1000, sample_size=1, view_ddl=None, data=data)
+
+    runner._traverse_and_execute(GraphExecutable(dag, source_adapter, target_adapter, False))
+
+    # only the metadata is read from the source
+    source_adapter.last_altered.assert_called_once()
+    source_adapter.create_table.assert_not_called()
+    source_adapter.check_count_and_query.assert_not_called()
+    assert runner.sample_cache.get.call_count == len(dag.nodes)
+    for rel in dag.nodes:
+        target_adapter.create_and_load_relation.assert_any_call(rel, data)
+        assert rel.sample_size == 1
+        assert rel.population_size == 1000
+
+    # a single miss samples the whole graph again
+    runner.sample_cache.get.side_effect=[None] + [runner.sample_cache.get.return_value] * (len(dag.nodes) - 1)
+    assert runner._load_from_cache(GraphExecutable(dag, source_adapter, target_adapter, False)) is False
+
+
+def test_traverse_and_execute_spills_over_memory_budget(stub_graph_set):
+    source_adapter,target_adapter=[mock.MagicMock() for _ in range(2)]
+    source_adapter.predicate_constraint_statement.return_value=str()
+    source_adapter.upstream_constraint_statement.return_value=str()
+    source_adapter.outliers_union_statement.return_value=str()
+    source_adapter.sample_statement_from_relation.return_value=str()
+    runner=GraphSetRunner()
+    runner.barf=False
+    runner.memory_budget=MemoryBudget(1000)
+    runner.sample_cache=mock.MagicMock()
+    graph_set,_=stub_graph_set
+    dag=copy.deepcopy(graph_set[-1])
+    for rel in dag.nodes:
+        rel.unsampled=False
+        rel.include_outliers=False
+        rel.sampling=DefaultSampling()
+    # populations of 100000 rows and 10MB in the source
+    source_adapter.scalar_query.return_value=100000
+    source_adapter.relation_bytes.side_effect=lambda relations: [10000000 for _ in relations]
+    source_adapter.check_count_and_spill.return_value=(10, ['chunk.parquet'])
+    runner._catalog_source_bytes([dag], source_adapter)
+
+    runner._traverse_and_execute(GraphExecutable(dag, source_adapter, target_adapter, False))
+
+    source_adapter.relation_bytes.assert_called_once()
+    source_adapter.check_count_and_query.assert_not_called()
+    assert source_adapter.check_count_and_spill.call_count == len(dag.nodes)
+    for rel in dag.nodes:
+        target_adapter.load_spilled_data_into_relation.assert_any_call(rel, ['chunk.parquet'])
+        assert rel.sample_size == 10
+        # an older cached sample must not be loaded in place of the spilled one
+        runner.sample_cache.discard.assert_any_call(rel)
+    runner.sample_cache.put.assert_not_called()
+    assert runner.memory_budget.in_flight == 0
+
+
+def test_execute_graph_set_largest_graphs_first(stub_graph_set):
+    source_adapter,target_adapter=[mock.MagicMock() for _ in range(2)]
+    graph_set,_=stub_graph_set
+    graphs=[copy.deepcopy(graph) for graph in graph_set]
+    for graph in graphs:
+        graph.contains_views=False
+    source_adapter.relation_bytes.side_effect=lambda relations: [100 for _ in relations]
+    runner=GraphSetRunner()
+
+    with mock.patch.object(GraphSetRunner, 'process_executables') as process_executables:
+        runner.execute_graph_set(graphs, source_adapter, target_adapter, threads=1, retry_count=0,
+                                 memory_budget=1)
+
+    source_adapter.relation_bytes.assert_called_once()
+    executables=process_executables.call_args_list[0][0][0]
+    sizes=[len(executable.graph) for executable in executables]
+    assert sizes == sorted(sizes, reverse=True)
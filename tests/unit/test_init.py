@@ -181,7 +181,14 @@ def test_custom_retry_count_passed_correctly_through_execute(graph_to_result_lis
                                                       threads=ANY,
                                                       retry_count=5,
                                                       analyze=do_analyze,
-                                                      barf=ANY)
+                                                      barf=ANY,
+                                                      component_scripts=ANY,
+                                                      adaptive_sample_sizing=ANY,
+                                                      max_resample_iterations=ANY,
+                                                      resample_budget=ANY,
+                                                      sample_cache=ANY,
+                                                      from_cache=ANY,
+                                                      memory_budget=ANY)
 
 @patch('snowshu.core.main.ReplicaFactory')
 @patch('snowshu.core.main.Logger.set_log_level')
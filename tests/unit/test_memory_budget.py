@@ -0,0 +1,31 @@
+import threading
+import time
+
+from snowshu.core.memory_budget import MemoryBudget
+
+
+def test_reserve_blocks_over_limit():
+    budget = MemoryBudget(100)
+    admitted = threading.Event()
+
+    def reserve_more():
+        with budget.reserve(60):
+            admitted.set()
+
+    with budget.reserve(60):
+        thread = threading.Thread(target=reserve_more)
+        thread.start()
+        time.sleep(0.05)
+        # 120 bytes would be over the limit, so the second reservation waits
+        assert not admitted.is_set()
+        assert budget.in_flight == 60
+    thread.join(1)
+    assert admitted.is_set()
+    assert budget.in_flight == 0
+
+
+def test_reserve_admits_oversized_when_idle():
+    budget = MemoryBudget(100)
+    with budget.reserve(1000):
+        assert budget.in_flight == 1000
+    assert budget.in_flight == 0
@@ -1,13 +1,20 @@
-from unittest.mock import MagicMock, ANY
+from concurrent.futures import Future
+from unittest.mock import MagicMock, ANY, patch
+
+import pytest
+from docker.models.containers import ExecResult
 
 from pandas.core.frame import DataFrame
 
+from snowshu.adapters.target_adapters import BaseTargetAdapter
 from snowshu.adapters.target_adapters.postgres_adapter import PostgresAdapter
+from snowshu.adapters.target_adapters.postgres_adapter.postgres_adapter import JSONText
 from snowshu.configs import DOCKER_REMOUNT_DIRECTORY, DOCKER_REPLICA_MOUNT_FOLDER
 from snowshu.core.models import data_types
 from snowshu.core.models.attribute import Attribute
 from snowshu.core.models.materializations import TABLE
 from snowshu.core.models.relation import Relation
+from snowshu.exceptions import UnableToStartTarget
 from tests.common import rand_string
 
 
@@ -39,6 +46,28 @@ def test_x00_replacement():
     assert all(fixed_data.loc[fixed_data[id_col] == 2, content_col] == f"weird{custom_replacement}value")
 
 
+def test_json_pass_through():
+    assert isinstance(PostgresAdapter._load_type(data_types.JSON.sqlalchemy_type), JSONText)
+    assert PostgresAdapter._load_type(data_types.VARCHAR.sqlalchemy_type) is data_types.VARCHAR.sqlalchemy_type
+
+    process = JSONText().bind_processor(None)
+    # text is not decoded and encoded again
+    assert process('{"a": 1}') == '{"a": 1}'
+    assert process({"a": 1}) == '{"a": 1}'
+    assert process(None) is None
+    assert process(float('nan')) is None
+
+
+def test_replace_invalid_json_values():
+    relation = Relation("db", "schema", "name", TABLE, [Attribute("id", data_types.BIGINT),
+                                                        Attribute("content", data_types.JSON)])
+    query_data = DataFrame({"ID": [1, 2], "CONTENT": ['{"a": 1}', '{broken']})
+
+    fixed_data = PostgresAdapter.replace_invalid_json_values(relation, query_data)
+    assert fixed_data["CONTENT"].to_list() == [{"a": 1}, None]
+    assert fixed_data["ID"].to_list() == [1, 2]
+
+
 def test_create_snowshu_schema_statement():
     pg_adapter = PostgresAdapter(replica_metadata={})
 
@@ -67,7 +96,8 @@ def test_is_fdw_schema():
 def test_image_initialize_bash_commands():
     pg_adapter = PostgresAdapter(replica_metadata={})
     PRELOADED_PACKAGES = ['postgresql-plpython3-12']
-    commands = [f'apt-get update && apt-get install -y {" ".join(PRELOADED_PACKAGES)}']
+    commands = [f'apt-get update && apt-get install -y {" ".join(PRELOADED_PACKAGES)} '
+                '&& rm -rf /var/lib/apt/lists/*']
 
     assert pg_adapter.image_initialize_bash_commands().sort() == commands.sort()
 
@@ -88,15 +118,246 @@ def test_copy_replica_command():
     """Test whether copy replica command is correctly called"""
     pg_adapter = PostgresAdapter(replica_metadata={})
     pg_adapter.stop_postgres = MagicMock()
-    # Skip copy if only one container
+    pg_adapter.target_database_is_ready = MagicMock(return_value=True)
+    # Skip copy if only one container, only vacuum it
     pg_adapter.container = MagicMock()
     pg_adapter.copy_replica_data()
-    pg_adapter.container.exec_run.assert_not_called()
+    pg_adapter.container.exec_run.assert_called_once_with(f"/bin/bash -c '{pg_adapter.DOCKER_VACUUM_COMMAND}'")
 
     # Do copy if there are 2
     pg_adapter.passive_container = MagicMock()
-    exec_return_value = MagicMock()
-    exec_return_value.exit_code = 0
+    exec_return_value = ExecResult(0, b'')
+    pg_adapter.container.exec_run = MagicMock(return_value=exec_return_value)
     pg_adapter.passive_container.exec_run = MagicMock(return_value=exec_return_value)
     pg_adapter.copy_replica_data()
     pg_adapter.container.exec_run.assert_called()
+    pg_adapter.passive_container.exec_run.assert_called_with(f"/bin/bash -c '{pg_adapter.DOCKER_VACUUM_COMMAND}'")
+
+
+def test_copy_replica_data_fails_on_exit_codes():
+    pg_adapter = PostgresAdapter(replica_metadata={}, pg_vacuum_freeze=False)
+    pg_adapter.target_database_is_ready = MagicMock(return_value=True)
+    pg_adapter.container = MagicMock()
+    pg_adapter.passive_container = MagicMock()
+
+    # a failed dump does not touch the passive container
+    pg_adapter.container.exec_run.return_value = ExecResult(1, b'pg_dump: error')
+    assert pg_adapter.copy_replica_data() == ExecResult(1, b'pg_dump: error')
+    pg_adapter.container.stop.assert_not_called()
+    pg_adapter.passive_container.start.assert_not_called()
+
+    # a failed restore is returned instead of the dump status
+    pg_adapter.container.exec_run.return_value = ExecResult(0, b'')
+    pg_adapter.passive_container.exec_run.return_value = ExecResult(1, b'pg_restore: error')
+    assert pg_adapter.copy_replica_data() == ExecResult(1, b'pg_restore: error')
+
+
+def test_load_tuning_start_command():
+    pg_adapter = PostgresAdapter(replica_metadata={})
+    assert pg_adapter.DOCKER_REPLICA_START_COMMAND == 'postgres -p 9999 '
+    assert pg_adapter.DOCKER_START_COMMAND.startswith(pg_adapter.DOCKER_REPLICA_START_COMMAND)
+    for setting in ('-c fsync=off', '-c wal_level=minimal', '-c max_wal_senders=0',):
+        assert setting in pg_adapter.DOCKER_START_COMMAND
+
+    pg_adapter = PostgresAdapter(replica_metadata={}, pg_load_tuning=False)
+    assert pg_adapter.DOCKER_START_COMMAND == pg_adapter.DOCKER_REPLICA_START_COMMAND
+
+
+def test_finalize_replica_checkpoints_running_containers():
+    pg_adapter = PostgresAdapter(replica_metadata={'name': 'replica'}, pg_compact_replica=False)
+    pg_adapter.shdocker = MagicMock()
+    pg_adapter.container = MagicMock(status='exited')
+    pg_adapter.passive_container = MagicMock(status='running')
+    pg_adapter.passive_container.exec_run.return_value = MagicMock(exit_code=0)
+
+    pg_adapter.finalize_replica()
+
+    pg_adapter.container.exec_run.assert_not_called()
+    pg_adapter.passive_container.exec_run.assert_called_once_with(pg_adapter.DOCKER_CHECKPOINT_COMMAND)
+    pg_adapter.shdocker.convert_container_to_replica.assert_called_once_with('replica',
+                                                                           pg_adapter.container,
+                                                                           pg_adapter.passive_container,
+                                                                           pg_adapter.DOCKER_REPLICA_START_COMMAND,
+                                                                           pg_adapter.DOCKER_HEALTHCHECK_COMMAND,
+                                                                           False)
+
+
+def test_finalize_replica_compacts_and_stops_containers():
+    pg_adapter = PostgresAdapter(replica_metadata={'name': 'replica'}, pg_squash_replica=True)
+    pg_adapter.shdocker = MagicMock()
+    pg_adapter.shdocker.container_size.side_effect = [300 * 1024 * 1024, 100 * 1024 * 1024,
+                                                      200 * 1024 * 1024, 50 * 1024 * 1024]
+    pg_adapter.wait_until_ready = MagicMock()
+    pg_adapter.container = MagicMock(status='running')
+    pg_adapter.passive_container = MagicMock(status='exited')
+    for container in (pg_adapter.container, pg_adapter.passive_container,):
+        container.exec_run.return_value = MagicMock(exit_code=0, output=b'000000010000000000000005\r\n')
+        container.attrs = {'State': {'ExitCode': 0}}
+    pg_adapter.shdocker.prune_container_directory.return_value = 4
+
+    pg_adapter.finalize_replica()
+
+    compact = ['/bin/bash', '-c', pg_adapter.DOCKER_COMPACT_COMMAND]
+    pg_adapter.container.exec_run.assert_called_once_with(compact)
+    pg_adapter.passive_container.exec_run.assert_called_once_with(compact)
+    pg_adapter.passive_container.start.assert_called_once()
+    pg_adapter.wait_until_ready.assert_called_once()
+    assert pg_adapter.container.stop.call_count == 2
+    pg_adapter.passive_container.stop.assert_called_once()
+    assert pg_adapter.shdocker.convert_container_to_replica.call_args.args[-1] is True
+
+    # the WAL is only pruned once the server is stopped
+    prune_calls = pg_adapter.shdocker.prune_container_directory.call_args_list
+    assert [call.args[:2] for call in prune_calls] == [(pg_adapter.container, '/snowshu_replica_data/pg_wal'),
+                                                       (pg_adapter.passive_container, '/snowshu_replica_data/pg_wal')]
+    is_needed = prune_calls[0].args[2]
+    assert not is_needed('000000010000000000000004')
+    assert is_needed('000000010000000000000005')
+    assert is_needed('000000010000000000000006')
+    assert is_needed('archive_status')
+    assert is_needed('00000002.history')
+
+
+def test_compact_container_keeps_wal_after_unclean_shutdown():
+    pg_adapter = PostgresAdapter(replica_metadata={'name': 'replica'})
+    pg_adapter.shdocker = MagicMock()
+    container = MagicMock(status='running')
+    container.exec_run.return_value = MagicMock(exit_code=0, output=b'000000010000000000000005')
+    container.attrs = {'State': {'ExitCode': 137}}
+
+    pg_adapter._compact_container(container)
+
+    container.stop.assert_called_once_with(timeout=pg_adapter.DOCKER_STOP_TIMEOUT)
+    pg_adapter.shdocker.prune_container_directory.assert_not_called()
+
+
+def test_unlogged_tables():
+    pg_adapter = PostgresAdapter(replica_metadata={}, pg_unlogged_tables=True)
+    pg_adapter.get_connection = MagicMock()
+    relation = Relation("DB", "SCHEMA", "TABLE", TABLE, [])
+    data = DataFrame({'col': [1, 2]})
+    with patch.object(BaseTargetAdapter, 'load_data_into_relation') as base_load:
+        pg_adapter.load_data_into_relation(relation, data)
+        pg_adapter.load_data_into_relation(relation, data, 'append')
+
+    created, loaded, appended = base_load.call_args_list
+    assert created.args[1].empty and created.args[2] == 'replace'
+    assert loaded.args[1:] == (data, 'append',)
+    assert appended.args[1:] == (data, 'append',)
+    pg_adapter.get_connection().execute.assert_called_once_with('ALTER TABLE "schema"."table" SET UNLOGGED')
+
+    pg_adapter.get_connection.reset_mock()
+    pg_adapter.set_relations_logged()
+    pg_adapter.get_connection.assert_called_once_with(database_override='db')
+    pg_adapter.get_connection().execute.assert_called_once_with('ALTER TABLE "schema"."table" SET LOGGED;')
+    assert not pg_adapter._unlogged_relations
+
+
+def test_create_relationship_indexes():
+    pg_adapter = PostgresAdapter(replica_metadata={})
+    pg_adapter.get_connection = MagicMock()
+    relation = Relation("DB", "SCHEMA", "TABLE", TABLE, [Attribute('ID', data_types.BIGINT),
+                                                         Attribute('Parent_Id', data_types.BIGINT)])
+
+    pg_adapter.create_relationship_indexes({relation: {'ID', 'PARENT_ID', 'MISSING'}}, threads=2)
+
+    statements = [call.args[0] for call in pg_adapter.get_connection().execute.call_args_list]
+    assert statements == ['CREATE INDEX ON "schema"."table" ("id")',
+                          'CREATE INDEX ON "schema"."table" ("Parent_Id")',
+                          'ANALYZE "schema"."table"']
+
+
+def test_vacuum_container():
+    pg_adapter = PostgresAdapter(replica_metadata={})
+    container = MagicMock()
+    container.exec_run.return_value = MagicMock(exit_code=0)
+    pg_adapter.vacuum_container(container)
+    container.exec_run.assert_called_once_with(f"/bin/bash -c '{pg_adapter.DOCKER_VACUUM_COMMAND}'")
+    assert pg_adapter.DOCKER_VACUUM_COMMAND.startswith('vacuumdb --all --freeze --analyze --jobs')
+
+    pg_adapter = PostgresAdapter(replica_metadata={}, pg_vacuum_freeze=False)
+    container = MagicMock()
+    pg_adapter.vacuum_container(container)
+    container.exec_run.assert_not_called()
+
+
+def test_replica_data_share_commands():
+    pg_adapter = PostgresAdapter(replica_metadata={})
+    share, restore = pg_adapter.DOCKER_SHARE_REPLICA_DATA, pg_adapter.DOCKER_IMPORT_REPLICA_DATA_FROM_SHARE
+    assert 'pg_dump -U snowshu -p 9999 -Fd -Z 0 -j $(nproc)' in share
+    assert 'pg_restore -U snowshu -p 9999 -j $(nproc)' in restore
+    # the commands are run wrapped in single quotes
+    assert "'" not in share + restore
+
+
+CONTROL_DATA = (b'pg_control version number:            1201\n'
+                b'Catalog version number:               201909212\n'
+                b'Database cluster state:               in production\n'
+                b'Maximum data alignment:               8\n')
+
+
+def test_copy_replica_data_physical():
+    pg_adapter = PostgresAdapter(replica_metadata={}, pg_physical_copy=True, pg_vacuum_freeze=False)
+    pg_adapter.shdocker = MagicMock()
+    pg_adapter.target_database_is_ready = MagicMock(return_value=True)
+    pg_adapter.container = MagicMock()
+    pg_adapter.passive_container = MagicMock()
+    for container in (pg_adapter.container, pg_adapter.passive_container,):
+        container.exec_run.return_value = MagicMock(exit_code=0, output=CONTROL_DATA)
+
+    assert pg_adapter.copy_replica_data() == [0]
+    pg_adapter.shdocker.copy_container_directory.assert_called_once_with(pg_adapter.container,
+                                                                       pg_adapter.passive_container,
+                                                                       '/snowshu_replica_data')
+    assert f"/bin/bash -c '{pg_adapter.DOCKER_SHARE_REPLICA_DATA}'" not in \
+        [call.args[0] for call in pg_adapter.container.exec_run.call_args_list]
+
+    # incompatible layouts fall back to dump and restore
+    pg_adapter.shdocker.reset_mock()
+    pg_adapter.passive_container.exec_run.return_value = MagicMock(
+        exit_code=0, output=CONTROL_DATA.replace(b'alignment:               8', b'alignment:               4'))
+    pg_adapter.copy_replica_data()
+    pg_adapter.shdocker.copy_container_directory.assert_not_called()
+    pg_adapter.container.exec_run.assert_called_with(f"/bin/bash -c '{pg_adapter.DOCKER_SHARE_REPLICA_DATA}'",
+                                                     tty=True)
+
+
+def test_wait_until_ready_backs_off():
+    pg_adapter = PostgresAdapter(replica_metadata={})
+    pg_adapter.target_database_is_ready = MagicMock(side_effect=[False, False, False, True])
+    with patch('snowshu.adapters.target_adapters.base_target_adapter.sleep') as sleep:
+        pg_adapter.wait_until_ready()
+    assert [call.args[0] for call in sleep.call_args_list] == [0.05, 0.1, 0.2]
+
+    pg_adapter.target_database_is_ready = MagicMock(return_value=False)
+    with patch('snowshu.adapters.target_adapters.base_target_adapter.sleep'), \
+            pytest.raises(UnableToStartTarget):
+        pg_adapter.wait_until_ready(timeout=0)
+
+
+def test_passive_container_waits_for_background_preparation():
+    pg_adapter = PostgresAdapter(replica_metadata={})
+    container = MagicMock()
+    prepared = Future()
+    pg_adapter.passive_container = prepared
+    prepared.set_result(container)
+    assert pg_adapter.passive_container is container
+    assert pg_adapter._passive_container is container
+
+
+def test_check_passive_container_fails_early():
+    pg_adapter = PostgresAdapter(replica_metadata={})
+    pg_adapter.load_data_into_relation = MagicMock()
+    relation = Relation("DB", "SCHEMA", "TABLE", TABLE, [])
+    preparing = Future()
+    pg_adapter.passive_container = preparing
+
+    # still being prepared, loads go on
+    pg_adapter.check_passive_container()
+    pg_adapter.create_and_load_relation(relation, DataFrame())
+    pg_adapter.load_data_into_relation.assert_called_once()
+
+    preparing.set_exception(OSError('image not found'))
+    with pytest.raises(OSError, match='image not found'):
+        pg_adapter.create_and_load_relation(relation, DataFrame())
+    pg_adapter.load_data_into_relation.assert_called_once()
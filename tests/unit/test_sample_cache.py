@@ -0,0 +1,110 @@
+import os
+import time
+
+import networkx as nx
+
+import pandas as pd
+import pytest
+
+import snowshu.core.models.materializations as mz
+from snowshu.core.models.relation import Relation
+from snowshu.core.sample_cache import SampleCache
+from snowshu.samplings.samplings import DefaultSampling, DeterministicSampling
+
+
+@pytest.fixture
+def stub_relation():
+    return Relation('SOURCE_DB', 'SOURCE_SCHEMA', 'SOURCE_TABLE', mz.TABLE, [])
+
+
+def cached_relation(relation, query="SELECT * FROM SOURCE"):
+    relation.compiled_query = query
+    relation.sampling = DefaultSampling()
+    relation.population_size = 1000
+    relation.sample_size = 2
+    return relation
+
+
+def test_put_and_get(tmp_path, stub_relation):
+    cache = SampleCache(str(tmp_path))
+    relation = cached_relation(stub_relation)
+    data = pd.DataFrame(dict(id=[1, 2], name=['a', 'b']))
+
+    cache.put(relation, 'fingerprint', data)
+    entry = cache.get(relation, 'fingerprint')
+
+    assert entry['population_size'] == 1000
+    assert entry['sample_size'] == 2
+    assert entry['data'].equals(data)
+    # a changed source misses
+    assert cache.get(relation, 'altered') is None
+
+
+def test_key(stub_relation):
+    relation = cached_relation(stub_relation)
+    key = SampleCache.key(relation, 'fingerprint')
+
+    assert key != SampleCache.key(relation, 'altered')
+    relation.compiled_query = "SELECT * FROM OTHER_SOURCE"
+    assert key != SampleCache.key(relation, 'fingerprint')
+    relation.compiled_query = "SELECT * FROM SOURCE"
+    relation.sampling = DeterministicSampling(seed=7)
+    assert key != SampleCache.key(relation, 'fingerprint')
+
+
+def test_evict(tmp_path, stub_relation):
+    cache = SampleCache(str(tmp_path), max_size=0)
+    relation = cached_relation(stub_relation)
+    cache.put(relation, 'fingerprint', pd.DataFrame(dict(id=[1, 2])))
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.parquet')]) == 1
+
+    cache.evict()
+
+    assert cache.get(relation, 'fingerprint') is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.parquet')]
+
+
+def test_get_expired(tmp_path, stub_relation):
+    cache = SampleCache(str(tmp_path), max_age=1)
+    relation = cached_relation(stub_relation)
+    cache.put(relation, 'fingerprint', pd.DataFrame(dict(id=[1, 2])))
+    assert cache.get(relation, 'fingerprint') is not None
+
+    cache.max_age = 0
+    time.sleep(0.01)
+    assert cache.get(relation, 'fingerprint') is None
+
+
+def test_graph_fingerprint(stub_relation):
+    relation = cached_relation(stub_relation)
+    downstream = cached_relation(Relation('SOURCE_DB', 'SOURCE_SCHEMA', 'DOWNSTREAM_TABLE', mz.TABLE, []))
+    graph = nx.DiGraph()
+    graph.add_edge(relation, downstream, direction='bidirectional', remote_attribute='ID', local_attribute='ID')
+    fingerprint = SampleCache.graph_fingerprint(graph, ['2024-01-01', '2024-01-02'])
+
+    assert fingerprint == SampleCache.graph_fingerprint(graph, ['2024-01-01', '2024-01-02'])
+    assert fingerprint != SampleCache.graph_fingerprint(graph, ['2024-01-01', '2024-01-03'])
+    # the prepared size is not part of the configuration
+    relation.sampling.size = 100
+    assert fingerprint == SampleCache.graph_fingerprint(graph, ['2024-01-01', '2024-01-02'])
+    relation.sampling = DefaultSampling(min_sample_size=5)
+    assert fingerprint != SampleCache.graph_fingerprint(graph, ['2024-01-01', '2024-01-02'])
+    relation.sampling = DefaultSampling()
+    downstream.include_outliers = True
+    assert fingerprint != SampleCache.graph_fingerprint(graph, ['2024-01-01', '2024-01-02'])
+    downstream.include_outliers = False
+    graph.edges[relation, downstream]['direction'] = 'directional'
+    assert fingerprint != SampleCache.graph_fingerprint(graph, ['2024-01-01', '2024-01-02'])
+
+
+def test_discard(tmp_path, stub_relation):
+    cache = SampleCache(str(tmp_path))
+    relation = cached_relation(stub_relation)
+    cache.put(relation, 'fingerprint', pd.DataFrame(dict(id=[1, 2])))
+
+    cache.discard(relation)
+
+    assert cache.get(relation, 'fingerprint') is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.parquet')]
+    # discarding a relation that is not cached is a no-op
+    cache.discard(relation)
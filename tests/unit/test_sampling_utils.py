@@ -1,11 +1,13 @@
 import pytest
 from snowshu.core.samplings.utils import get_sampling_from_partial
-from snowshu.samplings.samplings import DefaultSampling, BruteForceSampling
+from snowshu.samplings.samplings import DefaultSampling, BruteForceSampling, DeterministicSampling, AdaptiveSampling
 
 
 @pytest.mark.parametrize('sample_method, expected_sampling', [
     ('default', DefaultSampling),
-    ('brute_force', BruteForceSampling)
+    ('brute_force', BruteForceSampling),
+    ('deterministic', DeterministicSampling),
+    ('adaptive', AdaptiveSampling),
 ])
 def test_finds_bruite_force(sample_method, expected_sampling):
     """
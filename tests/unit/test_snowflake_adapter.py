@@ -1,4 +1,6 @@
+import datetime
 import random
+import sqlite3
 from contextlib import nullcontext as does_not_raise
 from unittest import mock
 from urllib.parse import quote
@@ -9,9 +11,11 @@ from psycopg2 import OperationalError
 
 from snowshu.adapters.source_adapters.snowflake_adapter import SnowflakeAdapter
 from snowshu.core.models.credentials import Credentials
+import snowshu.core.models.predicate_strategies as ps
 from snowshu.core.models.materializations import TABLE
 from snowshu.core.models.relation import Relation
-from snowshu.samplings.sample_methods import BernoulliSampleMethod
+from snowshu.samplings.sample_methods import (BernoulliSampleMethod, HashSampleMethod, SystemSampleMethod,
+                                              StratifiedSampleMethod, TimeWindowSampleMethod)
 from tests.common import query_equalize, rand_string
 
 
@@ -159,6 +163,16 @@ LIMIT 1
 """)
 
 
+def test_analyze_wrap_statement_reuses_population_size():
+    sf = SnowflakeAdapter()
+    relation = Relation(database='DB', schema='SCHEMA', name='TABLE', materialization=TABLE, attributes=[])
+    relation.population_size = 1234
+    statement = sf.analyze_wrap_statement("SELECT * FROM some_crazy_query", relation)
+    assert query_equalize(f"{relation.scoped_cte('SNOWSHU_COUNT_POPULATION')} AS ( "
+                          "SELECT 1234 AS population_size )") in query_equalize(statement)
+    assert sf.quoted_dot_notation(relation) not in statement
+
+
 def test_directionally_wrap_statement_directional():
     sf = SnowflakeAdapter()
     sampling = BernoulliSampleMethod(50, units='probability')
@@ -305,3 +319,288 @@ def test_sample_type_to_query_sql():
     qualifier = sample_type.probability
 
     assert sf._sample_type_to_query_sql(sample_type) == f"SAMPLE BERNOULLI ({qualifier})"
+
+
+@mock.patch('snowshu.adapters.source_adapters.snowflake_adapter.SnowflakeAdapter.format_remote_key')
+@mock.patch('snowshu.adapters.source_adapters.snowflake_adapter.SnowflakeAdapter._safe_query')
+def test_predicate_constraint_statement_uses_key_table(mock_query, mock_format_remote_key):
+    """ Given use_key_table=True the predicate reads from the compact key table """
+    sf = SnowflakeAdapter()
+    relation = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    relation.temp_schema = 'TEMP_SCHEMA'
+    mock_format_remote_key.return_value = 'remote_key::VARCHAR'
+    mock_query.return_value = DataFrame(['1, 2, 3'])
+    result = sf.predicate_constraint_statement(relation, False, 'local_key', 'remote_key', True)
+    assert query_equalize(result) == query_equalize(
+        "local_key IN ( SELECT remote_key FROM SNOWSHU.TEMP_SCHEMA.PARENT__remote_key__SNOWSHU_KEYS )")
+
+
+@mock.patch('snowshu.adapters.source_adapters.snowflake_adapter.SnowflakeAdapter.create_table')
+@mock.patch('snowshu.adapters.source_adapters.snowflake_adapter.SnowflakeAdapter.format_remote_key')
+def test_create_key_table(mock_format_remote_key, mock_create_table):
+    sf = SnowflakeAdapter()
+    relation = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    relation.temp_schema = 'TEMP_SCHEMA'
+    mock_format_remote_key.return_value = 'ID::VARCHAR'
+    sf.create_key_table(relation, 'ID')
+    mock_create_table.assert_called_once_with(
+        query="SELECT DISTINCT ID::VARCHAR AS ID FROM SNOWSHU.TEMP_SCHEMA.PARENT ORDER BY 1",
+        name='PARENT__ID__SNOWSHU_KEYS',
+        schema='TEMP_SCHEMA',
+        database='SNOWSHU')
+
+
+@mock.patch('snowshu.adapters.source_adapters.snowflake_adapter.SnowflakeAdapter.format_remote_key')
+@mock.patch('snowshu.adapters.source_adapters.snowflake_adapter.SnowflakeAdapter._safe_query')
+def test_predicate_constraint_statement_inline_strategy(mock_query, mock_format_remote_key):
+    sf = SnowflakeAdapter()
+    relation = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    relation.temp_schema = 'TEMP_SCHEMA'
+    mock_format_remote_key.return_value = 'remote_key::VARCHAR'
+    mock_query.return_value = DataFrame({'snowshu_key': ['1', "o'brien"]})
+    result = sf.predicate_constraint_statement(relation, False, 'local_key', 'remote_key', strategy=ps.INLINE)
+    assert query_equalize(result) == query_equalize("local_key IN ('1', 'o''brien')")
+
+
+@mock.patch('snowshu.adapters.source_adapters.snowflake_adapter.SnowflakeAdapter.format_remote_key')
+def test_predicate_constraint_statement_exists_strategy(mock_format_remote_key):
+    sf = SnowflakeAdapter()
+    relation = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    child = Relation(database='DB', schema='SCHEMA', name='CHILD', materialization=TABLE, attributes=[])
+    relation.temp_schema = 'TEMP_SCHEMA'
+    mock_format_remote_key.return_value = 'remote_key::VARCHAR'
+    result = sf.predicate_constraint_statement(relation, False, 'local_key', 'remote_key',
+                                               strategy=ps.EXISTS, local_relation=child)
+    assert query_equalize(result) == query_equalize("""
+EXISTS ( SELECT 1 FROM SNOWSHU.TEMP_SCHEMA.PARENT AS SNOWSHU_CONSTRAINT_KEYS
+WHERE SNOWSHU_CONSTRAINT_KEYS.remote_key::VARCHAR = CHILD.local_key )""")
+
+
+@mock.patch('snowshu.adapters.source_adapters.snowflake_adapter.SnowflakeAdapter._safe_query')
+def test_key_set_cardinality_empty(mock_query):
+    sf = SnowflakeAdapter()
+    relation = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    relation.temp_schema = 'TEMP_SCHEMA'
+    mock_query.return_value = DataFrame({'cardinality': [0]})
+    with pytest.raises(IndexError, match="Failed to build predicates, the constraint set is empty."):
+        sf.key_set_cardinality(relation, 'remote_key', True)
+    mock_query.assert_called_once_with(
+        "SELECT COUNT(DISTINCT remote_key) AS cardinality FROM SNOWSHU.TEMP_SCHEMA.PARENT__remote_key__SNOWSHU_KEYS")
+
+
+def test_polymorphic_constraint_statement_type_match():
+    sf = SnowflakeAdapter()
+    parent = Relation(database='DB', schema='SCHEMA', name='Child_Records', materialization=TABLE, attributes=[])
+    with mock.patch.object(sf, "predicate_constraint_statement", return_value="id IN ('1')"):
+        assert query_equalize(sf.polymorphic_constraint_statement(parent, False, 'id', 'id', 'type')) == \
+            query_equalize("(id IN ('1') AND LOWER(type) = LOWER('Child_Record') )")
+        assert query_equalize(sf.polymorphic_constraint_statement(parent, False, 'id', 'id', 'type',
+                                                                  exact_type_match=True)) == \
+            query_equalize("(id IN ('1') AND LOWER(type) = LOWER('Child_Record') )")
+        assert query_equalize(sf.polymorphic_constraint_statement(parent, False, 'id', 'id', 'type', 'ChildRecord',
+                                                                  exact_type_match=True)) == \
+            query_equalize("(id IN ('1') AND type = 'ChildRecord' )")
+
+
+def test_polymorphic_constraint_statement_mixed_case_type():
+    sf = SnowflakeAdapter()
+    parent = Relation(database='DB', schema='SCHEMA', name='SALESORDERS', materialization=TABLE, attributes=[])
+    connection = sqlite3.connect(':memory:')
+    connection.execute("CREATE TABLE child (id TEXT, type TEXT)")
+    connection.executemany("INSERT INTO child VALUES (?, ?)",
+                           [('1', 'SalesOrder'), ('1', 'SALESORDER'), ('1', 'Invoice'), ('2', 'SalesOrder')])
+    selected = list()
+    with mock.patch.object(sf, "predicate_constraint_statement", return_value="id IN ('1')"):
+        for exact_type_match in (False, True,):
+            predicate = sf.polymorphic_constraint_statement(parent, False, 'id', 'id', 'type',
+                                                            exact_type_match=exact_type_match)
+            selected.append(sorted(row[0] for row in connection.execute(f"SELECT type FROM child WHERE {predicate}")))
+    # the union branches select the same rows as the OR of the parent constraints
+    assert selected[0] == selected[1] == ['SALESORDER', 'SalesOrder']
+
+
+def test_outliers_union_statement_covers_all_edges():
+    sf = SnowflakeAdapter()
+    subject = Relation(database='DB', schema='SCHEMA', name='SUBJECT', materialization=TABLE, attributes=[])
+    parent = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    child = Relation(database='DB', schema='SCHEMA', name='CHILD', materialization=TABLE, attributes=[])
+    result = sf.outliers_union_statement(subject,
+                                         [(parent, 'parent_id', 'id',), (child, 'id', 'subject_id',)],
+                                         10)
+    assert query_equalize(result) == query_equalize("""
+(SELECT * EXCLUDE (SNOWSHU_OUTLIER_EDGE_0, SNOWSHU_OUTLIER_EDGE_1)
+FROM (
+SELECT SNOWSHU_OUTLIER_SUBJECT.*
+,(SNOWSHU_OUTLIER_SUBJECT.parent_id IS NOT NULL
+AND SNOWSHU_OUTLIER_CONSTRAINT_0.SNOWSHU_OUTLIER_KEY IS NULL) AS SNOWSHU_OUTLIER_EDGE_0
+,(SNOWSHU_OUTLIER_SUBJECT.id IS NOT NULL
+AND SNOWSHU_OUTLIER_CONSTRAINT_1.SNOWSHU_OUTLIER_KEY IS NULL) AS SNOWSHU_OUTLIER_EDGE_1
+FROM DB.SCHEMA.SUBJECT AS SNOWSHU_OUTLIER_SUBJECT
+LEFT JOIN (SELECT DISTINCT id AS SNOWSHU_OUTLIER_KEY FROM DB.SCHEMA.PARENT) AS SNOWSHU_OUTLIER_CONSTRAINT_0
+ON SNOWSHU_OUTLIER_CONSTRAINT_0.SNOWSHU_OUTLIER_KEY = SNOWSHU_OUTLIER_SUBJECT.parent_id
+LEFT JOIN (SELECT DISTINCT subject_id AS SNOWSHU_OUTLIER_KEY FROM DB.SCHEMA.CHILD) AS SNOWSHU_OUTLIER_CONSTRAINT_1
+ON SNOWSHU_OUTLIER_CONSTRAINT_1.SNOWSHU_OUTLIER_KEY = SNOWSHU_OUTLIER_SUBJECT.id
+)
+WHERE SNOWSHU_OUTLIER_EDGE_0 OR SNOWSHU_OUTLIER_EDGE_1
+QUALIFY (SNOWSHU_OUTLIER_EDGE_0 AND ROW_NUMBER() OVER (PARTITION BY SNOWSHU_OUTLIER_EDGE_0
+ORDER BY SNOWSHU_OUTLIER_EDGE_0) <= 10)
+OR (SNOWSHU_OUTLIER_EDGE_1 AND ROW_NUMBER() OVER (PARTITION BY SNOWSHU_OUTLIER_EDGE_1
+ORDER BY SNOWSHU_OUTLIER_EDGE_1) <= 10))""")
+
+
+def test_outliers_union_statement_single_edge():
+    sf = SnowflakeAdapter()
+    subject = Relation(database='DB', schema='SCHEMA', name='SUBJECT', materialization=TABLE, attributes=[])
+    parent = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    result = sf.outliers_union_statement(subject, [(parent, 'parent_id', 'id',)], 10)
+    assert query_equalize(result) == query_equalize("""
+(SELECT * FROM DB.SCHEMA.SUBJECT AS SNOWSHU_OUTLIER_SUBJECT
+WHERE ( SNOWSHU_OUTLIER_SUBJECT.parent_id IS NOT NULL
+AND NOT EXISTS (SELECT 1 FROM DB.SCHEMA.PARENT AS SNOWSHU_OUTLIER_CONSTRAINT
+WHERE SNOWSHU_OUTLIER_CONSTRAINT.id = SNOWSHU_OUTLIER_SUBJECT.parent_id) )
+LIMIT 10)""")
+
+
+def test_component_script_statement():
+    sf = SnowflakeAdapter()
+    parent = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    child = Relation(database='DB', schema='SCHEMA', name='CHILD', materialization=TABLE, attributes=[])
+    for relation in (parent, child,):
+        relation.temp_schema = 'TEMP_SCHEMA'
+    result = sf.component_script_statement(['CREATE TABLE A AS SELECT 1', 'CREATE TABLE B AS SELECT 2'],
+                                           [parent, child])
+    assert query_equalize(result) == query_equalize("""
+EXECUTE IMMEDIATE $$
+BEGIN
+CREATE TABLE A AS SELECT 1;
+CREATE TABLE B AS SELECT 2;
+LET manifest RESULTSET := (
+SELECT 0 AS relation_index, COUNT(*) AS sample_size FROM SNOWSHU.TEMP_SCHEMA.PARENT
+UNION ALL
+SELECT 1 AS relation_index, COUNT(*) AS sample_size FROM SNOWSHU.TEMP_SCHEMA.CHILD
+);
+RETURN TABLE(manifest);
+END;
+$$""")
+
+
+def test_component_script_statement_escapes_dollar_quotes():
+    sf = SnowflakeAdapter()
+    parent = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    parent.temp_schema = 'TEMP_SCHEMA'
+    result = sf.component_script_statement(["CREATE TABLE A AS SELECT 'a$$b' AS c, '\\d' AS d"], [parent])
+    assert query_equalize(result) == query_equalize("""
+EXECUTE IMMEDIATE '
+BEGIN
+CREATE TABLE A AS SELECT ''a$$b'' AS c, ''\\\\d'' AS d;
+LET manifest RESULTSET := (
+SELECT 0 AS relation_index, COUNT(*) AS sample_size FROM SNOWSHU.TEMP_SCHEMA.PARENT
+);
+RETURN TABLE(manifest);
+END;
+'""")
+
+
+def test_component_analyze_statement():
+    sf = SnowflakeAdapter()
+    parent = Relation(database='DB', schema='SCHEMA', name='PARENT', materialization=TABLE, attributes=[])
+    child = Relation(database='DB', schema='SCHEMA', name='CHILD', materialization=TABLE, attributes=[])
+    parent.compiled_query = 'SELECT 1 AS sample_size, 2 AS population_size'
+    child.compiled_query = 'SELECT 3 AS sample_size, 4 AS population_size'
+    result = sf.component_analyze_statement([parent, child])
+    assert query_equalize(result) == query_equalize("""
+SELECT 0 AS relation_index, 'DB.SCHEMA.PARENT' AS dot_notation, sample_size, population_size
+FROM (SELECT 1 AS sample_size, 2 AS population_size)
+UNION ALL
+SELECT 1 AS relation_index, 'DB.SCHEMA.CHILD' AS dot_notation, sample_size, population_size
+FROM (SELECT 3 AS sample_size, 4 AS population_size)""")
+
+
+def test_hash_sample_type_to_query_sql():
+    sf = SnowflakeAdapter()
+    assert sf._sample_type_to_query_sql(HashSampleMethod(0.25, seed=7, key_columns=['ID', 'TYPE'])) == \
+        "WHERE ABS(MOD(HASH(7, HASH(ID, TYPE)), 1000000)) < 250000"
+    assert sf._sample_type_to_query_sql(HashSampleMethod(0.25)) == \
+        "WHERE ABS(MOD(HASH(0, HASH(*)), 1000000)) < 250000"
+
+
+def test_hash_directionally_wrap_statement_samples_by_rows():
+    sf = SnowflakeAdapter()
+    relation = Relation(database='DB', schema='SCHEMA', name='REL', materialization=TABLE, attributes=[])
+    sample_type = HashSampleMethod(0.25, seed=7, key_columns=['ID'], rows=1000)
+    # the population share would sample the already constrained CTE a second time
+    wrapped = sf.directionally_wrap_statement("SELECT 1", relation, sample_type)
+    assert "QUALIFY ROW_NUMBER() OVER (ORDER BY HASH(7, HASH(ID))) <= 1000" in wrapped
+    assert "ABS(MOD(" not in wrapped
+
+
+def test_system_sample_statements():
+    sf = SnowflakeAdapter()
+    relation = Relation(database='DB', schema='SCHEMA', name='REL', materialization=TABLE, attributes=[])
+    sample_type = SystemSampleMethod(0.5, seed=42, rows=1000)
+    assert query_equalize(sf.sample_count_statement(relation, sample_type)) == \
+        query_equalize("SELECT COUNT(*) FROM DB.SCHEMA.REL SAMPLE SYSTEM (0.5) SEED (42)")
+    # block sampling is not possible on the constrained CTE, so it is sampled by rows
+    wrapped = sf.directionally_wrap_statement("SELECT 1", relation, sample_type)
+    assert "SAMPLE BERNOULLI (1000 ROWS)" in wrapped
+
+
+def test_system_sample_statement_tops_up_with_bernoulli():
+    sf = SnowflakeAdapter()
+    relation = Relation(database='DB', schema='SCHEMA', name='REL', materialization=TABLE, attributes=[])
+    sample_type = SystemSampleMethod(0.5, seed=42, rows=1000, top_up_rows=200)
+    assert query_equalize(sf.sample_statement_from_relation(relation, sample_type)) == query_equalize("""
+SELECT * FROM DB.SCHEMA.REL SAMPLE SYSTEM (0.5) SEED (42)
+UNION
+SELECT * FROM DB.SCHEMA.REL SAMPLE BERNOULLI (200 ROWS)
+""")
+
+
+def test_time_window_sample_type_to_query_sql():
+    sf = SnowflakeAdapter()
+    sample_type = TimeWindowSampleMethod('CREATED_AT',
+                                         datetime.datetime(2024, 1, 24, 12),
+                                         datetime.datetime(2024, 1, 31, 12))
+    assert sf._sample_type_to_query_sql(sample_type) == \
+        "WHERE CREATED_AT BETWEEN '2024-01-24 12:00:00' AND '2024-01-31 12:00:00'"
+    sample_type = TimeWindowSampleMethod('CREATED_ON', datetime.date(2024, 1, 1), datetime.date(2024, 1, 31), 0.2)
+    assert sf._sample_type_to_query_sql(sample_type) == \
+        "WHERE CREATED_ON BETWEEN '2024-01-01' AND '2024-01-31' AND UNIFORM(0::FLOAT, 1::FLOAT, RANDOM()) < 0.2"
+
+
+def test_stratified_sample_type_to_query_sql():
+    sf = SnowflakeAdapter()
+    sample_type = StratifiedSampleMethod('REGION', 0.1, 10)
+    assert sf._sample_type_to_query_sql(sample_type) == \
+        "QUALIFY ROW_NUMBER() OVER (PARTITION BY REGION ORDER BY RANDOM()) " \
+        "<= GREATEST(CEIL(COUNT(*) OVER (PARTITION BY REGION) * 0.1), 10)"
+    sample_type = StratifiedSampleMethod('REGION', 0.1, 10, {'US': 9000, "O'HARE": 5, 7: 20, None: 3})
+    assert sf._sample_type_to_query_sql(sample_type) == \
+        "QUALIFY ROW_NUMBER() OVER (PARTITION BY REGION ORDER BY RANDOM()) " \
+        "<= CASE WHEN REGION = 'US' THEN 9000 WHEN REGION = 'O''HARE' THEN 5 WHEN REGION = 7 THEN 20 " \
+        "WHEN REGION IS NULL THEN 3 ELSE 10 END"
+
+
+def test_last_altered_statement():
+    relations = [Relation('DB_ONE', 'SCHEMA_ONE', 'TABLE_ONE', TABLE, []),
+                 Relation('DB_TWO', 'SCHEMA_TWO', 'TABLE_TWO', TABLE, [])]
+    statement = SnowflakeAdapter.last_altered_statement(relations)
+    assert query_equalize(statement) == query_equalize("""
+SELECT 0 AS relation_index, (SELECT MAX(LAST_ALTERED) FROM DB_ONE.INFORMATION_SCHEMA.TABLES
+WHERE TABLE_SCHEMA = 'SCHEMA_ONE' AND TABLE_NAME = 'TABLE_ONE') AS last_altered
+UNION ALL
+SELECT 1 AS relation_index, (SELECT MAX(LAST_ALTERED) FROM DB_TWO.INFORMATION_SCHEMA.TABLES
+WHERE TABLE_SCHEMA = 'SCHEMA_TWO' AND TABLE_NAME = 'TABLE_TWO') AS last_altered
+""")
+
+
+def test_relation_bytes():
+    relations = [Relation('DB_ONE', 'SCHEMA_ONE', 'TABLE_ONE', TABLE, []),
+                 Relation('DB_TWO', 'SCHEMA_TWO', 'TABLE_TWO', TABLE, [])]
+    adapter = SnowflakeAdapter()
+    with mock.patch.object(SnowflakeAdapter, '_safe_query',
+                           return_value=DataFrame(dict(RELATION_INDEX=[1, 0], BYTES=[None, 2048]))) as safe_query:
+        assert adapter.relation_bytes(relations) == [2048, 0]
+    query = safe_query.call_args[0][0]
+    assert query.count("INFORMATION_SCHEMA.TABLES") == 2
+    assert "SELECT 1 AS relation_index" in query
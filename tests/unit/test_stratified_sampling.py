@@ -0,0 +1,47 @@
+from unittest import mock
+import pandas as pd
+import pytest
+
+from snowshu.samplings.samplings import StratifiedSampling
+
+
+@pytest.fixture()
+def mock_args():
+    mock_rel=mock.MagicMock()
+    mock_source_adapter=mock.MagicMock()
+    yield mock_rel,mock_source_adapter
+
+
+def test_stratified_sampling_quotas(mock_args):
+    mock_args[1]._safe_query.return_value=pd.DataFrame(dict(
+        stratum=['US', 'EU', 'APAC'],
+        stratum_size=[90000, 10000, 5]))
+    stratified=StratifiedSampling('REGION', min_rows_per_stratum=10, min_sample_size=10005)
+    stratified.prepare(*mock_args)
+
+    sample_method = stratified.sample_method
+    assert sample_method.column == 'REGION'
+    assert sample_method.probability == pytest.approx(0.1)
+    # the rare stratum is taken whole, the others get their share
+    assert sample_method.quotas == {'US': 9000, 'EU': 1000, 'APAC': 5}
+    assert stratified.size == 10005
+    mock_args[1].histogram_statement.assert_called_once_with(mock_args[0], 'REGION', 1001)
+
+
+def test_stratified_sampling_small_population(mock_args):
+    mock_args[1]._safe_query.return_value=pd.DataFrame(dict(
+        stratum=['A', 'B'],
+        stratum_size=[50, 3]))
+    stratified=StratifiedSampling('TYPE')
+    stratified.prepare(*mock_args)
+    assert stratified.sample_method.probability == 1.0
+    assert stratified.sample_method.quotas == {'A': 50, 'B': 3}
+
+
+def test_stratified_sampling_too_many_strata(mock_args):
+    mock_args[1]._safe_query.return_value=pd.DataFrame(dict(
+        STRATUM=['A', 'B', 'C'],
+        STRATUM_SIZE=[50, 3, 7]))
+    stratified=StratifiedSampling('TYPE', max_strata=2)
+    with pytest.raises(ValueError, match='more than 2 distinct values'):
+        stratified.prepare(*mock_args)
@@ -0,0 +1,37 @@
+import datetime
+from unittest import mock
+import pytest
+
+from snowshu.samplings.samplings import TimeWindowSampling
+
+
+@pytest.fixture()
+def mock_args():
+    mock_rel=mock.MagicMock()
+    mock_source_adapter=mock.MagicMock()
+    yield mock_rel,mock_source_adapter
+
+
+def test_time_window_sampling_bounds(mock_args):
+    latest = datetime.datetime(2024, 1, 31, 12)
+    mock_args[1].scalar_query.side_effect=[latest, 100000]
+    time_window=TimeWindowSampling('CREATED_AT', window_days=7, min_sample_size=20000)
+    time_window.prepare(*mock_args)
+
+    sample_method = time_window.sample_method
+    assert sample_method.column == 'CREATED_AT'
+    assert sample_method.upper_bound == latest
+    assert sample_method.lower_bound == datetime.datetime(2024, 1, 24, 12)
+    assert sample_method.probability == 0.2
+    # the window population is counted without sampling
+    window_count = mock_args[1].sample_count_statement.call_args[0][1]
+    assert window_count.probability is None
+    assert window_count.lower_bound == sample_method.lower_bound
+
+
+def test_time_window_sampling_small_window(mock_args):
+    mock_args[1].scalar_query.side_effect=[datetime.date(2024, 1, 31), 10]
+    time_window=TimeWindowSampling('CREATED_ON')
+    time_window.prepare(*mock_args)
+    assert time_window.sample_method.lower_bound == datetime.date(2024, 1, 1)
+    assert time_window.sample_method.probability == 1.0